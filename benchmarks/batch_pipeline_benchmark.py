@@ -0,0 +1,147 @@
+"""
+Peak memory and time-to-first-order of the batch Lambda on a synthetic backlog.
+
+Compares the old collect-everything flow (fetch all pages, build every Order, then enqueue) with the
+streaming process_batch pipeline (page -> filter -> build Order -> enqueue). ShipStation and SQS are
+replaced by in-process fakes, every page download takes --page-latency-ms.
+
+    python benchmarks/batch_pipeline_benchmark.py --orders 10000 --page-latency-ms 150
+"""
+
+import sys
+import os
+import copy
+import time
+import tracemalloc
+
+# The batch Lambda is imported as a package (sp_batch_lambda.main) and uses flat imports internally
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sp_batch_lambda')))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+# The sample order is a CBS order, which process_batch would otherwise not enqueue
+os.environ.setdefault('ACTIONABLE_TRADING_PARTNERS', 'Fanatics,Amazon,CBS')
+
+import sp_batch_lambda.functions as functions
+import sp_batch_lambda.main as batch_main
+
+
+
+class FakeResponse:
+    def __init__(self, build_json):
+        self.build_json = build_json
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        # Orders are materialized when the page is decoded, like response.json() does
+        return self.build_json()
+
+
+
+class FakeShipStation:
+    """
+    Serves a synthetic awaiting_shipment backlog built from the sample order in functions.temp_order().
+    """
+
+    def __init__(self, total_orders, page_latency):
+        self.total_orders = total_orders
+        self.page_latency = page_latency
+        self.template = functions.temp_order()[0]
+
+    def fetch_orders(self, parameters):
+        time.sleep(self.page_latency)
+        page, page_size = parameters['page'], parameters['page_size']
+        pages = max(1, -(-self.total_orders // page_size))
+        first = (page - 1) * page_size
+        count = max(0, min(page_size, self.total_orders - first))
+
+        def build_json():
+            orders = []
+            for order_id in range(first, first + count):
+                order = copy.deepcopy(self.template)
+                order['orderId'] = order_id
+                order['orderKey'] = f"BENCH-{order_id}"
+                orders.append(order)
+            return {"orders": orders, "total": self.total_orders, "page": page, "pages": pages}
+
+        return FakeResponse(build_json)
+
+
+
+class FakeSQS:
+    def __init__(self):
+        self.sent = 0
+        self.first_sent_at = None
+
+    def get_queue_url(self, QueueName):
+        return {'QueueUrl': f"https://sqs.local/{QueueName}"}
+
+    # Messages are only counted, not kept, so the queue doesn't show up in the peak memory
+    def send_message(self, **kwargs):
+        if self.first_sent_at is None:
+            self.first_sent_at = time.perf_counter()
+        self.sent += 1
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        if self.first_sent_at is None:
+            self.first_sent_at = time.perf_counter()
+        self.sent += len(Entries)
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+
+def collect_all(ss_client, sqs):
+    # The flow before the streaming pipeline: everything in memory before the first enqueue
+    orders = functions.fetch_orders_with_retry(ss_client)
+    order_objects = [batch_main.build_order(order) for order in orders if not batch_main.is_already_processed(order)]
+    for order_object in order_objects:
+        functions.send_order_to_queue(order_object, sqs)
+
+
+def streaming(ss_client, sqs):
+    functions.connect_to_api = lambda: ss_client
+    batch_main.sqs_client = sqs
+    batch_main.process_batch(enqueue=True)
+
+
+def measure(name, run, total_orders, page_latency):
+    ss_client, sqs = FakeShipStation(total_orders, page_latency), FakeSQS()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    run(ss_client, sqs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "pipeline": name,
+        "orders_sent": sqs.sent,
+        "time_to_first_order_s": round(sqs.first_sent_at - start, 3),
+        "total_s": round(elapsed, 3),
+        "peak_memory_mb": round(peak / 2 ** 20, 1),
+    }
+
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--page-latency-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    results = []
+    for name, run in [("collect all", collect_all), ("streaming", streaming)]:
+        # The pipeline prints a line per order, keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = measure(name, run, args.orders, args.page_latency_ms / 1000)
+        results.append(result)
+
+    for result in results:
+        print(result)
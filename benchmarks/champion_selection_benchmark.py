@@ -0,0 +1,313 @@
+"""
+Champion rate selection: the per-carrier selection of the baseline (commit 2393969: get_ups_best_rate,
+get_usps_best_rate, get_fedex_best_rate and get_champion_rate, read from git and run unchanged) against the
+current lookups (get_ups_candidates, get_usps_candidates, get_fedex_candidates) decided in one pass over a
+rate_candidates.CandidateTable.
+
+Both run on the same fixtures: random UPS Time in Transit, USPS SDCGetLocations and FedEx rate quote
+responses (served in place of the API calls) and ShipStation rates, deliver-by dates, residential and
+single-stream flags. UPS orders have rates on both accounts. The benchmark first checks that both give
+every order the same outcome, the winning rate and SmartPost date or the type of the exception that failed
+its rating, then times both per order. The two baseline failures listed in FIXED_FAILURES are counted
+apart: the single pass rates those orders, or fails with ValueError when no carrier has an on-time rate.
+
+    python benchmarks/champion_selection_benchmark.py --orders 2000 --iterations 5
+"""
+
+import sys
+import os
+import copy
+import random
+import subprocess
+import timeit
+import traceback
+import types
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(REPO, 'main_lambda'))
+
+import functions
+import ups_api
+import usps_api
+import fedex_api
+import rate_candidates
+from rate_candidates import CandidateTable, DELIVER_BY_FORMAT
+from rate_table import RateTable
+from transit_cache import transit_cache
+
+# Commit of the per-carrier selection
+BASELINE = "2393969"
+
+# Baseline failures the single pass rates instead: the USPS $0.35 rule (min(key='deliveryDate') on options
+# keyed 'delivery_date') and UPS without an on-time rate (indexed into an empty list), other carriers can win
+FIXED_FAILURES = {("error", "KeyError", "compare_prices"), ("error", "TypeError", "filter_for_single_stream")}
+
+TODAY = datetime(2024, 6, 3)
+
+
+
+def load_baseline(module_name):
+    """
+    Imports a main Lambda module as it was at the baseline commit.
+    """
+    path = f"{BASELINE}:main_lambda/{module_name}.py"
+    source = subprocess.run(["git", "-C", REPO, "show", path], capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType(f"baseline_{module_name}")
+    module.__file__ = path
+    exec(compile(source, path, "exec"), module.__dict__)
+    return module
+
+
+baseline_functions = load_baseline("functions")
+baseline_ups = load_baseline("ups_api")
+baseline_usps = load_baseline("usps_api")
+baseline_fedex = load_baseline("fedex_api")
+
+# API responses of the order being rated, served instead of calling the carriers
+responses = {}
+
+for module in (baseline_ups, ups_api):
+    module.get_delivery_times = lambda order, deadline=None: copy.deepcopy(responses["ups"])
+for module in (baseline_usps, usps_api):
+    module.get_usps_response = lambda ship_date, from_zip, dest_zip, deadline=None: copy.deepcopy(responses["usps"])
+for module in (baseline_fedex, fedex_api):
+    module.get_fedex_response = lambda order, deadline=None: copy.deepcopy(responses["fedex"])
+
+# Every order is looked up, the transit cache (not part of the baseline) is left out of the comparison
+transit_cache.get_or_fetch = lambda carrier, key, fetch: fetch()
+
+
+
+def day(days, hour=0):
+    return TODAY + timedelta(days=days, hours=hour)
+
+
+def price(rng, base):
+    return round(base + rng.uniform(-2, 2), 2)
+
+
+def ups_fixture(rng, residential):
+    services, rates = [], {"ups": [], "ups_walleted": []}
+    for level, description, ss_name, days, base in [
+        ("GND", "UPS Ground", "UPS® Ground", 5, 9),
+        ("3DS", "UPS 3 Day Select®", "UPS 3 Day Select®", 3, 14),
+        ("2DA", "UPS 2nd Day Air®", "UPS 2nd Day Air®", 2, 19),
+        ("1DA", "UPS Next Day Air®", "UPS Next Day Air®", 1, 35),
+    ]:
+        delivery = day(days + rng.randint(0, 1))
+        services.append({
+            "serviceLevel": level, "serviceLevelDescription": description, "businessTransitDays": days,
+            "deliveryDate": delivery.strftime("%Y-%m-%d"), "deliveryDayOfWeek": delivery.strftime("%a").upper(),
+        })
+        for carrier in rates:
+            if rng.random() < 0.8:
+                rates[carrier].append((ss_name, price(rng, base)))
+    for carrier in rates:
+        if residential:
+            rates[carrier].append(("UPS Ground Saver", price(rng, 7)))
+        if not rates[carrier]:
+            rates[carrier].append(("UPS® Ground", price(rng, 9)))
+    return {"emsResponse": {"services": services}}, rates
+
+
+def usps_fixture(rng):
+    express, priority, ground = day(rng.randint(1, 2)), day(rng.randint(2, 3)), day(rng.randint(3, 6))
+    response = {"SDCGetLocationsResponse": {
+        "Expedited": {"Commitment": [
+            {"MailClass": "1", "CommitmentName": "2-Day", "CommitmentSeq": "A0218", "Location": {"SDD": express.strftime("%Y-%m-%d")}},
+            {"MailClass": "2", "CommitmentName": "2-Day", "CommitmentSeq": "C0200", "Location": [{"SDD": priority.strftime("%Y-%m-%d")}]},
+        ]},
+        "NonExpedited": [
+            {"MailClass": "3", "NonExpeditedDestType": "1", "SvcStdDays": "4", "SchedDlvryDate": ground.strftime("%Y-%m-%d")},
+        ],
+    }}
+    # Same MailClass listed twice, the later date first: only an on-time occurrence gives the date
+    if rng.random() < 0.3:
+        late = ground + timedelta(days=rng.randint(1, 3))
+        response["SDCGetLocationsResponse"]["NonExpedited"].insert(
+            0, {"MailClass": "3", "NonExpeditedDestType": "1", "SvcStdDays": "6", "SchedDlvryDate": late.strftime("%Y-%m-%d")}
+        )
+    rates = [
+        (service, round(base + rng.uniform(-0.5, 0.5), 2))
+        for service, base in [("USPS Ground Advantage - Package", 7), ("USPS Priority Mail - Package", 7.2), ("USPS Priority Mail Express - Package", 30)]
+        if rng.random() < 0.9
+    ]
+    return response, rates
+
+
+def fedex_fixture(rng, residential):
+    details, rates = [], []
+    ground_name = "FedEx Home Delivery®" if residential else "FedEx Ground®"
+    for api_name, ss_name, days, base in [
+        ("FedEx Ground®", ground_name, 4, 9),
+        ("FedEx SmartPost®", "FedEx SmartPost parcel select", 6, 7),
+        ("FedEx 2Day®", "FedEx 2Day®", 2, 18),
+        ("FedEx Standard Overnight®", "FedEx Standard Overnight®", 1, 32),
+    ]:
+        delivery = day(days + rng.randint(0, 1), 20)
+        details.append({
+            "serviceName": api_name,
+            "commit": {"dateDetail": {"dayFormat": delivery.strftime("%Y-%m-%dT%H:%M:%S")}},
+            "ratedShipmentDetails": [{"totalNetFedExCharge": base}],
+        })
+        if rng.random() < 0.9:
+            rates.append((ss_name, price(rng, base)))
+    return {"output": {"rateReplyDetails": details}}, rates
+
+
+def build_fixtures(count, seed=1):
+    rng = random.Random(seed)
+    fixtures = []
+    for number in range(count):
+        residential = rng.random() < 0.7
+        rates, fixture_responses = {}, {}
+        fixture_responses["ups"], ups_rates = ups_fixture(rng, residential)
+        fixture_responses["usps"], usps_rates = usps_fixture(rng)
+        fixture_responses["fedex"], fedex_rates = fedex_fixture(rng, residential)
+        if rng.random() < 0.9:
+            rates.update(ups_rates)
+        if usps_rates and rng.random() < 0.85:
+            rates["stamps_com"] = usps_rates
+        if fedex_rates and rng.random() < 0.85:
+            rates["fedex"] = fedex_rates
+
+        fixtures.append({
+            "order_key": f"BENCH-{number}",
+            "deliver_by_date": day(rng.randint(1, 7), rng.choice([0, 12, 18])).strftime(DELIVER_BY_FORMAT),
+            "is_single_stream": rng.random() < 0.2,
+            "residential": residential,
+            "rates": rates,
+            "responses": fixture_responses,
+        })
+    return fixtures
+
+
+
+def make_order(fixture, rates):
+    return SimpleNamespace(
+        order_key=fixture["order_key"],
+        deliver_by_date=fixture["deliver_by_date"],
+        is_single_stream=fixture["is_single_stream"],
+        rates=rates,
+        list_of_carriers=list(fixture["rates"]),
+        winning_rate=None,
+        Customer=SimpleNamespace(ship_to=SimpleNamespace(
+            street1="5629 N CROW DR", city="ELOY", state="AZ", postal_code="85131-3186", country="US",
+            residential=fixture["residential"],
+        )),
+        Shipment=SimpleNamespace(
+            warehouse=SimpleNamespace(city="Sarasota", state="FL", postal_code="34243", country="US"),
+            ship_date=TODAY.strftime("%Y-%m-%d"), weight={"value": 20.0, "units": "ounces"}, smart_post_date=None,
+        ),
+    )
+
+
+def outcome(rate_function, fixture):
+    """
+    Returns ('rate', (winning rate, SmartPost date)) or ('error', exception type, function that raised it).
+    """
+    responses.update(fixture["responses"])
+    try:
+        return ("rate", rate_function(fixture))
+    except Exception as e:
+        # Innermost named function, compare_prices for the KeyError raised in its min(key=lambda ...)
+        function_names = [frame.name for frame in traceback.extract_tb(e.__traceback__) if frame.name != "<lambda>"]
+        return ("error", type(e).__name__, function_names[-1])
+
+
+
+def baseline_winning_rate(fixture):
+    # main.set_winning_rate at the baseline, carriers looked up one after another
+    order = make_order(fixture, copy.deepcopy(fixture["rates"]))
+    ups_best = usps_best = fedex_best = None
+    if "ups" in order.list_of_carriers or "ups_walleted" in order.list_of_carriers:
+        ups_best = baseline_ups.get_ups_best_rate(order)
+    if "stamps_com" in order.list_of_carriers:
+        usps_best = baseline_usps.get_usps_best_rate(order)
+    if "fedex" in order.list_of_carriers:
+        fedex_best = baseline_fedex.get_fedex_best_rate(order)
+    baseline_functions.get_champion_rate(order, ups_best=ups_best, fedex_best=fedex_best, usps_best=usps_best)
+    return order.winning_rate, order.Shipment.smart_post_date
+
+
+def lookup_candidates(fixture):
+    # main.get_carrier_lookups and set_winning_rate, without the retry list (the fixtures always answer)
+    order = make_order(fixture, RateTable.from_dict(fixture["rates"]))
+    lookups = []
+    if "ups" in order.list_of_carriers or "ups_walleted" in order.list_of_carriers:
+        lookups.append((ups_api.get_ups_candidates, None))
+    if "stamps_com" in order.list_of_carriers:
+        lookups.append((usps_api.get_usps_candidates, None))
+    if "fedex" in order.list_of_carriers:
+        lookups.append((fedex_api.get_fedex_candidates, fedex_api.set_smart_post_date))
+
+    candidates = []
+    for lookup, apply_result in lookups:
+        carrier_candidates = lookup(order)
+        if carrier_candidates is not None and apply_result is not None:
+            apply_result(order, carrier_candidates)
+        candidates.extend(carrier_candidates or [])
+    return order, candidates
+
+
+def single_pass_winning_rate(fixture):
+    order, candidates = lookup_candidates(fixture)
+    table = CandidateTable()
+    table.extend(table.add_order(order), candidates)
+    functions.get_champion_rate(order, table)
+    return order.winning_rate, order.Shipment.smart_post_date
+
+
+
+def run(order_count, iterations):
+    fixtures = build_fixtures(order_count)
+
+    baseline = [outcome(baseline_winning_rate, fixture) for fixture in fixtures]
+    single_pass = [outcome(single_pass_winning_rate, fixture) for fixture in fixtures]
+
+    # Same winning rate, or the same exception type, unless the baseline failure is fixed
+    fixed = [i for i in range(len(fixtures)) if baseline[i][0] == "error" and baseline[i] in FIXED_FAILURES]
+    mismatches = [i for i in range(len(fixtures)) if baseline[i][:2] != single_pass[i][:2] and i not in fixed]
+    assert not mismatches, f"selections disagree on orders {mismatches[:5]}: {[(baseline[i], single_pass[i]) for i in mismatches[:2]]}"
+
+    # Batch mode decides the rated orders of the whole run in one pass
+    rated = [i for i in range(len(fixtures)) if baseline[i][0] == "rate"]
+    batch = CandidateTable()
+    for i in rated:
+        responses.update(fixtures[i]["responses"])
+        order, candidates = lookup_candidates(fixtures[i])
+        batch.extend(batch.add_order(order), candidates)
+    batch_mismatches = [i for i, rate in zip(rated, rate_candidates.select_winning_rates(batch)) if baseline[i][1][0] != rate]
+    assert not batch_mismatches, f"batch selection disagrees on orders {batch_mismatches[:5]}"
+
+    results = {
+        "orders": len(fixtures),
+        "rated": len(rated),
+        "failed": dict(Counter(f"{result[1]} in {result[2]}" for result in baseline if result[0] == "error")),
+        "fixed": dict(Counter(f"{baseline[i][1]} in {baseline[i][2]} -> {'rated' if single_pass[i][0] == 'rate' else single_pass[i][1]}" for i in fixed)),
+        "mismatches": len(mismatches),
+    }
+    for name, rate_function in [("per_carrier", baseline_winning_rate), ("single_pass", single_pass_winning_rate)]:
+        seconds = timeit.timeit(lambda: [outcome(rate_function, fixture) for fixture in fixtures], number=iterations) / iterations
+        results[f"{name}_us_per_order"] = round(seconds / len(fixtures) * 1e6, 2)
+    return results
+
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    # Both selections print every lookup, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run(args.orders, args.iterations)
+    print(results)
@@ -0,0 +1,130 @@
+"""
+Consumer throughput of SporticultureOrderQueue.fifo per MessageGroupId strategy and shard count.
+
+Orders are enqueued into the in-process LocalSQS, which serves FIFO groups like SQS does (a group with
+messages in flight is not handed out again until they are deleted). --consumers threads stand in for
+concurrent main Lambda invocations: each receives up to 10 messages, spends --order-ms on every order
+and deletes it. The test also checks that the orders of every group were processed in the order they
+were sent.
+
+    python benchmarks/message_group_load_benchmark.py --orders 1000 --consumers 16 --order-ms 20
+"""
+
+import sys
+import os
+import time
+import threading
+
+# The batch Lambda is imported as a package (sp_batch_lambda.main) and uses flat imports internally
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sp_batch_lambda')))
+os.environ['LOCAL_SQS'] = 'true'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import sp_batch_lambda.functions as functions
+import sp_batch_lambda.main as batch_main
+from sp_batch_lambda.local_sqs import LocalSQS
+from sp_batch_lambda.order_queue import OrderQueueBatcher
+from sp_batch_lambda.message_groups import get_message_group_id
+
+
+
+def build_orders(count):
+    template = functions.temp_order()[0]
+    warehouse_ids = [590152, 791225]
+    orders = []
+    for order_id in range(count):
+        order_data_raw = dict(
+            template,
+            orderId=order_id,
+            orderKey=f"BENCH-{order_id}",
+            # Every tenth order is expedited, for the priority lane of the partner strategy
+            requestedShippingService="Expedited" if order_id % 10 == 0 else template.get('requestedShippingService'),
+            advancedOptions=dict(template['advancedOptions'], warehouseId=warehouse_ids[order_id % 2]),
+        )
+        orders.append(batch_main.build_order(order_data_raw))
+    return orders
+
+
+def enqueue(orders, sqs, strategy, shards):
+    with OrderQueueBatcher(sqs, functions.QUEUE_NAME) as batcher:
+        for order in orders:
+            message = functions.build_queue_message(order)
+            message['MessageGroupId'] = get_message_group_id(order, strategy, shards)
+            batcher.add(str(order.order_id), message)
+    return batcher.sent
+
+
+def consume(sqs, queue_url, total, consumers, order_seconds):
+    processed = []  # (group id, order id) in processing order
+    lock = threading.Lock()
+
+    def consumer():
+        while True:
+            with lock:
+                if len(processed) >= total:
+                    return
+            messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get('Messages', [])
+            if not messages:
+                time.sleep(0.002)  # Nothing available, like an empty long poll
+                continue
+            for message in messages:
+                time.sleep(order_seconds)  # Rating the order
+                with lock:
+                    # The deduplication id is "<order id>-<rating fingerprint>"
+                    order_id = message['Attributes']['MessageDeduplicationId'].split('-')[0]
+                    processed.append((message['Attributes']['MessageGroupId'], order_id))
+                sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'])
+
+    threads = [threading.Thread(target=consumer) for _ in range(consumers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return processed, time.perf_counter() - start
+
+
+def run(orders, strategy, shards, consumers, order_seconds):
+    sqs = LocalSQS()
+    queue_url = sqs.get_queue_url(QueueName=functions.QUEUE_NAME)['QueueUrl']
+    sent = enqueue(orders, sqs, strategy, shards)
+    processed, elapsed = consume(sqs, queue_url, sent, consumers, order_seconds)
+
+    # Within a group, orders must come out in the order they were sent
+    sent_order = {}
+    for order in orders:
+        sent_order.setdefault(get_message_group_id(order, strategy, shards), []).append(str(order.order_id))
+    processed_order = {}
+    for group_id, order_id in processed:
+        processed_order.setdefault(group_id, []).append(order_id)
+    assert processed_order == sent_order, f"{strategy}/{shards}: FIFO order broken within a group"
+
+    return {
+        "strategy": strategy,
+        "shards": shards,
+        "groups": len(sent_order),
+        "orders": len(processed),
+        "seconds": round(elapsed, 2),
+        "orders_per_second": round(len(processed) / elapsed, 1),
+    }
+
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--consumers", type=int, default=16)
+    parser.add_argument("--order-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        orders = build_orders(args.orders)
+
+    scenarios = [("single", 1)] + [("order_hash", shards) for shards in (2, 4, 8, 16)] + [("warehouse", 4), ("partner", 4)]
+    for strategy, shards in scenarios:
+        print(run(orders, strategy, shards, args.consumers, args.order_ms / 1000))
@@ -0,0 +1,135 @@
+"""
+SKU rule lookups: the linear prefix scans the main Lambda used (get_warehouse_id, set_product_dimensions,
+the single-stream check of Order.__post_init__ and the assembly check of set_ship_date) against one walk
+of the compiled sku_index trie.
+
+The catalog is every prefix of the sku_index tables with --variants suffixes each, plus SKUs no rule
+matches. The benchmark first checks that both give the same answers, and the box of every SKU against the
+baseline set_product_dimensions (commit 2393969, read from git), then times all four lookups per SKU.
+
+    python benchmarks/sku_index_benchmark.py --variants 20 --iterations 20
+"""
+
+import sys
+import os
+import random
+import subprocess
+import timeit
+import types
+from types import SimpleNamespace
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(REPO, 'main_lambda'))
+
+import sku_index
+from sku_index import WAREHOUSE_ID_PREFIXES, FLAG_SIZE_PREFIXES, PRODUCT_SIZES, SINGLE_STREAM_PREFIXES
+
+# Commit of the linear scans
+BASELINE = "2393969"
+
+
+
+def load_baseline(module_name):
+    """
+    Imports a main Lambda module as it was at the baseline commit.
+    """
+    path = f"{BASELINE}:main_lambda/{module_name}.py"
+    source = subprocess.run(["git", "-C", REPO, "show", path], capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType(f"baseline_{module_name}")
+    module.__file__ = path
+    exec(compile(source, path, "exec"), module.__dict__)
+    return module
+
+
+baseline_functions = load_baseline("functions")
+
+
+
+def linear_warehouse(sku):
+    # get_warehouse_id: first key of the dict (ordered longest to shortest by hand) the SKU starts with
+    for key, warehouse_id in WAREHOUSE_ID_PREFIXES.items():
+        if sku.startswith(key):
+            return True, warehouse_id
+    return False, None
+
+
+def linear_box(sku):
+    # set_product_dimensions: flag prefixes only, its scan of the product size keys always ended in return False
+    for key, size in FLAG_SIZE_PREFIXES.items():
+        if sku.startswith(key):
+            return PRODUCT_SIZES[size]
+    return None
+
+
+def baseline_box(sku):
+    # set_product_dimensions of the baseline commit, run unchanged on an order without dimensions
+    order = SimpleNamespace(items=[SimpleNamespace(sku=sku)], Shipment=SimpleNamespace(dimensions=None, weight=None))
+    if not baseline_functions.set_product_dimensions(order):
+        return None
+    dimensions = order.Shipment.dimensions
+    return {"length": dimensions["length"], "width": dimensions["width"], "height": dimensions["height"], "weight": order.Shipment.weight["value"]}
+
+
+def linear_lookup(sku):
+    has_warehouse, warehouse_id = linear_warehouse(sku)
+    return sku_index.SkuMatch(
+        has_warehouse=has_warehouse,
+        warehouse_id=warehouse_id,
+        box=linear_box(sku),
+        is_single_stream=sku.startswith(SINGLE_STREAM_PREFIXES),
+        is_assembly=sku[0].isdigit(),
+    )
+
+
+def build_catalog(variants, seed=1):
+    rng = random.Random(seed)
+    teams = ["NFL-DAL", "NFL-GB", "MLB-NYY", "NBA-LAL", "NCAA-OSU", "NHL-BOS", "MLS-ATL"]
+    prefixes = sorted(set(WAREHOUSE_ID_PREFIXES) | set(FLAG_SIZE_PREFIXES) | set(PRODUCT_SIZES))
+    catalog = []
+    for prefix in prefixes:
+        for _ in range(variants):
+            catalog.append(f"{prefix}-{rng.choice(teams)}-{rng.randint(1, 999):03d}")
+    # SKUs no rule matches
+    for _ in range(variants * 5):
+        catalog.append(f"XQ{rng.randint(1000, 9999)}-{rng.choice(teams)}")
+    return catalog
+
+
+def run(variants, iterations):
+    catalog = build_catalog(variants)
+    index = sku_index.build_sku_index()
+
+    mismatches = [sku for sku in catalog if index.lookup(sku) != linear_lookup(sku)]
+    assert not mismatches, f"trie and linear scans disagree on {mismatches[:5]}"
+    box_mismatches = [sku for sku in catalog if index.lookup(sku).box != baseline_box(sku)]
+    assert not box_mismatches, f"trie and the baseline set_product_dimensions disagree on {box_mismatches[:5]}"
+
+    def linear():
+        for sku in catalog:
+            linear_lookup(sku)
+
+    def trie():
+        for sku in catalog:
+            index.lookup(sku)
+
+    def cached():
+        for sku in catalog:
+            sku_index.lookup_sku(sku)
+
+    results = {"skus": len(catalog), "mismatches": len(mismatches)}
+    for name, function in [("linear", linear), ("trie", trie), ("trie_cached", cached)]:
+        seconds = timeit.timeit(function, number=iterations) / iterations
+        results[f"{name}_us_per_sku"] = round(seconds / len(catalog) * 1e6, 2)
+    return results
+
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    print(run(args.variants, args.iterations))
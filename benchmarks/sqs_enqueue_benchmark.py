@@ -0,0 +1,78 @@
+"""
+Enqueue throughput of the batch Lambda: one send_message per order (plus a get_queue_url every time)
+against OrderQueueBatcher's SendMessageBatch, measured offline on the in-process LocalSQS.
+
+Every SQS call takes --latency-ms, --failure-rate makes that share of batch entries fail so the
+retry of failed entries is exercised as well.
+
+    python benchmarks/sqs_enqueue_benchmark.py --orders 2000 --latency-ms 20 --failure-rate 0.05
+"""
+
+import sys
+import os
+import time
+
+# The batch Lambda is imported as a package (sp_batch_lambda.main) and uses flat imports internally
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sp_batch_lambda')))
+os.environ['LOCAL_SQS'] = 'true'
+
+import sp_batch_lambda.functions as functions
+import sp_batch_lambda.main as batch_main
+from sp_batch_lambda.local_sqs import LocalSQS
+from sp_batch_lambda.order_queue import OrderQueueBatcher
+
+
+
+def build_orders(count):
+    template = functions.temp_order()[0]
+    orders = []
+    for order_id in range(count):
+        order_data_raw = dict(template, orderId=order_id, orderKey=f"BENCH-{order_id}")
+        orders.append(batch_main.build_order(order_data_raw))
+    return orders
+
+
+def queued_messages(sqs):
+    return sum(len(queue) for queue in sqs.queues.values())
+
+
+def one_by_one(orders, sqs):
+    for order in orders:
+        functions.send_order_to_queue(order, sqs)
+
+
+def batched(orders, sqs):
+    with OrderQueueBatcher(sqs, functions.QUEUE_NAME, delay=0.01) as batcher:
+        for order in orders:
+            batcher.add(str(order.order_id), functions.build_queue_message(order))
+
+
+def measure(name, run, orders, sqs):
+    start = time.perf_counter()
+    run(orders, sqs)
+    elapsed = time.perf_counter() - start
+    return {
+        "enqueue": name,
+        "messages_queued": queued_messages(sqs),
+        "api_calls": sum(sqs.calls.values()),
+        "seconds": round(elapsed, 2),
+        "messages_per_second": round(len(orders) / elapsed, 1),
+    }
+
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    orders = build_orders(args.orders)
+    latency = args.latency_ms / 1000
+
+    print(measure("send_message", one_by_one, orders, LocalSQS(latency=latency)))
+    print(measure("SendMessageBatch", batched, orders, LocalSQS(latency=latency, failure_rate=args.failure_rate, seed=1)))
@@ -0,0 +1,117 @@
+"""
+Per-call latency of USPS SDCGetLocations lookups: a new connection per call (the old bare
+requests.post) against the pooled keep-alive usps_api.usps_session.
+
+Runs offline against a local stand-in for secure.shippingapis.com. Every new connection is delayed by
+--handshake-ms to model the TCP + TLS handshake a fresh connection pays in production.
+
+    python benchmarks/usps_session_benchmark.py --calls 200 --handshake-ms 60
+"""
+
+import sys
+import os
+import time
+import json
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the main_lambda directory to the Python path, the Lambda modules use flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'main_lambda')))
+
+SAMPLE_RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<SDCGetLocationsResponse>
+    <Expedited><Commitment><MailClass>1</MailClass><CommitmentName>1-Day</CommitmentName><CommitmentSeq>A0218</CommitmentSeq>
+    <Location><SDD>2026-10-19</SDD></Location></Commitment></Expedited>
+    <NonExpedited><MailClass>6</MailClass><NonExpeditedDestType>1</NonExpeditedDestType><SvcStdDays>3</SvcStdDays>
+    <SchedDlvryDate>2026-10-21</SchedDlvryDate></NonExpedited>
+</SDCGetLocationsResponse>"""
+
+
+
+class StubUSPSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real endpoint
+    handshake_seconds = 0.0
+
+    def setup(self):
+        # Runs once per connection, stands in for the TCP + TLS handshake
+        time.sleep(self.handshake_seconds)
+        super().setup()
+
+    def do_POST(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(SAMPLE_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(SAMPLE_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+
+def time_calls(send, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = send()
+        response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+
+def summarize(name, timings):
+    return {
+        "client": name,
+        "calls": len(timings),
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(sorted(timings)[int(len(timings) * 0.95) - 1], 2),
+    }
+
+
+
+def run(calls=100, handshake_ms=60):
+    StubUSPSHandler.handshake_seconds = handshake_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubUSPSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ['USPS_API_URL'] = f"http://127.0.0.1:{server.server_port}/shippingapi.dll"
+    os.environ.setdefault('SECRET_USPSAPICREDENTIALS', json.dumps({"username": "bench", "password": "bench"}))
+
+    import requests
+    import usps_api
+
+    url = f"{usps_api.USPS_API_URL}?API=SDCGetLocations&XML=<SDCGetLocationsRequest/>"
+    timeout = (usps_api.USPS_CONNECT_TIMEOUT, usps_api.USPS_READ_TIMEOUT)
+
+    results = [
+        summarize("bare requests.post", time_calls(lambda: requests.post(url, timeout=timeout), calls)),
+        summarize("pooled usps_session", time_calls(lambda: usps_api.usps_session.post(url, timeout=timeout), calls)),
+    ]
+
+    # End to end, including the XML parse, to make sure the pooled session is what get_usps_response uses
+    start = time.perf_counter()
+    for _ in range(calls):
+        usps_api.get_usps_response("2026-10-16", "10001", "90210")
+    end_to_end_ms = (time.perf_counter() - start) * 1000 / calls
+
+    server.shutdown()
+    return results, round(end_to_end_ms, 2)
+
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--handshake-ms", type=float, default=60)
+    args = parser.parse_args()
+
+    results, end_to_end_ms = run(args.calls, args.handshake_ms)
+    for result in results:
+        print(result)
+    print(f"get_usps_response end to end: {end_to_end_ms} ms per call")
+    print(f"Saved per call: {round(results[0]['mean_ms'] - results[1]['mean_ms'], 2)} ms")
@@ -0,0 +1,81 @@
+"""
+Message size and encode / decode time of the order wire formats.
+
+legacy:  json.dumps(order.as_dict()) on the producer, json.loads + the json round trip in main.main +
+         init_object.init_order on the consumer
+compact: json.dumps(wire_encoder.encode_order(order)) on the producer, json.loads +
+         wire_decoder.decode_order on the consumer
+
+    python benchmarks/wire_format_benchmark.py --iterations 2000
+"""
+
+import sys
+import os
+import json
+import timeit
+from dataclasses import asdict
+
+# The batch Lambda is imported as a package, main_lambda uses flat imports. main_lambda comes first on
+# the path so modules both Lambdas have (classes, shipstation_api...) resolve to the consumer's copy
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'main_lambda')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sp_batch_lambda')))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import sp_batch_lambda.functions as batch_functions
+import sp_batch_lambda.main as batch_main
+from sp_batch_lambda.wire_encoder import encode_order
+import wire_decoder
+from init_object import init_order
+
+
+
+def legacy_decode(body):
+    data = json.loads(body)
+    order_data = json.loads(json.dumps(data, default=lambda o: o.__dict__))
+    return init_order(order_data, None, None, None)
+
+
+def compact_decode(body):
+    return wire_decoder.decode_order(json.loads(body))
+
+
+def run(iterations):
+    results = []
+    for order_data_raw in batch_functions.temp_order() + batch_functions.temp_sporticulture_order():
+        order = batch_main.build_order(order_data_raw)
+
+        legacy_body = json.dumps(order.as_dict())
+        compact_body = json.dumps(encode_order(order))
+
+        # Both formats must give the consumer the same order (init_object builds main_lambda.classes
+        # instances, so the objects are compared field by field)
+        legacy_order, compact_order = legacy_decode(legacy_body), compact_decode(compact_body)
+        assert asdict(legacy_order.Shipment) == asdict(compact_order.Shipment)
+        assert asdict(legacy_order.Customer) == asdict(compact_order.Customer)
+        assert [asdict(item) for item in legacy_order.items] == [asdict(item) for item in compact_order.items]
+
+        for name, encode, decode, body in [
+            ("legacy", lambda: json.dumps(order.as_dict()), legacy_decode, legacy_body),
+            ("compact", lambda: json.dumps(encode_order(order)), compact_decode, compact_body),
+        ]:
+            results.append({
+                "order": order.order_number,
+                "format": name,
+                "bytes": len(body.encode('utf-8')),
+                "encode_us": round(timeit.timeit(encode, number=iterations) / iterations * 1e6, 1),
+                "decode_us": round(timeit.timeit(lambda: decode(body), number=iterations) / iterations * 1e6, 1),
+            })
+    return results
+
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    for result in run(args.iterations):
+        print(result)
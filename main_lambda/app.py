@@ -1,45 +1,106 @@
 import json
-import boto3
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from claim_check import unpack_message_body
+from trading_partners import is_actionable
+from rate_cache import rate_cache
+from rating_results import rating_results
+from transit_cache import transit_cache
 from main import main  # Assuming main.py is in the same directory and contains a function named main
 
-sqs = boto3.client('sqs')
+# Upper bound on how many message groups are worked on at the same time within one invocation
+MAX_CONCURRENT_GROUPS = int(os.environ.get('MAX_CONCURRENT_GROUPS', '5'))
 
-def lambda_handler(event, context):
+
+def group_records(records):
+    '''
+    Groups the SQS records of a batch by their FIFO MessageGroupId, keeping the delivery order inside each group.
+
+    Messages from the same group must be handled one after another to keep FIFO ordering, while
+    separate groups are independent of each other and can be processed concurrently.
+
+    Args:
+        records (list): The 'Records' list of the SQS event.
+
+    Returns:
+        list: A list of record lists, one per message group, in order of first appearance.
+    '''
+    groups = {}
+    for record in records:
+        group_id = record.get('attributes', {}).get('MessageGroupId', record['messageId'])
+        groups.setdefault(group_id, []).append(record)
+    return list(groups.values())
+
+
+def process_record(record):
+    '''
+    Runs one SQS record through the main program.
+
+    Returns:
+        bool: True if the order was handled (processed or intentionally ignored), False if it should be redelivered.
+    '''
     try:
-        print(event)
-        # Extract the body from the first record
-        record = event['Records'][0]
-        record_body = record['body']
-        
-        # Parse the JSON string in the body
-        parsed_body = json.loads(record_body)
-        
-        # Extract the queue URL and receipt handle
-        queue_url = "https://sqs.us-east-2.amazonaws.com/982081062525/StallionOrderQueue"
-        receipt_handle = record['receiptHandle']
-        
-        # Pass the parsed body, queue URL, and receipt handle to the main function
+        # The batch Lambda stamps the trading partner on the message, orders that aren't rated are
+        # acknowledged without being decoded
+        trading_partner = record.get('messageAttributes', {}).get('TradingPartner', {}).get('stringValue')
+        if trading_partner and not is_actionable(trading_partner):
+            print(f"Message {record['messageId']} is for {trading_partner}, not in valid trading partners")
+            return True
+
+        # Parse the JSON string in the body, resolving compressed or offloaded bodies first
+        parsed_body = json.loads(unpack_message_body(record['body']))
+
+        # main() returns False when the order could not be finished, None for orders it ignores
         result = main(parsed_body)
+        return result is not False
 
-        #If result is true, delete the message from the queue
-        if result:
-            sqs.delete_message(
-                QueueUrl=queue_url,
-                ReceiptHandle=receipt_handle
-            )
-        
-        return {
-            "statusCode": 200,
-            "body": json.dumps({
-                "message": "Success",
-                #"result": result
-            }),
-        }
     except Exception as e:
-        return {
-            "statusCode": 500,
-            "body": json.dumps({
-                "message": "Error",
-                "error": str(e)
-            }),
-        }
+        print(f"[X] Failed to process message {record['messageId']}: {e}")
+        print(traceback.format_exc())
+        return False
+
+
+def process_group(records):
+    '''
+    Processes the records of a single message group in order.
+
+    Once a record fails, the remaining records of the group are not attempted and are reported
+    as failures as well, so SQS redelivers them in their original order.
+
+    Returns:
+        list: The messageIds of the records that need to be redelivered.
+    '''
+    failed_ids = []
+    for record in records:
+        if failed_ids or not process_record(record):
+            failed_ids.append(record['messageId'])
+    return failed_ids
+
+
+def lambda_handler(event, context):
+    '''
+    Entry point for the SporticultureOrderQueue event source.
+
+    Every record in the batch is processed; groups run concurrently and the ids of the records that
+    failed are returned as batchItemFailures so only those orders go back to the queue.
+    (Requires ReportBatchItemFailures on the event source mapping.)
+    '''
+    records = event.get('Records', [])
+    print(f"Received {len(records)} record(s)")
+
+    groups = group_records(records)
+    batch_item_failures = []
+
+    if groups:
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONCURRENT_GROUPS, len(groups)))) as executor:
+            for failed_ids in executor.map(process_group, groups):
+                batch_item_failures.extend({"itemIdentifier": message_id} for message_id in failed_ids)
+
+    print(f"Processed {len(records)} record(s), {len(batch_item_failures)} failed")
+    print(f"Rate cache: {rate_cache.stats()}")
+    print(f"Transit cache: {transit_cache.stats()}")
+    print(f"Rating results: {rating_results.stats()}")
+    rate_cache.save()
+    rating_results.save()
+    return {"batchItemFailures": batch_item_failures}
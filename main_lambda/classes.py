@@ -2,6 +2,10 @@ from dataclasses import dataclass, field, asdict
 from typing import Optional, List, Dict, Union, Any
 from datetime import datetime, timedelta, time
 import pytz
+from trading_partners import get_trading_partner, TRADING_PARTNER_CARRIERS
+from sku_index import lookup_sku
+from reference_data import get_reference_data, set_address
+from rate_table import RateTable
 
 
 @dataclass
@@ -143,9 +147,10 @@ class Order:
     is_multi_order:                     bool = False
     is_double_order:                    bool = False
     is_complex_order:                   bool = False
-    rates:                              Dict = field(default_factory=dict)
+    rates:                              RateTable = field(default_factory=RateTable) # ShipStation rates, see rate_table.py
     winning_rate:                       Dict = field(default_factory=dict)
     mapping_services:                   Dict = field(default_factory=dict)
+    rating_fingerprint:                 Optional[str] = None # Hash of the rating inputs, see fingerprint.py
 
     def __post_init__(self):
         # Set deliver_by_date based on Shipment.advanced_options['custom_field_1']
@@ -155,11 +160,11 @@ class Order:
             self.deliver_by_date = (datetime.now() + timedelta(days=7)).strftime('%m/%d/%Y %H:%M:%S')
 
         # If certain products are found in the order, set is_single_stream to True --> (surepost and ground saver note allowed)
-        single_stream_skus = ["MGLMP", "SCARL", "CER"]
-        self.is_single_stream = any(
-            item.sku.startswith(tuple(single_stream_skus)) for item in self.items
-        )
+        # Single stream SKU prefixes: sku_index.SINGLE_STREAM_PREFIXES
+        self.is_single_stream = any(lookup_sku(item.sku).is_single_stream for item in self.items)
 
+        # Legacy messages carry the rates as a dict of carrier -> [(serviceName, price), ...]
+        self.rates = RateTable.from_dict(self.rates)
 
         # Modify Shipment based on warehouse value
         self.update_shipment_based_on_warehouse()
@@ -167,79 +172,16 @@ class Order:
         self.set_trading_partner()
 
     def set_trading_partner(self):
-
-        if self.store_name == "TC EDI":
-            if self.order_number.startswith("DS"):
-                self.trading_partner = "Fanatics"
-                self.list_of_carriers = ["External Account"]
-            elif self.order_number.startswith("7"):
-                self.trading_partner = "Target"
-                self.list_of_carriers = ["External Account"]
-            elif self.order_number.startswith("3"):
-                self.trading_partner = "Rally House"
-                self.list_of_carriers = ["Automated on Shipstation UI"]
-        
-        elif self.store_name == "Amazon":
-            self.trading_partner = "Amazon"
-            self.list_of_carriers = ["ups", "fedex", "stamps_com", "ups_walleted"]
-
-        elif self.store_name == "JoAnn Fabric & Crafts":
-            self.trading_partner = "JoAnn"
-            self.list_of_carriers = ["Automated on Shipstation UI"]
-
-        elif self.store_name == "Sporticulture":
-            cbs_keywords = ["CBSD", "RSAD", "AMSD"]
-            for word in cbs_keywords:
-                if word in self.order_number:
-                    self.trading_partner = "CBS"
-                    self.list_of_carriers = ["ups", "ups_walleted", "fedex", "stamps_com"]
-                    break
-                else:
-                    self.trading_partner = "Sporticulture"
-                    self.list_of_carriers = ["ups", "ups_walleted", "fedex", "stamps_com"]
-
-        
-        elif self.store_name == "Sharper Image":
-            self.trading_partner = "Sharper Image"
-            self.list_of_carriers = ["Automated on Shipstation UI"]
-        
-        elif self.store_name == "Stadium Allstars":
-            self.trading_partner = "Stadium Allstars"
-            self.list_of_carriers = ["Automated on Shipstation UI"]
-        
-        elif self.store_name == "Sporticulture Wholesale":
-            self.trading_partner = "Sporticulture Wholesale"
-        
-        elif self.store_name == "Walmart Wholesale":
-            self.trading_partner = "Walmart"
-            self.list_of_carriers = []
-
-        else: 
-            self.trading_partner = "Unknown"
-            self.list_of_carriers = []
+        # Rules live in trading_partners.py, the batch Lambda classifies orders with the same rules
+        self.trading_partner = get_trading_partner(self.store_name, self.order_number)
+        self.list_of_carriers = list(TRADING_PARTNER_CARRIERS.get(self.trading_partner, []))
         
 
     def update_shipment_based_on_warehouse(self):
         # Initialize warehouse attributes using warehouse name
-        if self.warehouse_name['warehouse'] == "Stallion Wholesale":
-            self.Shipment.warehouse.postal_code = "46203"
-            self.Shipment.warehouse.city = "INDIANAPOLIS"
-            self.Shipment.warehouse.state = "IN"
-            self.Shipment.warehouse.country = "US"
-            self.Shipment.warehouse.street1 = "1435 E NAOMI ST"
-            self.Shipment.warehouse.phone = "3174064033"
-            self.Shipment.warehouse.residential = False
-            self.Shipment.warehouse.name = "Stallion Wholesale"
-
-        elif self.warehouse_name['warehouse'] == "Sporticulture":
-            self.Shipment.warehouse.postal_code = "21738"
-            self.Shipment.warehouse.city = "Glenwood"
-            self.Shipment.warehouse.state = "MD"
-            self.Shipment.warehouse.country = "US"
-            self.Shipment.warehouse.street1 = "14812 Burntwoods Road"
-            self.Shipment.warehouse.phone = "4432667788"
-            self.Shipment.warehouse.residential = False
-            self.Shipment.warehouse.name = "Warehouse Location 1"
+        address = get_reference_data().get_address_by_warehouse_name(self.warehouse_name['warehouse'])
+        if address is not None:
+            set_address(self.Shipment.warehouse, address)
 
     # Used to help convert to JSON later
     def as_dict(self):
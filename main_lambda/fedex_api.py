@@ -1,23 +1,37 @@
 import json
+import os
 import requests
-from unicodedata import normalize
 from datetime import datetime
-import boto3
-from botocore.exceptions import ClientError
+from secrets_provider import get_secret, invalidate_secret
+from token_manager import TokenManager, OAuthSession
+from transit_cache import transit_cache, lane_key
+from rate_candidates import Candidate, SMARTPOST, get_request_timeout
+
+
+# FedEx rate request template, resolved next to this module and loaded once per container
+FEDEX_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fedex.json')
+
+with open(FEDEX_TEMPLATE_PATH, 'r') as template_file:
+    PAYLOAD_TEMPLATE = json.load(template_file)
 
 
 
 def create_fedex_session():
-    session = requests.Session()
-    access_token = get_access_token(session)
+    '''
+    Creates the session used for FedEx API calls, with its bearer token kept fresh by a TokenManager.
+    '''
+    # Token requests use their own plain session, so they don't carry a bearer token themselves
+    token_session = requests.Session()
+    token_manager = TokenManager("Fedex", lambda: get_access_token(token_session))
 
-    if access_token:
+    session = OAuthSession(token_manager)
+
+    if token_manager.get_token():
 
         header = {
             'x-customer-transaction-id' : '123456123456',
             'content-type': "application/json",
             'x-locale': "en_US",
-            'authorization': f"Bearer {access_token}"
             }
 
         session.headers.update(header)
@@ -29,36 +43,6 @@ def create_fedex_session():
 
 
 
-def get_secret(secret_name):
-    """
-    Retrieve the API key and secret from AWS Secrets Manager.
-
-    Parameters:
-    secret_name (str): The name of the secret in AWS Secrets Manager.
-
-    Returns:
-    tuple: A tuple containing the api_key and api_secret as strings.
-    """
-    # Create a Secrets Manager client
-    client = boto3.client('secretsmanager')
-
-    try:
-        # Get the secret value from Secrets Manager
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-
-        # Parse the secret JSON string and extract the keys
-        secret_dict = json.loads(get_secret_value_response['SecretString'])
-        api_key = secret_dict['api_key']
-        api_secret = secret_dict['api_secret']
-
-        return api_key, api_secret
-
-    except ClientError as e:
-        # Handle the error accordingly
-        raise e
-    
-
-
 def get_api_keys():
 
     #load_dotenv()
@@ -77,7 +61,7 @@ def get_access_token(session):
     to obtain an access token using client credentials flow.
 
     Returns:
-    - str or None: The access token if retrieved successfully, else None.
+    - tuple: (access_token, expires_in) if retrieved successfully, else (None, None).
 
     Raises:
     - requests.HTTPError: If the request to the FedEx API fails.
@@ -93,73 +77,109 @@ def get_access_token(session):
     #API oauth2.0 url production
     url = 'https://apis.fedex.com/oauth/token'
 
-    client_id , client_secret = get_api_keys()
-
-    # Set the payload
-    payload = f'grant_type=client_credentials&client_id={client_id}&client_secret={client_secret}'
-    
-
     headers = {
         'Content-Type': "application/x-www-form-urlencoded"
         }
     try:
-        response = session.post(url, data=payload, headers=headers, timeout=10)
+        for attempt in range(2):
+            client_id , client_secret = get_api_keys()
+
+            # Set the payload
+            payload = f'grant_type=client_credentials&client_id={client_id}&client_secret={client_secret}'
+
+            response = session.post(url, data=payload, headers=headers, timeout=10)
+            # Credentials may have been rotated, drop the cached copy and try once more
+            if response.status_code == 401 and attempt == 0:
+                invalidate_secret('fedexAPICredentials')
+                continue
+            break
         response.raise_for_status() # raises error if not 200 status
 
-        access_token = response.json()["access_token"]
+        token_info = response.json()
+        access_token = token_info["access_token"]
+        expires_in = token_info.get("expires_in")
         print("[+] Fedex 0Auth token request successful!")
     
     except Exception as e:
         print("[X] Could not retrieve fedex access_token")
         print(f"Error: {e}")
         access_token = None
+        expires_in = None
 
 
-    return access_token
+    return access_token, expires_in
 
 
 
-def set_payload(order):
+def copy_template(value):
     """
-    Set the payload for a FedEx shipment request based on order details.
+    Copy a part of the payload template, a plain dict / list / scalar tree loaded from fedex.json.
+
+    Cheaper than copy.deepcopy, which has to handle any object and keep a memo.
+    """
+    if isinstance(value, dict):
+        return {key: copy_template(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_template(item) for item in value]
+    return value
 
-    This function reads a JSON file containing a FedEx shipment request payload template.
-    It updates specific fields in the payload based on the provided `orderObject` and
-    returns the updated payload.
+
+
+def build_package_line_item(weight_ounces):
+    """
+    Build one requestedPackageLineItems entry of the FedEx payload.
 
     Args:
-    - orderObject: An object containing order details such as shipping information.
+    - weight_ounces (float): The weight of the package in ounces.
 
     Returns:
-    - dict: The updated FedEx shipment request payload.
+    - dict: The package line item of the template, weight converted to pounds.
+    """
+    line_item = copy_template(PAYLOAD_TEMPLATE["requestedShipment"]["requestedPackageLineItems"][0])
+    line_item["weight"]["value"] = float(weight_ounces / 16) #convert ounce to pounds
+    return line_item
 
-    Notes:
-    The function reads the JSON file specified by `json_file` and modifies specific fields
-    in the payload template based on the provided `orderObject`. It updates recipient address
-    details, shipment date, package weight, and package dimensions.
+
+
+def set_payload(order, package_weights=None):
     """
-    #location of fedex json payload template
-    json_file = 'main_lambda/fedex.json'
+    Set the payload for a FedEx shipment request based on order details.
 
-    with open(json_file, 'r') as file:
-        payload = json.load(file)
+    The payload is a copy of the template loaded at import time (fedex.json), only the
+    fields that change per order are overwritten, so no file is read per quote.
 
-        payload["requestedShipment"]["shipper"]["address"]["postalCode"] = order.Shipment.warehouse.postal_code
-        payload["requestedShipment"]["shipper"]["address"]["stateOrProvinceCode"] = order.Shipment.warehouse.state
-        payload["requestedShipment"]["shipper"]["address"]["countryCode"] = order.Shipment.warehouse.country
+    Args:
+    - order: An object containing order details such as shipping information.
+    - package_weights (list): Weights in ounces, one per package of a multi-piece shipment.
+    Defaults to a single package of the order's weight.
 
-        payload["requestedShipment"]["recipient"]["address"]["postalCode"] =  order.Customer.ship_to.postal_code[:5]
-        payload["requestedShipment"]["recipient"]["address"]["stateOrProvinceCode"] =  order.Customer.ship_to.state
-        payload["requestedShipment"]["recipient"]["address"]["countryCode"] = order.Customer.ship_to.country
-        
-        payload["requestedShipment"]["shipDateStamp"] = order.Shipment.ship_date  #YYYY-MM-DD
-        payload["requestedShipment"]["requestedPackageLineItems"][0]["weight"]["value"] = float(order.Shipment.weight['value'] / 16) #convert ounce to pounds
+    Returns:
+    - dict: The FedEx shipment request payload.
+    """
+    if package_weights is None:
+        package_weights = [order.Shipment.weight['value']]
+
+    payload = copy_template(PAYLOAD_TEMPLATE)
+    shipment = payload["requestedShipment"]
+
+    shipment["shipper"]["address"].update({
+        "postalCode": order.Shipment.warehouse.postal_code,
+        "stateOrProvinceCode": order.Shipment.warehouse.state,
+        "countryCode": order.Shipment.warehouse.country
+    })
+    shipment["recipient"]["address"].update({
+        "postalCode": order.Customer.ship_to.postal_code[:5],
+        "stateOrProvinceCode": order.Customer.ship_to.state,
+        "countryCode": order.Customer.ship_to.country
+    })
+    shipment["shipDateStamp"] = order.Shipment.ship_date #YYYY-MM-DD
+    shipment["requestedPackageLineItems"] = [build_package_line_item(weight) for weight in package_weights]
 
     return payload
 
 
 
-def get_fedex_response(order):
+def get_fedex_response(order, deadline=None):
     """
     Retrieve FedEx shipping rates for an order from the FedEx API.
 
@@ -169,7 +189,7 @@ def get_fedex_response(order):
 
     Args:
     - order_object: An object containing details of the order to be shipped.
-    - access_token (str): An access token obtained from the FedEx OAuth2.0 API.
+    - deadline (float): time.monotonic() the 10 second timeout is capped at, None for no deadline.
 
     Returns:
     - dict or None: A dictionary containing shipping rate information if
@@ -196,7 +216,7 @@ def get_fedex_response(order):
     #payload = json.dumps(temp_payload())
 
     try:
-        response = order.fedex_session.post(url, data=payload, timeout=10)
+        response = order.fedex_session.post(url, data=payload, timeout=get_request_timeout(deadline, 10))
 
         response.raise_for_status()
         response_json = response.json()
@@ -212,6 +232,42 @@ def get_fedex_response(order):
 
 
 
+def get_transit_options(order, deadline=None):
+    """
+    Returns the FedEx services and their delivery dates for the order's lane.
+
+    The services are served from the transit cache when the lane (origin, destination ZIP5, ship date
+    and residential flag) was already looked up, otherwise they are fetched with get_fedex_response(), within the
+    deadline (time.monotonic()) of the lookup if it has one.
+
+    Returns:
+    - list of dict or None: Dictionaries with the keys 'serviceName' (as named by FedEx) and 'delivery_date',
+    None if FedEx could not be reached.
+    """
+    def fetch():
+        response_json = get_fedex_response(order, deadline)
+        if response_json is None:
+            return None
+
+        return [
+            {
+                "serviceName": shipping_service["serviceName"],
+                "delivery_date": shipping_service["commit"]["dateDetail"]["dayFormat"]
+            }
+            for shipping_service in response_json["output"]["rateReplyDetails"]
+        ]
+
+    key = lane_key(
+        order.Shipment.warehouse.postal_code,
+        order.Customer.ship_to.postal_code,
+        order.Shipment.ship_date,
+        order.Customer.ship_to.residential
+    )
+    return transit_cache.get_or_fetch("fedex", key, fetch)
+
+
+
+
 def update_prices(order, shipping_options: dict):
     """
     Updates the prices in the shipping options based on the rates from Shipstation.
@@ -224,27 +280,19 @@ def update_prices(order, shipping_options: dict):
     Returns:
     - dict: An updated dictionary of shipping options with updated prices based on Shipstation rates.
 
-    This function first converts Shipstation rates to a dictionary format for easy lookup.
-    It then iterates through each shipping option, finds the corresponding rate in the Shipstation rates dict,
-    and updates the price in the shipping options with the new rate.
+    This function iterates through each shipping option, finds the corresponding rate in order.rates by its
+    canonical service id (see service_registry.py) and updates the price in the
+    shipping options with the new rate.
     """
+    rates = order.rates
 
-    # Get Shipstation Rates --> convert to dict  --> clean unwanted symbols
-    ss_rates_dict = {
-        normalize('NFKD', key).encode('ascii', 'ignore').decode('utf-8').replace(".", ""): value
-        for key, value in order.rates['fedex']
-    }
-    # print(f"SS_Rates simple --> {ss_rates_dict}\n")
-
-    # print(f"Shipping options --> {shipping_options}\n")
-
-    # Update prices in shipping_options with prices from ss_rates_dict
+    # Update prices in shipping_options with prices from the ShipStation rates
     options_after_price_update = []
     for option in shipping_options:
 
-        service_name = normalize('NFKD', option['service_name']).encode('ascii', 'ignore').decode('utf-8') #gets rid of special characters in names
-        if service_name in ss_rates_dict:
-            option['price'] = ss_rates_dict[service_name]
+        row = rates.find('fedex', option['service_name'])
+        if row is not None:
+            option['price'] = rates.prices[row]
             options_after_price_update.append(option)
 
     return options_after_price_update
@@ -252,7 +300,7 @@ def update_prices(order, shipping_options: dict):
 
 
 
-def get_delivery_dates(order):
+def get_delivery_dates(order, deadline=None):
     """
     Retrieve delivery dates and shipping rates for an order from the FedEx API.
 
@@ -264,21 +312,24 @@ def get_delivery_dates(order):
 
     Args:
     - order_object: An object containing details of the order to be shipped.
+    - deadline (float): time.monotonic() by which FedEx has to answer, None for no deadline.
 
     Returns:
-    - list of dict: A list of dictionaries representing optional shipping services.
+    - list of dict or None: A list of dictionaries representing optional shipping services.
     Each dictionary contains keys 'service_type', 'delivery_date', and 'price'.
+    None if FedEx could not be reached.
 
     Notes:
-    The function utilizes the `get_access_token` and `get_fedex_response` functions
-    to authenticate with the FedEx API and retrieve shipping rate information.
+    The function utilizes the `get_transit_options` function, which serves repeat lanes
+    from the transit cache, to retrieve the FedEx delivery estimates.
     It processes the response JSON to extract shipping options and returns them
     as a list of dictionaries.
     """
-    response_json = get_fedex_response(order)
-
     # List of dictionaries representing the shipping options
-    raw_shipping_options = response_json["output"]["rateReplyDetails"]
+    raw_shipping_options = get_transit_options(order, deadline)
+    if raw_shipping_options is None:
+        return None
+
     clean_shipping_options = []
 
     for shipping_service in raw_shipping_options:
@@ -299,9 +350,9 @@ def get_delivery_dates(order):
         else:
             shipping_option["service_name"] = shipping_service["serviceName"]
 
-        # Add common data for all service names
-        shipping_option["delivery_date"] = shipping_service["commit"]["dateDetail"]["dayFormat"]
-        shipping_option["price"] = shipping_service["ratedShipmentDetails"][0]["totalNetFedExCharge"]
+        # Add common data for all service names, the price is replaced by the ShipStation rate in update_prices()
+        shipping_option["delivery_date"] = shipping_service["delivery_date"]
+        shipping_option["price"] = None
 
         # If single stream, remove SmartPost options
         if "SmartPost" in shipping_option["service_name"] and order.is_single_stream:
@@ -323,13 +374,13 @@ def get_delivery_dates(order):
     return final_shipping_options   #list of dictionaries showing optional shipping services
 
 
-def get_smart_post_delivery_date(shipping_options):
+def get_smart_post_delivery_date(candidates):
     """
-    Saves Smart Post Delivery Date to order object. Info will be uploaded to Shipstation front end later.
+    Returns the Smart Post Delivery Date message of the FedEx candidates. Info will be uploaded to Shipstation front end later.
     """
-    for option in shipping_options:
-        if option['service_name'] == 'FedEx SmartPost parcel select' or option['service_name'] == 'FedEx SmartPost parcel select lightweight':
-            smart_post_delivery_date = option['delivery_date'][:10]
+    for candidate in candidates:
+        if candidate.service_code == 'FedEx SmartPost parcel select' or candidate.service_code == 'FedEx SmartPost parcel select lightweight':
+            smart_post_delivery_date = candidate.delivery_date.strftime("%Y-%m-%d")
         else:
             smart_post_delivery_date = "None Provided"
 
@@ -338,107 +389,69 @@ def get_smart_post_delivery_date(shipping_options):
 
 
 
+def set_smart_post_date(order, candidates):
+    """
+    Writes the Smart Post Delivery Date of the FedEx candidates to the order, to be updated onto a field in
+    Shipstation Front End. Called by whoever looked the candidates up, get_fedex_candidates() doesn't change the order.
+    """
+    order.Shipment.smart_post_date = get_smart_post_delivery_date(candidates)
+
+
+
 
-def filter_valid_shipping_options(order, shipping_options):
+def get_candidates(shipping_options):
     """
-    Filters shipping options to include only those that will arrive on or before the latest delivery date, 
-    and updates the delivery date value to a datetime object.
+    Turns the priced shipping options into rate candidates (see rate_candidates.py).
 
     Args:
-        order (object): An object representing the order, which must include:
-                        - `deliver_by_date` (datetime): The latest delivery date for the order.
         shipping_options (list): A list of dictionaries representing the shipping options, where each dictionary 
                                 must include a 'delivery_date' key with a value in the format "%Y-%m-%dT%H:%M:%S".
 
     Returns:
-        list: A list of dictionaries containing the valid shipping options, with the 'delivery_date' values 
-            converted to datetime objects.
+        list: A list of Candidates, SmartPost options flagged so single stream orders don't ship with them.
     """
-    valid_shipping_options = []
+    candidates = []
     for option in shipping_options:
         delivery_date = datetime.strptime(option['delivery_date'], "%Y-%m-%dT%H:%M:%S")
-        deliver_by_date = datetime.strptime(order.deliver_by_date, "%m/%d/%Y %H:%M:%S")
+        flags = SMARTPOST if "SmartPost" in option['service_name'] else 0
+        candidates.append(Candidate("fedex", option['service_name'], option['price'], delivery_date, None, flags))
+    return candidates
 
-        if delivery_date <= deliver_by_date:
-            # Update value with the datetime object instead of str
-            option['delivery_date'] = delivery_date
-            valid_shipping_options.append(option)
-        else:
-            continue
-    return valid_shipping_options
 
 
 
 
-
-def get_fedex_best_rate(order):
+def get_fedex_candidates(order, deadline=None):
     """
-    Get the best FedEx shipping rate based on the latest delivery date.
+    Get the FedEx rate candidates of an order.
 
-    This function retrieves all available shipping options for the provided
-    `order_object` using the `get_delivery_dates` function. It then filters
-    out shipping options with delivery dates beyond the specified `latest_deliver_date`.
-    Finally, it returns the shipping option with the lowest price among the filtered options.
+    This function retrieves all available shipping options for the provided order using the
+    `get_delivery_dates` function, the order is only read (see set_smart_post_date). Which option
+    arrives on time and is the cheapest is decided by rate_candidates.select_best_rows().
 
     Args:
-    - order_object: An object containing details of the order to be shipped.
-    - latest_deliver_date (str): The latest acceptable delivery date in 'YYYY-MM-DDTHH:MM:SS' format.
+    - order: An object containing details of the order to be shipped.
+    - deadline (float): time.monotonic() by which FedEx has to answer, None for no deadline.
 
     Returns:
-    - dict: A dictionary representing the best shipping option with keys 'service_type', 'delivery_date', and 'price'.
-
-    Notes:
-    The function uses the `get_delivery_dates` function to retrieve shipping options
-    and filters them based on the `latest_deliver_date`. It then selects the shipping
-    option with the lowest price among the filtered options and returns it.
+    - list: The Candidates. None if FedEx rates are not applicable for the order, False if FedEx delivery
+    estimates could not be retrieved.
     """
 
     # Ensure that fedex is applicable for this order
-    rate_is_applicable = order.rates.get("fedex", False)
-    if not rate_is_applicable:
+    if "fedex" not in order.rates:
         return None
     
     # Get all shipping options
-    shipping_options =  get_delivery_dates(order)
-
-    # Writing Smartpost Delivery date to object to be updated onto a field in Shipstation Front End
-    smart_post_message = get_smart_post_delivery_date(shipping_options)
-    order.Shipment.smart_post_date = smart_post_message
+    shipping_options =  get_delivery_dates(order, deadline)
 
-    # List of options that will arrive on time
-    valid_shipping_options = filter_valid_shipping_options(order, shipping_options)
+    # If not able to get delivery estimates from FedEx, break from this function
+    if shipping_options is None:
+        return False
 
-    print(f"valid_shipping_options = {valid_shipping_options}")
+    return get_candidates(shipping_options)
 
-    # Find the best shipping option based on buisness logic
-    if valid_shipping_options:
-        sorted_options = sorted(valid_shipping_options, key=lambda x: x['price'])
 
-        if order.is_single_stream:
-            if "SmartPost" in sorted_options[0]['service_name']:
-                best_option = sorted_options[1]
-            else:
-                best_option = sorted_options[0]
-        else:
-            best_option = sorted_options[0]
-        
-        # # Desired business logic. Willing to ship up to $0.35 more expensive if package arrives earlier than the cheapest shipping rate
-        # better_options = [option for option in sorted_options if option['price'] - sorted_options[0]['price'] < 0.35 and option['delivery_date'] < sorted_options[0]['delivery_date']]
-        
-        # best_option = min(better_options, key=lambda x: x['delivery_date']) if better_options else sorted_options[0]
-        
-        best_option = sorted_options[0]
-        best_option_dict = {
-            "carrierCode": "fedex",
-            "serviceCode": best_option["service_name"],
-            "price": best_option["price"] 
-        }
-
-        return best_option_dict # Example: { "carrierCode": "fedex", "service_code: 'FedEx Ground®', "price": 8.75}
-    else:
-        return None
-
-    
 
 if __name__ == '__main__':
 
@@ -451,7 +464,7 @@ if __name__ == '__main__':
     print("\n")
     latest_deliver_date = '2024-03-06T18:00:00'
 
-    possible_options = get_fedex_best_rate(2, latest_deliver_date)
+    possible_options = get_fedex_candidates(order_object)
 
     print("final output -- \n")
     print(possible_options)
@@ -0,0 +1,71 @@
+'''
+Rating fingerprint of an order, shared by the batch Lambda (producer) and the main Lambda (consumer).
+
+The fingerprint is a hash of every order input that changes which rate wins: ship-to address, items and
+quantities, weights and dimensions, warehouse, requested service, confirmation and the deliver-by date.
+Two sends of an order with the same fingerprint would be rated the same, so:
+    - the producer uses it in the MessageDeduplicationId, a modified order is no longer dropped as a
+      duplicate of its earlier version inside the 5 minute deduplication window
+    - the consumer reuses the winning rate it already found for the same fingerprint instead of calling
+      the carrier APIs again (see main_lambda/rating_results.py)
+
+Both sides compute it from the Order object, before the consumer changes dimensions or the ship date.
+Bump FINGERPRINT_VERSION when the inputs change.
+'''
+
+import hashlib
+import json
+from collections.abc import Mapping
+
+FINGERPRINT_VERSION = 1
+
+ADDRESS_FIELDS = ('street1', 'street2', 'city', 'state', 'postal_code', 'country', 'residential')
+
+
+
+def get_rating_inputs(order):
+    """
+    Returns the order inputs the fingerprint is computed from, as JSON serializable values.
+    """
+    shipment = order.Shipment
+    ship_to = order.Customer.ship_to
+    advanced_options = shipment.advanced_options or {}
+    warehouse_name = order.warehouse_name if isinstance(order.warehouse_name, Mapping) else {}
+
+    return [
+        FINGERPRINT_VERSION,
+        [getattr(ship_to, name) for name in ADDRESS_FIELDS],
+        [[item.sku, item.quantity, item.weight] for item in order.items],
+        shipment.weight,
+        shipment.dimensions,
+        shipment.confirmation,
+        shipment.requested_shipping_service,
+        warehouse_name.get('warehouse'),
+        advanced_options.get('warehouse_id'),
+        # Deliver-by date of the order (custom field 1), not the default the Order classes derive from now()
+        advanced_options.get('custom_field_1'),
+        order.store_name,
+    ]
+
+
+
+def rating_fingerprint(order):
+    """
+    Returns the rating fingerprint of an order.
+
+    Args:
+        order (Order): The order, from either Lambda's classes.py.
+
+    Returns:
+        str: 64 hex characters.
+    """
+    canonical = json.dumps(get_rating_inputs(order), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+
+def get_deduplication_id(order, fingerprint=None):
+    """
+    Returns the MessageDeduplicationId of an order message: the order id and its rating fingerprint.
+    """
+    return f"{order.order_id}-{fingerprint or rating_fingerprint(order)}"
@@ -2,14 +2,23 @@ import json, pyfiglet, requests
 from shipstation_api import *
 from classes import Order
 from pytz import timezone
-import boto3
-from botocore.exceptions import ClientError
+from secrets_provider import get_secret
+from rate_cache import rate_cache, make_key, RATE_CACHE_ERROR_TTL
+from sku_index import lookup_sku
+from reference_data import get_reference_data, set_address
+from rate_table import RateTable
+from service_registry import get_service_registry
+from rate_candidates import select_best_rows, get_champion_row, GROUP_LABELS
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 
 
 __author__ = "Bobby Veith"
 __company__ = "Sporticulture"
 
+# Runs the per-carrier /shipments/getrates requests of an order side by side.
+# Requests still go through the shared ShipStation client, which handles the account's rate limit.
+getrates_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="getrates")
 
 def print_banner():
     """
@@ -98,35 +107,6 @@ def load_order():
 
 
 
-def get_secret(secret_name):
-    """
-    Retrieve the API key and secret from AWS Secrets Manager.
-
-    Parameters:
-    secret_name (str): The name of the secret in AWS Secrets Manager.
-
-    Returns:
-    tuple: A tuple containing the api_key and api_secret as strings.
-    """
-    # Create a Secrets Manager client
-    client = boto3.client('secretsmanager')
-
-    try:
-        # Get the secret value from Secrets Manager
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-
-        # Parse the secret JSON string and extract the keys
-        secret_dict = json.loads(get_secret_value_response['SecretString'])
-        api_key = secret_dict['api_key']
-        api_secret = secret_dict['api_secret']
-
-        return api_key, api_secret
-
-    except ClientError as e:
-        # Handle the error accordingly
-        raise e
-
-
 def connect_to_api():
     """
         Connect to the ShipStation API using the API keys stored in the .env file.
@@ -242,20 +222,8 @@ def get_tag_id(tag_reason: str):
     if the tag_id is not available for the given store name and tag reason combination.
     """
 
-    # Keys are shipstation accounts and secondary keys are tag_reasons
-    account_tag_id_mapping = {
-        
-        "Multi-Order"           : 55810,
-        "No-Dims"               : 55811,
-        "Ready"                 : 55809,
-        "No SS Carrier Rates"   : 55812,
-        "Expedited"             : 55476,
-        "Amazon"                : 55813,
-        "No-Warehouse"          : 55827,
-    }
-
-
-    tag_id = account_tag_id_mapping.get(tag_reason, False)
+    # Tag ids by tag reason, from the reference data snapshot
+    tag_id = get_reference_data().tags.get(tag_reason, False)
 
     return tag_id
 
@@ -368,7 +336,7 @@ def set_ship_date(order):
         current_time = datetime.datetime.now(eastern)
         
         # Check if the order contains an assembly item
-        is_assembly_order = any(item.sku[0].isdigit() for item in order.items)
+        is_assembly_order = any(lookup_sku(item.sku).is_assembly for item in order.items)
 
         # Define 11 AM cutoff time in Eastern Time
         cutoff_time = current_time.replace(hour=11, minute=0, second=0, microsecond=0)
@@ -511,21 +479,58 @@ def set_payload_for_rates(order, carrier):
 
 
 
+def fetch_carrier_rates(order, payload):
+    """
+        Post a single carrier's rate payload to the ShipStation getrates endpoint.
+
+        Quotes are cached per shipping lane (see rate_cache.make_key), orders on a lane that
+        was already quoted don't call ShipStation at all.
+
+        Args:
+            order (object): The order object, provides the ShipStation client
+            payload (dict): The payload from set_payload_for_rates()
+        Return:
+            list or None: The services returned by ShipStation, None when ShipStation answered with a 500
+    """
+    cache_key = make_key(payload, order.Shipment.ship_date)
+    cached = rate_cache.get(cache_key)
+    if cached is not None:
+        return cached or None
+
+    response = order.ss_client.post(endpoint="/shipments/getrates", data=json.dumps(payload))
+    # Usually raised when package details aren't valid for specific carrier
+    if response.status_code == 500:
+        # Often transient, so the lane is only skipped for RATE_CACHE_ERROR_TTL seconds, not the full TTL
+        rate_cache.put(cache_key, [], ttl=RATE_CACHE_ERROR_TTL)
+        return None
+    response.raise_for_status()  # Raises a HTTPError if the status is 4xx, 5xx
+
+    response_json = response.json()
+    rate_cache.put(cache_key, response_json)
+    return response_json
+
+
+
+
 def get_rates_for_all_carriers(order):
     """
-        Fetch the list of carriers and services from the ShipStation API.
+        Fetch the rates of every carrier applicable to the order from the ShipStation API.
+
+        The getrates requests for all carriers are sent concurrently, the results are merged
+        into order.rates (a RateTable) and order.mapping_services in the order of order.list_of_carriers.
 
         Args:
-            shipstation (ShipStation): The ShipStation connection object.
+            order (object): The order object
         Return:
-            None
+            bool: True if rates were obtained for all carriers, False otherwise
     """
     # Get list of carriers applicable for the order
     list_of_carriers = order.list_of_carriers
     try:
+        payloads = []
         for carrier in list_of_carriers:
             try:
-                payload = set_payload_for_rates(order, carrier)
+                payloads.append(set_payload_for_rates(order, carrier))
 
             # Usually raised when dimensions info is not provided for the order object --> TypeError for int() cannot take NoneType
             except TypeError as e:
@@ -533,30 +538,29 @@ def get_rates_for_all_carriers(order):
                 tag_order(order, "No-Dims")
                 return False
 
-            try:
-                response = order.ss_client.post(endpoint="/shipments/getrates", data=json.dumps(payload))
-                # Usually raised when package details aren't valid for specific carrier
-                if response.status_code == 500:
-                    continue
-                response.raise_for_status()  # Raises a HTTPError if the status is 4xx, 5xx
-
-                # If the request is successful, no exception is raised
-                response_json = response.json()
-                for service in response_json:
-                    order.mapping_services[service['serviceName']] = service['serviceCode']
-                    total_cost = round(service['shipmentCost'] + service['otherCost'], 2)
-                    service_tuple = (service['serviceName'], total_cost)
-
-                    if carrier in order.rates:
-                        order.rates[carrier].append(service_tuple)
-                    else:
-                        order.rates[carrier] = [service_tuple]
+        futures = [getrates_executor.submit(fetch_carrier_rates, order, payload) for payload in payloads]
 
-            
+        # Filled once here, the carrier modules only read it
+        rates = RateTable()
+        order.rates = rates
+
+        # Merge in carrier order, so the result does not depend on which request finished first
+        for carrier, future in zip(list_of_carriers, futures):
+            try:
+                response_json = future.result()
             except requests.exceptions.RequestException as e:
                 print(f"An error occurred: {e}")
                 return False
-        
+
+            # Carrier skipped, ShipStation could not rate the package for it
+            if response_json is None:
+                continue
+
+            for service in response_json:
+                order.mapping_services[service['serviceName']] = service['serviceCode']
+                total_cost = round(service['shipmentCost'] + service['otherCost'], 2)
+                rates.add(carrier, service['serviceName'], total_cost)
+
         # If rates obtained for all carriers
         return True
     
@@ -568,82 +572,12 @@ def get_rates_for_all_carriers(order):
 
 
 def set_product_dimensions(order):
-
-    def get_prefix(sku):
-        # Get the key for product_size_mapping based on sku prefix
-        prefix_mapping = {
-            "1216FL3D": "12x18",
-            "1216F3D": "12x18",
-            "1216U3D": "12x18",
-            "17523F": "17.5x23",
-            "2335F": "23x35",
-            "1212F": "12x12",
-            "1218F": "12x18",
-            "832F": "8x32",
-            "912F": "9x12",
-            "624F": "6x24",
-            "28F": "2x8"
-        }
-        for key, value in prefix_mapping.items():
-            if sku.startswith(key):
-                return value
-        return None
-    
-
-    product_size_mapping = {
-        "12x18": {"length": 16, "width": 20, "height": 2, "weight": 80},
-        "11x14": {"length": 16, "width": 20, "height": 2, "weight": 80},
-        "17.5x23": {"length": 19, "width": 25, "height": 2, "weight": 96},
-        "16x20": {"length": 19, "width": 25, "height": 2, "weight": 96},
-        "16x24": {"length": 19, "width": 25, "height": 2, "weight": 96},
-        "22x34": {"length": 26, "width": 38, "height": 2, "weight": 128},
-        "23x35": {"length": 26, "width": 38, "height": 2, "weight": 128},
-        "23x36": {"length": 26, "width": 38, "height": 2, "weight": 128},
-        "22x28": {"length": 31, "width": 23, "height": 2, "weight": 96},
-        "6x24": {"length": 26, "width": 38, "height": 2, "weight": 32},
-        "8x32": {"length": 39, "width": 13, "height": 2, "weight": 80},
-        "8x10": {"length": 13, "width": 13, "height": 2, "weight": 16},
-        "9x12": {"length": 13, "width": 13, "height": 2, "weight": 16},
-        "12x12": {"length": 13, "width": 13, "height": 2, "weight": 16},
-        "15x40": {"length": 45, "width": 20, "height": 2, "weight": 128},
-        "9x27": {"length": 45, "width": 20, "height": 2, "weight": 128},
-        "2x8": {"length": 9, "width": 3, "height": 3, "weight": 16},
-        "12x36": {"length": 45, "width": 20, "height": 2, "weight": 128},
-        "CERSNCJ": {"length": 11, "width": 10.5, "height": 14, "weight": 71}, # 4 lbs 7 oz = 64 + 7 = 71 oz
-        "INFLSCF": {"length": 7, "width": 7, "height": 7, "weight": 38}, # 2 lbs 6 oz = 32 + 6 = 38 oz
-        "STRART": {"length": 12, "width": 12, "height": 3, "weight": 39}, # 2 lbs 7 oz = 32 + 7 = 39 oz
-        "INFLCP": {"length": 10, "width": 6, "height": 3, "weight": 10},
-        "INFLJH": {"length": 10, "width": 8, "height": 6, "weight": 46}, # 2 lbs 14 oz = 32 + 14 = 46 oz
-        "INFLSB": {"length": 10, "width": 8, "height": 6, "weight": 54}, # 3 lbs 6 oz = 48 + 6 = 54 oz
-        "INDLSD": {"length": 10, "width": 8, "height": 6, "weight": 51}, # 3 lbs 3 oz = 48 + 3 = 51 oz
-        "CERPM": {"length": 12, "width": 12.5, "height": 13.5, "weight": 82}, # 5 lbs 2 oz = 80 + 2 = 82 oz
-        "BBRIT": {"length": 7, "width": 7, "height": 5, "weight": 13},
-        "CARDL": {"length": 6, "width": 4, "height": 4, "weight": 6},
-        "CRDDT": {"length": 4, "width": 4, "height": 16, "weight": 12},
-        "GDPWT": {"length": 5, "width": 5, "height": 3, "weight": 25}, # 1 lb 9 oz = 16 + 9 = 25 oz
-        "MGLMP": {"length": 12, "width": 9, "height": 5, "weight": 67}, # 4 lbs 3 oz = 64 + 3 = 67 oz
-        "SCARL": {"length": 36, "width": 12, "height": 4, "weight": 44}, # 2 lbs 12 oz = 32 + 12 = 44 oz
-        "SOLTR": {"length": 14, "width": 6, "height": 6, "weight": 25}, # 1 lb 9 oz = 16 + 9 = 25 oz
-        "SPOTL": {"length": 6, "width": 4, "height": 4, "weight": 6},
-        "CRCCS": {"length": 9, "width": 7, "height": 1, "weight": 3.2},
-        "SAND": {"length": 8.5, "width": 12.5, "height": 1, "weight": 17}, # 1 lb 1 oz = 16 + 1 = 17 oz
-        "SCRT": {"length": 15, "width": 13, "height": 1, "weight": 7},
-        "BPOT": {"length": 8, "width": 8, "height": 8, "weight": 18}, # 1 lb 2 oz = 16 + 2 = 18 oz
-    }
-
+    # Box size and weight come from the flag size of the SKU prefix, see sku_index.FLAG_SIZE_PREFIXES
     if not order.Shipment.dimensions:
         sku = order.items[0].sku
-        prefix = get_prefix(sku)
-        
-        if prefix is None:
-            for key in product_size_mapping.keys():
-                if sku.startswith(key):
-                    prefix = key
-                    break
+        size_dict = lookup_sku(sku).box
+        if size_dict is None:
             return False
-        
-
-        size_dict = product_size_mapping[prefix]
 
         length = size_dict['length']
         width = size_dict['width']
@@ -661,65 +595,13 @@ def get_warehouse_id(order):
     # 590152 = Indiana
     # 791225 = MD
     # 729388 = Walnut Springs
-    # Order them longest to shortest to ensure we get the correct warehouse ID
-    warehouse_id_mapping = {
-        "INFL-CCSNTA": 791225,
-        "1216FL3D": None,
-        "CARDL-LS": 590152,
-        "1216F3D": None,
-        "1216U3D": None,
-        "CRDP-CC": 791225,
-        "INFLCSF": 590152,
-        "INFLSMP": 791225,
-        "17523F": 791225,
-        "CCERSM": 590152,
-        "INFLCP": 590152,
-        "INFLJH": 590152,
-        "INFLSB": 590152,
-        "INFLSD": 590152,
-        "1212F": 791225,
-        "1218F": 791225,
-        "2335F": 791225,
-        "BBRIT": 791225,
-        "BCHPD": 590152,
-        "CARDL": 590152,
-        "CERPM": 791225,
-        "CERSM": 590152,
-        "CERSN": 791225,
-        "CRCCS": 791225,
-        "CRDDT": 590152,
-        "CRDPP": 791225,
-        "GDPWT": 791225,
-        "INFLH": 791225,
-        "INFLJ": 791225,
-        "INFTY": 791225,
-        "MAFBL": 590152,
-        "MGLMP": 590152,
-        "PCRSM": 590152,
-        "SCARL": 590152,
-        "SOLTR": 590152,
-        "SPOTL": 590152,
-        "STRBL": 590152,
-        "ZNCN9": 791225,
-        "624F": 791225,
-        "832F": 791225,
-        "912F": 791225,
-        "BPOT": 590152,
-        "SAND": 791225,
-        "SCRT": 791225,
-        "PLNF": 729388,
-        "PLNP": 729388,
-        "PLSA": 729388,
-        "28F": 791225,
-        "MTS": 791225
-    }
-
+    # The warehouse of the longest matching SKU prefix, see sku_index.WAREHOUSE_ID_PREFIXES
     sku = order.items[0].sku
+    match = lookup_sku(sku)
 
-    for key, warehouse_id in warehouse_id_mapping.items():
-        if sku.startswith(key):
-            print(f"Match found: {key} -> {warehouse_id}")  # Debug print
-            return warehouse_id
+    if match.has_warehouse:
+        print(f"Match found: {sku} -> {match.warehouse_id}")  # Debug print
+        return match.warehouse_id
 
     print("No match found for SKU")  # Debug print
     return False
@@ -736,41 +618,14 @@ def update_warehouse_location(order):
 
         print(f"Warehouse ID: {warehouse_id}")
 
-        if warehouse_id == 791225:
-            order.Shipment.warehouse.postal_code = "21738"
-            order.Shipment.warehouse.city = "Glenwood"
-            order.Shipment.warehouse.state = "MD"
-            order.Shipment.warehouse.country = "US"
-            order.Shipment.warehouse.street1 = "14812 Burntwoods Road"
-            order.Shipment.warehouse.phone = "4432667788"
-            order.Shipment.warehouse.residential = False
-            order.Shipment.warehouse.name = "Warehouse Location 1"
-            return True
-
-        elif warehouse_id == 729388:
-            order.Shipment.warehouse.postal_code = "21738"
-            order.Shipment.warehouse.city = "Glenwood"
-            order.Shipment.warehouse.state = "MD"
-            order.Shipment.warehouse.country = "US"
-            order.Shipment.warehouse.street1 = "14812 Burntwoods Rd"
-            order.Shipment.warehouse.phone = "4432667788"
-            order.Shipment.warehouse.residential = False
-            order.Shipment.warehouse.name = "Walnut Springs Nursery"
-            return True
-        elif warehouse_id == 590152 or warehouse_id is None:
-            # Initialize warehouse attributes
-            order.Shipment.warehouse.postal_code = "46203"
-            order.Shipment.warehouse.city = "INDIANAPOLIS"
-            order.Shipment.warehouse.state = "IN"
-            order.Shipment.warehouse.country = "US"
-            order.Shipment.warehouse.street1 = "1435 E NAOMI ST"
-            order.Shipment.warehouse.phone = "3174064033"
-            order.Shipment.warehouse.residential = False
-            order.Shipment.warehouse.name = "Stallion Wholesale"
-            return True
-        else:
+        # None (no specific warehouse) ships from the default warehouse, Indiana
+        address = get_reference_data().get_address_by_warehouse_id(warehouse_id)
+        if address is None:
             return False
-    
+
+        set_address(order.Shipment.warehouse, address)
+        return True
+
 
 
 
@@ -814,13 +669,7 @@ def update_advanced_options(order):
             KeyError: If the provided carrier code is not found in the mapping.
         """
 
-        shipping_provider_id_mapping = {
-            "stamps_com": 223479,
-            "ups": 276012,
-            "fedex": 223490,
-            "ups_walleted": 661125
-        }
-        shipping_provider_id = shipping_provider_id_mapping[carrier_code]
+        shipping_provider_id = get_reference_data().shipping_provider_ids[carrier_code]
 
         return shipping_provider_id
 
@@ -872,28 +721,9 @@ def set_payload_for_update_order(order_object):
     
     def get_special_service_code(order_object):
 
-        mapping = {
-            'UPS Next Day Air®': 'ups_next_day_air', 
-            'UPS 2nd Day Air®': 'ups_2nd_day_air', 
-            'UPS® Ground': 'ups_ground', 
-            'UPS 3 Day Select®': 'ups_3_day_select', 
-            'UPS Next Day Air Saver®': 'ups_next_day_air_saver', 
-            'UPS Next Day Air® Early': 'ups_next_day_air_early_am', 
-            'FedEx First Overnight®': 'fedex_first_overnight', 
-            'FedEx Priority Overnight®': 'fedex_priority_overnight', 
-            'FedEx Standard Overnight®': 'fedex_standard_overnight', 
-            'FedEx 2Day® A.M.': 'fedex_2day_am', 'FedEx 2Day®': 'fedex_2day', 
-            'FedEx Express Saver®': 'fedex_express_saver', 
-            'FedEx Home Delivery®': 'fedex_home_delivery', 
-            'FedEx SmartPost parcel select': 'fedex_smartpost_parcel_select', 
-            'UPS Ground Saver': 'ups_ground_saver', 
-            'USPS Priority Mail - Package': 'usps_priority_mail', 
-            'USPS Priority Mail Express - Package': 'usps_priority_mail_express', 
-            'USPS Ground Advantage - Package': 'usps_ground_advantage'
-        }
-
+        # Any spelling of a ShipStation service resolves to its code, see service_registry.py
         serviceCode = get_service_code(order_object)
-        special_code = mapping.get(serviceCode, None)
+        special_code = get_service_registry().service_code(serviceCode)
 
         return special_code
 
@@ -973,30 +803,34 @@ def create_or_update_order(order_object: Order) -> bool:
 
 
 
-def get_champion_rate(order, ups_best: tuple = None, usps_best: tuple = None, fedex_best: tuple = None):
+def get_champion_rate(order, candidates):
     """
-    Finds the overall best shipping rate among multiple carriers based on the winning rates.
+    Finds the overall best shipping rate among the rate candidates of all carriers.
 
     Parameters:
     - order (Order object): An object representing the order details.
-    - ups_best (tuple or None): A tuple containing UPS's best rate information or None if UPS rate is not available.
-    - usps_best (tuple or None): A tuple containing USPS's best rate information or None if USPS rate is not available.
-    - fedex_best (tuple or None): A tuple containing FedEx's best rate information or None if FedEx rate is not available.
+    - candidates (CandidateTable): The candidates of the order's carriers, see rate_candidates.py.
 
     Returns:
     - None: The function updates the order object's winning_rate attribute with the champion rate.
 
-    This function takes the winning rates of all the carriers and compares them against each other to find the overall best rate.
-    It considers the warehouse ID of the order to determine which carriers to include in the comparison.
-    It includes rates from UPS, USPS, and FedEx (if available).
-    The function then selects the champion rate based on the lowest price among the eligible rates and updates the order object with this rate.
+    The best rate of every carrier is selected in one pass over the candidates (deliver-by date, single stream
+    exclusions and the USPS $0.35 rule), the champion is the cheapest of them; on equal prices UPS wins over
+    USPS and USPS over FedEx.
+
+    Raises:
+    - ValueError: If no carrier has a rate that arrives on time.
     """
-    
-    list_of_rates = [rate for rate in [ups_best, usps_best, fedex_best] if rate is not None]
+    best_rows = select_best_rows(candidates)[0]
+    for group, row in enumerate(best_rows):
+        if row is not None:
+            print(f"[+] {GROUP_LABELS[group]} best rate: {candidates.as_rate(row)}")
 
+    champion_row = get_champion_row(candidates, best_rows)
+    if champion_row is None:
+        raise ValueError(f"No carrier rate arrives by the deliver by date of order {order.order_key}")
 
-    champion_rate = min(list_of_rates, key=lambda x: x["price"])
-    order.winning_rate = champion_rate # Example:  {'carrierCode': 'ups', 'serviceCode': 'UPS® Ground', 'price': 12.62}
+    order.winning_rate = candidates.as_rate(champion_row) # Example:  {'carrierCode': 'ups', 'serviceCode': 'UPS® Ground', 'price': 12.62}
 
     return None
 
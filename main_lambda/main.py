@@ -1,11 +1,17 @@
 import functions
 import ups_api
-from usps_api import get_usps_best_rate
-from fedex_api import get_fedex_best_rate, create_fedex_session
+from usps_api import get_usps_best_rate, get_usps_candidates
+from fedex_api import get_fedex_candidates, set_smart_post_date, create_fedex_session
+from rate_candidates import CandidateTable
 
 from init_object import init_order
+import wire_decoder
+from trading_partners import is_actionable
+from fingerprint import rating_fingerprint
+from rating_results import rating_results, make_key as make_rating_key
 
-import traceback, json
+import traceback, json, threading, os, time, copy
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 
 
@@ -15,7 +21,24 @@ __company__ = "Sporticulture"
 
 # =================== GLOBAL VARIABLES =========================
 # For orders that failed the process on their first attemp
-retry_list = []
+# Kept per thread, since app.py can run several orders of a batch at the same time
+_thread_state = threading.local()
+
+
+def get_retry_list():
+    '''
+    Returns the retry list of the order being processed on the current thread.
+    '''
+    if not hasattr(_thread_state, "retry_list"):
+        _thread_state.retry_list = []
+    return _thread_state.retry_list
+
+# Rate shopping: query the carrier APIs at the same time instead of one after another
+CONCURRENT_RATE_SHOPPING = os.environ.get('CONCURRENT_RATE_SHOPPING', 'true').lower() == 'true'
+# Seconds a carrier has to return its best rate before it is treated as a failed lookup
+CARRIER_DEADLINE_SECONDS = float(os.environ.get('CARRIER_DEADLINE_SECONDS', '25'))
+# Shared by all orders of an invocation (3 carriers per order)
+carrier_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('CARRIER_WORKERS', '15')), thread_name_prefix="carrier")
 
 # =================== CORE PROGRAM FUNCTIONS =============================
 print("Connecting to the ShipStation API...")
@@ -37,8 +60,14 @@ def initial_setup(order_data):
 
 
     #print(f"order_data: {order_data}")
-    # Initialize the order object
-    order = init_order(order_data, ss_client, fedex_session, ups_session)
+    # Initialize the order object, messages come in the compact wire format or as a legacy Order.as_dict()
+    if wire_decoder.is_compact(order_data):
+        order = wire_decoder.decode_order(order_data, ss_client, fedex_session, ups_session)
+    else:
+        order = init_order(order_data, ss_client, fedex_session, ups_session)
+
+    # Computed before dimensions and ship date are set, so it matches the producer's fingerprint
+    order.rating_fingerprint = rating_fingerprint(order)
 
     # Sets order attributes as needed
     functions.check_if_multi_order(order)
@@ -70,7 +99,7 @@ def initialize_order(order):
 
     if not order.deliver_by_date:
         failure = (order, "No-DeliveryDate")
-        retry_list.append(failure)
+        get_retry_list().append(failure)
         return False
     return True
 
@@ -90,51 +119,97 @@ def get_shipping_rates(order):
 
 
 
-def set_winning_rate(order):
+def get_carrier_lookups(order):
+    '''
+    Returns the candidate lookups that apply to the order, in the order their results are evaluated.
+
+    Candidates functions only read the order. What a carrier adds to the order besides its candidates is
+    written by its apply function, called with (order, candidates) once the result is used.
+
+    Returns:
+        list: Tuples of (carrier label, retry reason, candidates function, apply function or None)
+    '''
+    lookups = []
+    if "ups" in order.list_of_carriers or "ups_walleted" in order.list_of_carriers:
+        lookups.append(("UPS", "No UPS Rate", ups_api.get_ups_candidates, None))
+    if "stamps_com" in order.list_of_carriers:
+        lookups.append(("USPS", "No USPS Rate", get_usps_candidates, None))
+    if "fedex" in order.list_of_carriers:
+        lookups.append(("FedEx", "No Fedex Rate", get_fedex_candidates, set_smart_post_date))
+    return lookups
+
+
+
+def get_best_rates_concurrently(order, lookups):
+    '''
+    Runs every carrier lookup on the carrier executor and waits for each one up to CARRIER_DEADLINE_SECONDS.
+
+    A lookup that misses the deadline is returned as False, the same value the carrier modules use
+    when no rate could be retrieved. Exceptions raised by a lookup are re-raised when its result is read.
+    The deadline is also the HTTP timeout of the carrier calls, so a lookup that was given up on doesn't
+    keep its worker much longer, and lookups don't write to the order, so a late one can't change it.
+
+    Returns:
+        list: Callables returning each lookup's result, in the same order as lookups
+    '''
+    deadline = time.monotonic() + CARRIER_DEADLINE_SECONDS
+    futures = [carrier_executor.submit(candidates_function, order, deadline) for _, _, candidates_function, _ in lookups]
+
+    def get_result(label, future):
+        def result():
+            try:
+                return future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                functions.print_yellow(f"[!] {label} rate lookup missed the {CARRIER_DEADLINE_SECONDS}s deadline")
+                return False
+        return result
+
+    return [get_result(label, future) for (label, _, _, _), future in zip(lookups, futures)]
+
+
+
+def set_winning_rate(order, concurrent=None):
+    '''
+    Gets the rate candidates of every applicable carrier and stores the champion in order.winning_rate.
+
+    With concurrent rate shopping (default, see CONCURRENT_RATE_SHOPPING) all carrier APIs are queried
+    at the same time; results are still evaluated UPS -> USPS -> FedEx so the outcome, including which
+    failure is added to the retry list, is the same as the sequential mode. The candidates of all
+    carriers go into one CandidateTable, decided in a single pass (see rate_candidates.py).
+    '''
+    if concurrent is None:
+        concurrent = CONCURRENT_RATE_SHOPPING
+
     # When delivery to a PO Box, must use USPS shipping only
     if functions.is_po_box_delivery(order):
         if "stamps_com" not in order.list_of_carriers:
             return False
         order.winning_rate =  get_usps_best_rate(order)
         return True
-    
-    # Get winning UPS rate
-    if "ups" in order.list_of_carriers or "ups_walleted" in order.list_of_carriers:
-        ups_best = ups_api.get_ups_best_rate(order)
-        if ups_best is False:
-            failure = (order, "No UPS Rate")
-            retry_list.append(failure)
-            return False
-        print(f"[+] UPS best rate: {ups_best}")
-    else:
-        ups_best = None
-
 
-    # Get winning USPS rate
-    if "stamps_com" in order.list_of_carriers:
-        usps_best = get_usps_best_rate(order)
-        if usps_best is False:
-            failure = (order, "No USPS Rate")
-            retry_list.append(failure)
-            return False
-        print(f"[+] USPS best rate: {usps_best}")
+    lookups = get_carrier_lookups(order)
+    if concurrent and len(lookups) > 1:
+        results = get_best_rates_concurrently(order, lookups)
     else:
-        usps_best = None    
-
-    # Get winning FedEx rate
-    if "fedex" in order.list_of_carriers:
-        fedex_best = get_fedex_best_rate(order)
-        if fedex_best is False:
-            failure = (order, "No Fedex Rate")
-            retry_list.append(failure)
+        results = [lambda candidates_function=candidates_function: candidates_function(order) for _, _, candidates_function, _ in lookups]
+
+    candidates = CandidateTable()
+    order_index = candidates.add_order(order)
+    for (label, reason, _, apply_result), result in zip(lookups, results):
+        carrier_candidates = result()
+        if carrier_candidates is False:
+            failure = (order, reason)
+            get_retry_list().append(failure)
             return False
-        print(f"[+] FedEx best rate: {fedex_best}")
-    else:
-        fedex_best = None
+        if carrier_candidates is not None and apply_result is not None:
+            apply_result(order, carrier_candidates)
+        if carrier_candidates:
+            candidates.extend(order_index, carrier_candidates)
 
 
-    # Compare all the winning rates against each other and update winniner to order.winning_rate
-    functions.get_champion_rate(order, ups_best=ups_best, fedex_best=fedex_best, usps_best=usps_best)
+    # Compare the candidates of all carriers and update the winner to order.winning_rate
+    functions.get_champion_rate(order, candidates)
     print(f"[+] Champion rate: {order.winning_rate}")
     return True
 
@@ -153,18 +228,22 @@ def update_order(order):
     else:
         functions.print_red(f"[X] Order shipping update not successful {order.order_key}")
         failure = (order, "Shipping not set")
-        retry_list.append(failure)
+        get_retry_list().append(failure)
 
     print("------------next order---------------------\n\n")
-    return True
+    # False sends the message back to the queue (batchItemFailures in app.py)
+    return success
 
 
 def main(data):
 
-    order_data = json.loads(json.dumps(data, default=lambda o: o.__dict__))
+    # Compact messages are decoded straight from the parsed body, legacy ones still need the round trip
+    if wire_decoder.is_compact(data):
+        order_data = data
+    else:
+        order_data = json.loads(json.dumps(data, default=lambda o: o.__dict__))
 
-    global retry_list
-    retry_list = []
+    _thread_state.retry_list = []
 
     def full_program(order):
         if not initialize_order(order):
@@ -177,11 +256,18 @@ def main(data):
                 tag = functions.tag_order(order, "No-Warehouse")
                 return False
             
-            if not get_shipping_rates(order):
-                return False
-
-            if not set_winning_rate(order):
-                return False
+            # Already rated with the same inputs and ship date: reuse the winning rate, no carrier calls
+            cached_rate = rating_results.get(make_rating_key(order))
+            if cached_rate is not None:
+                print(f"[+] Order {order.order_key} unchanged since it was rated, reusing {cached_rate}")
+                order.winning_rate = copy.deepcopy(cached_rate)
+            else:
+                if not get_shipping_rates(order):
+                    return False
+
+                if not set_winning_rate(order):
+                    return False
+                rating_results.put(make_rating_key(order), copy.deepcopy(order.winning_rate))
             
         if not update_order(order):
             return False
@@ -204,8 +290,8 @@ def main(data):
 
 
     #valid_trading_partners = ["Amazon", "Rally House", "CBS", "Sharper Image", "Stadium Allstars", "Sporticulture", "Fanatics"] #"JoAnn",
-    valid_trading_partners = ["Fanatics", "Amazon"] #"JoAnn",
-    if order.trading_partner in valid_trading_partners:
+    # Valid trading partners: trading_partners.ACTIONABLE_TRADING_PARTNERS (Fanatics, Amazon)
+    if is_actionable(order.trading_partner):
         if order.Shipment.is_expedited:
             # Variable not needed, just returns bool so..
             tag = functions.tag_order(order, "Expedited")
@@ -218,9 +304,9 @@ def main(data):
         
 
     # Orders added to retry_list within the core functions
-    if retry_list: # Global var
-        reattempt_list = retry_list.copy()
-        retry_list = []
+    if get_retry_list(): # Per-thread list
+        reattempt_list = get_retry_list().copy()
+        _thread_state.retry_list = []
         # If orders fail on second attempt, tag them and give up
         for order, reason in reattempt_list: # list of tuples
             functions.print_yellow(f"[!] Retrying Order: {order.order_key} because {reason}")
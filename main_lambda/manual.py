@@ -11,7 +11,7 @@ from main_lambda.main import main
 
 
 def manual_run():
-    order_list = process_batch()
+    order_list = process_batch(enqueue=False)
 
 
     for order in order_list:
@@ -0,0 +1,169 @@
+'''
+In-memory cache of ShipStation /shipments/getrates answers, keyed on the shipping lane.
+
+Orders from the same SKU family going from the same warehouse to the same destination ZIP on the same
+ship date get identical quotes, so only the first of them is sent to ShipStation. The cache lives in the
+module, so warm Lambda invocations of the same container share it. With RATE_CACHE_FILE set it is also
+written to that file (e.g. /tmp/rate_cache.json) after every invocation and read back on cold start.
+
+    RATE_CACHE_TTL       Seconds a quote stays valid (0 disables the cache)
+    RATE_CACHE_ERROR_TTL Seconds a lane ShipStation answered with a 500 is skipped (0 doesn't cache 500s)
+    RATE_CACHE_SIZE      Maximum number of lanes kept, least recently used lanes are evicted first
+    RATE_CACHE_FILE      Optional path the cache is persisted to
+'''
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RATE_CACHE_TTL = int(os.environ.get('RATE_CACHE_TTL', '900'))
+RATE_CACHE_ERROR_TTL = int(os.environ.get('RATE_CACHE_ERROR_TTL', '5'))
+RATE_CACHE_SIZE = int(os.environ.get('RATE_CACHE_SIZE', '2048'))
+RATE_CACHE_FILE = os.environ.get('RATE_CACHE_FILE')
+
+
+
+def make_key(payload, ship_date=None):
+    """
+    Builds the cache key of a getrates payload from set_payload_for_rates().
+
+    Only the fields that change the quote are used, postal codes are reduced to the 5 digit ZIP.
+
+    Args:
+        payload (dict): The getrates payload
+        ship_date (str): The ship date of the order, YYYY-MM-DD
+
+    Returns:
+        str: The cache key
+    """
+    dimensions = payload.get('dimensions') or {}
+    parts = [
+        payload.get('carrierCode'),
+        str(payload.get('fromPostalCode') or '')[:5],
+        str(payload.get('toPostalCode') or '')[:5],
+        payload.get('toCountry'),
+        payload.get('weight', {}).get('value'),
+        dimensions.get('length'),
+        dimensions.get('width'),
+        dimensions.get('height'),
+        payload.get('confirmation'),
+        bool(payload.get('residential')),
+        ship_date,
+    ]
+    return "|".join(str(part) for part in parts)
+
+
+
+class RateCache:
+    """
+    Thread-safe LRU cache with a TTL, counting hits and misses.
+    """
+
+    def __init__(self, ttl=RATE_CACHE_TTL, max_size=RATE_CACHE_SIZE, file_path=RATE_CACHE_FILE):
+        """
+        Args:
+            ttl (int): Seconds an entry stays valid
+            max_size (int): Maximum number of entries
+            file_path (str): Optional file the cache is persisted to
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.file_path = file_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.load()
+
+    def get(self, key):
+        """
+        Returns the cached value of `key`, None when it is missing or expired.
+        Cached values are shared, callers must not modify them.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl=None):
+        """
+        Caches `value` for `ttl` seconds, the cache's ttl by default. Nothing is cached when either is 0.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def load(self):
+        """
+        Reads the entries that have not expired yet from file_path, if there is one.
+        """
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+
+        try:
+            with open(self.file_path, 'r') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"[!] Could not load the rate cache from {self.file_path}: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in entries[-self.max_size:]:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+
+    def save(self):
+        """
+        Writes the cache to file_path, if there is one.
+        """
+        if not self.file_path:
+            return
+
+        with self._lock:
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items()]
+
+        # Write to a temporary file first so a concurrent reader never sees a partial file
+        temp_path = f"{self.file_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(entries, file)
+            os.replace(temp_path, self.file_path)
+        except OSError as e:
+            print(f"[!] Could not save the rate cache to {self.file_path}: {e}")
+
+
+
+# Shared by every order handled by this container
+rate_cache = RateCache()
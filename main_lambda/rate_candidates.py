@@ -0,0 +1,202 @@
+'''
+Shipping options of every carrier in one columnar table, and the champion rate chosen in one pass over it.
+
+The UPS, USPS and FedEx modules only turn their transit times and ShipStation rates into candidates
+(carrier, service, price, delivery date, the date checked against the deliver-by date and flags); they no
+longer sort or filter. select_best_rows() then walks all rows once, cheapest first, and applies the
+business rules of every carrier in that walk:
+
+    - the candidate must be due by the order's deliver-by date
+    - single-stream orders can't ship with UPS Ground Saver or FedEx SmartPost
+    - the cheapest candidate of a carrier is its best rate, earlier rows win on equal prices
+    - USPS: up to $0.35 more is paid for an option that arrives earlier than the cheapest USPS option
+
+The champion is the cheapest of the carriers' best rates, on equal prices UPS wins over USPS and USPS over
+FedEx. A table can hold the candidates of many orders, they are all decided by the same pass
+(select_winning_rates).
+'''
+
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime
+from rate_table import sort_rows_by_price
+
+# Carrier groups, in tie-break order
+UPS, USPS, FEDEX = range(3)
+GROUP_LABELS = ("UPS", "USPS", "FedEx")
+CARRIER_GROUPS = {"ups": UPS, "ups_walleted": UPS, "stamps_com": USPS, "fedex": FEDEX}
+
+# Candidate flags
+GROUND_SAVER = 1
+SMARTPOST = 2
+# Services single-stream products can't ship with
+SINGLE_STREAM_EXCLUDED = GROUND_SAVER | SMARTPOST
+
+# Willing to ship up to $0.35 more expensive with USPS if the package arrives earlier than the cheapest USPS rate
+USPS_UPGRADE_MARGIN = 0.35
+
+DELIVER_BY_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+# Timeout of a carrier call that starts at or after its lookup's deadline, so it fails right away
+MIN_REQUEST_TIMEOUT = 0.1
+
+# One shipping option. due_date is the date compared with the deliver-by date, the delivery date when None.
+Candidate = namedtuple(
+    "Candidate", ["carrier_code", "service_code", "price", "delivery_date", "due_date", "flags"], defaults=(None, 0)
+)
+
+
+
+def get_request_timeout(deadline, default=None):
+    """
+    Returns the HTTP timeout of a carrier call: the default (seconds, a (connect, read) tuple or None), capped at
+    the seconds left until the lookup's deadline (a time.monotonic() value, None for no deadline).
+    """
+    if deadline is None:
+        return default
+    remaining = max(deadline - time.monotonic(), MIN_REQUEST_TIMEOUT)
+    if default is None:
+        return remaining
+    if isinstance(default, tuple):
+        return tuple(min(part, remaining) for part in default)
+    return min(default, remaining)
+
+
+
+class CandidateTable:
+    """
+    Columnar table of the candidates of one or more orders.
+    """
+
+    __slots__ = (
+        'orders', 'groups', 'carriers', 'services', 'prices', 'delivery_dates', 'due_dates', 'flags',
+        'deadlines', 'single_stream',
+    )
+
+    def __init__(self):
+        # One entry per row
+        self.orders = array('I')        # Index of the row's order, see add_order()
+        self.groups = array('B')        # UPS, USPS or FEDEX
+        self.carriers = []              # ShipStation carrier code
+        self.services = []              # Service, as sent to ShipStation in the winning rate
+        self.prices = array('d')
+        self.delivery_dates = []
+        self.due_dates = []             # None when the carrier gave no delivery date
+        self.flags = array('B')
+        # One entry per order
+        self.deadlines = []             # Deliver-by datetime
+        self.single_stream = []
+
+    def add_order(self, order):
+        """
+        Adds an order to the table and returns its index, used to add its candidates.
+        """
+        self.deadlines.append(datetime.strptime(order.deliver_by_date, DELIVER_BY_FORMAT))
+        self.single_stream.append(bool(order.is_single_stream))
+        return len(self.deadlines) - 1
+
+    def extend(self, order_index, candidates):
+        """
+        Adds the candidates of an order, in the order they are preferred on equal prices.
+        """
+        for candidate in candidates:
+            self.orders.append(order_index)
+            self.groups.append(CARRIER_GROUPS[candidate.carrier_code])
+            self.carriers.append(candidate.carrier_code)
+            self.services.append(candidate.service_code)
+            self.prices.append(candidate.price)
+            self.delivery_dates.append(candidate.delivery_date)
+            self.due_dates.append(candidate.delivery_date if candidate.due_date is None else candidate.due_date)
+            self.flags.append(candidate.flags)
+
+    def as_rate(self, row):
+        """
+        Returns a row in the winning_rate format: {'carrierCode': 'ups', 'serviceCode': 'UPS® Ground', 'price': 12.62}
+        """
+        return {"carrierCode": self.carriers[row], "serviceCode": self.services[row], "price": self.prices[row]}
+
+    def by_price(self):
+        """
+        Returns the row numbers sorted by price, rows of the same price keep the order they were added in
+        (the same view as RateTable.by_price).
+        """
+        return sort_rows_by_price(self.prices)
+
+    def __len__(self):
+        return len(self.prices)
+
+
+
+def select_best_rows(table):
+    """
+    Returns, for every order of the table, the best row of each carrier group: [UPS, USPS, FedEx], None for
+    a carrier without a candidate that meets the rules.
+    """
+    orders, groups, prices = table.orders, table.groups, table.prices
+    delivery_dates, due_dates, flags = table.delivery_dates, table.due_dates, table.flags
+    deadlines, single_stream = table.deadlines, table.single_stream
+
+    best_rows = [[None, None, None] for _ in deadlines]
+    usps_upgrades = [None] * len(deadlines)
+
+    # Cheapest first, rows of the same price stay in the order they were added
+    for row in table.by_price():
+        order_index = orders[row]
+        due_date = due_dates[row]
+        if due_date is None or due_date > deadlines[order_index]:
+            continue
+        if flags[row] & SINGLE_STREAM_EXCLUDED and single_stream[order_index]:
+            continue
+
+        group = groups[row]
+        cheapest = best_rows[order_index][group]
+        if cheapest is None:
+            best_rows[order_index][group] = row
+
+        # Earliest arriving USPS option within the margin of the cheapest one
+        elif group == USPS and prices[row] - prices[cheapest] < USPS_UPGRADE_MARGIN \
+                and delivery_dates[row] < delivery_dates[cheapest]:
+            upgrade = usps_upgrades[order_index]
+            if upgrade is None or delivery_dates[row] < delivery_dates[upgrade]:
+                usps_upgrades[order_index] = row
+
+    for order_index, upgrade in enumerate(usps_upgrades):
+        if upgrade is not None:
+            best_rows[order_index][USPS] = upgrade
+
+    return best_rows
+
+
+
+def get_champion_row(table, best_rows):
+    """
+    Returns the cheapest of an order's best rows (UPS, then USPS, then FedEx on equal prices), None if it has none.
+    """
+    champion = None
+    for row in best_rows:
+        if row is not None and (champion is None or table.prices[row] < table.prices[champion]):
+            champion = row
+    return champion
+
+
+
+def select_winning_rates(table):
+    """
+    Returns the winning rate of every order of the table, None for an order without an eligible candidate.
+    """
+    winning_rates = []
+    for best_rows in select_best_rows(table):
+        champion = get_champion_row(table, best_rows)
+        winning_rates.append(None if champion is None else table.as_rate(champion))
+    return winning_rates
+
+
+
+def select_best_rate(order, candidates):
+    """
+    Returns the best rate among the candidates of one carrier, None if none meets the rules.
+    """
+    table = CandidateTable()
+    table.extend(table.add_order(order), candidates)
+    return select_winning_rates(table)[0]
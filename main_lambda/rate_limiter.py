@@ -0,0 +1,105 @@
+import threading
+import time
+
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+
+class RateLimiter(object):
+    """
+    Token bucket that paces requests against the ShipStation API rate limit.
+
+    ShipStation allows `limit` requests per `window` seconds (40 per minute by default) and reports the
+    account's budget in the X-Rate-Limit-Limit / -Remaining / -Reset headers of every response. The bucket
+    starts from the documented budget and re-learns it from those headers, spreading whatever is left of
+    the current window over the seconds until it resets instead of bursting and then sleeping for the
+    full reset. It is thread-safe, so all threads sharing a ShipStation client draw from one budget.
+    """
+
+    def __init__(self, limit=40, window=60.0, burst=10):
+        """
+        Args:
+            limit (int): Requests allowed per window
+            window (float): Length of the rate limit window in seconds
+            burst (int): Maximum number of requests that can be sent back to back
+        """
+        self.limit = limit
+        self.window = window
+        self.burst = burst
+        self.rate = limit / window  # Tokens added per second
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.window_ends_at = 0.0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # A new window has started, the server's budget is back to the full limit
+        if self.window_ends_at and now >= self.window_ends_at:
+            self.window_ends_at = 0.0
+            self.rate = self.limit / self.window
+            self.tokens = float(self.burst)
+        else:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent and takes a token for it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate if self.rate > 0 else self.window
+                # The bucket is refilled when the window resets, no need to wait longer than that
+                if self.window_ends_at:
+                    wait = min(wait, self.window_ends_at - now)
+                wait = max(wait, self.paused_until - now, 0.01)
+            time.sleep(wait)
+
+    def update(self, headers):
+        """
+        Learns the remaining budget from the X-Rate-Limit-* headers of a response.
+        Responses without the headers leave the bucket unchanged.
+        """
+        limit = to_number(headers.get('X-Rate-Limit-Limit'))
+        remaining = to_number(headers.get('X-Rate-Limit-Remaining'))
+        reset = to_number(headers.get('X-Rate-Limit-Reset'))
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.limit = limit
+            if remaining is None or reset is None:
+                return
+
+            reset = max(reset, 1.0)
+            self.window_ends_at = now + reset
+            self.tokens = min(self.tokens, max(remaining, 0.0))
+            # Spread the rest of the window's budget evenly until it resets
+            self.rate = max(remaining - self.tokens, 0.0) / reset
+
+    def pause(self, seconds):
+        """
+        Stops all requests for `seconds`, used when ShipStation answers 429 Too Many Requests.
+        """
+        seconds = to_number(seconds)
+        if seconds is None:
+            seconds = self.window
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = 0.0
+            self.updated_at = now
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.window_ends_at = max(self.window_ends_at, now + seconds)
@@ -0,0 +1,123 @@
+'''
+ShipStation rates of one order, filled once by functions.get_rates_for_all_carriers and read by the UPS,
+USPS and FedEx modules.
+
+The rates are stored column-wise (carrier, service name, canonical service id and an array of prices)
+with two indexes built as rows are added: carrier -> rows, and (carrier, service id) -> row, and a
+price-sorted view (by_price) built on first use.
+Service ids come from service_registry.py, so any spelling of a service ('UPS Ground', 'FedEx 2Day® AM')
+finds the ShipStation rate with one dict probe, the carrier modules no longer rebuild dicts or normalize
+the ShipStation names on every call.
+
+For code that still expects a dict of carrier -> [(serviceName, price), ...], get(), keys(), [] and `in`
+behave like that dict.
+'''
+
+from array import array
+from service_registry import get_service_registry
+
+
+
+def sort_rows_by_price(prices):
+    """
+    Returns the row numbers of a price column sorted by price, rows of the same price keep the order they
+    were added in.
+    """
+    return sorted(range(len(prices)), key=prices.__getitem__)
+
+
+
+class RateTable:
+    """
+    Columnar table of the ShipStation rates of an order.
+    """
+
+    __slots__ = ('carriers', 'services', 'service_ids', 'prices', 'registry', '_rows', '_index', '_sorted')
+
+    def __init__(self, registry=None):
+        self.carriers = []          # Carrier code of every row
+        self.services = []          # ShipStation service name of every row
+        self.service_ids = []       # Canonical service id of every row, see service_registry.py
+        self.prices = array('d')    # Total cost (shipmentCost + otherCost) of every row
+        self.registry = registry or get_service_registry()
+        self._rows = {}             # carrier -> row numbers, in the order they were added
+        self._index = {}            # (carrier, service id) -> row number
+        self._sorted = None         # Row numbers by price, built on first use
+
+    @classmethod
+    def from_dict(cls, rates):
+        """
+        Builds a table from the dict format, carrier -> [(serviceName, price), ...].
+        """
+        if isinstance(rates, RateTable):
+            return rates
+        table = cls()
+        for carrier, services in (rates or {}).items():
+            for service_name, price in services:
+                table.add(carrier, service_name, price)
+        return table
+
+    def add(self, carrier, service_name, price):
+        """
+        Adds a rate. A service added twice for a carrier is looked up with its last price.
+        """
+        row = len(self.prices)
+        self.carriers.append(carrier)
+        self.services.append(service_name)
+        service_id = self.registry.resolve(service_name)
+        self.service_ids.append(service_id)
+        self.prices.append(price)
+
+        self._rows.setdefault(carrier, []).append(row)
+        self._index[(carrier, service_id)] = row
+        self._sorted = None
+        return row
+
+    def find(self, carrier, service_name):
+        """
+        Returns the row of a service by any spelling of its name (see service_registry.py), None if not rated.
+        """
+        return self._index.get((carrier, self.registry.resolve(service_name)))
+
+    def rows(self, carrier):
+        """
+        Returns the row numbers of a carrier, in the order ShipStation returned them.
+        """
+        return self._rows.get(carrier, [])
+
+    def by_price(self, carrier=None):
+        """
+        Returns the row numbers sorted by price, of one carrier or of all of them. Rows of the same price
+        keep the order they were added in.
+        """
+        if self._sorted is None:
+            self._sorted = sort_rows_by_price(self.prices)
+        if carrier is None:
+            return self._sorted
+        carriers = self.carriers
+        return [row for row in self._sorted if carriers[row] == carrier]
+
+    # dict compatible view: carrier -> [(serviceName, price), ...]
+
+    def keys(self):
+        return self._rows.keys()
+
+    def get(self, carrier, default=None):
+        if carrier not in self._rows:
+            return default
+        return self[carrier]
+
+    def __getitem__(self, carrier):
+        return [(self.services[row], self.prices[row]) for row in self._rows[carrier]]
+
+    def __contains__(self, carrier):
+        return carrier in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __repr__(self):
+        return f"RateTable({ {carrier: self[carrier] for carrier in self._rows} })"
@@ -0,0 +1,30 @@
+'''
+Winning rates of the orders this container already rated, keyed on the order, its rating fingerprint
+(fingerprint.py) and its ship date.
+
+An order comes back through the queue unchanged when it was rated but its ShipStation update failed
+(main.update_order), or when it is sent again by the next sweep. With the same fingerprint and ship
+date the carriers would quote the same rates, so the stored winning rate is reused and no carrier API is
+called. A changed order has a new fingerprint and is rated again.
+
+    RATING_RESULT_TTL       Seconds a winning rate is reused (0 disables the store)
+    RATING_RESULT_SIZE      Maximum number of orders kept
+    RATING_RESULT_FILE      Optional path the store is persisted to, like RATE_CACHE_FILE
+'''
+
+import os
+from rate_cache import RateCache
+
+RATING_RESULT_TTL = int(os.environ.get('RATING_RESULT_TTL', '21600'))
+RATING_RESULT_SIZE = int(os.environ.get('RATING_RESULT_SIZE', '1024'))
+RATING_RESULT_FILE = os.environ.get('RATING_RESULT_FILE')
+
+
+
+def make_key(order):
+    return f"{order.order_id}|{order.rating_fingerprint}|{order.Shipment.ship_date}"
+
+
+
+# Shared by every order handled by this container
+rating_results = RateCache(ttl=RATING_RESULT_TTL, max_size=RATING_RESULT_SIZE, file_path=RATING_RESULT_FILE)
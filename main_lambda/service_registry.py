@@ -0,0 +1,88 @@
+'''
+Canonical ids of shipping services, shared by the UPS, USPS and FedEx modules and functions.py.
+
+ShipStation, the carrier APIs and our own tables spell the same service differently ('UPS® Ground' and
+'UPS Ground', 'FedEx 2Day® A.M.' and 'FedEx 2Day® AM'). Every spelling is resolved to one id, the ShipStation
+service code ('ups_ground'), so matching a service is one dict probe.
+
+The registry is built once per reference data version from service_codes (ShipStation name -> code) and
+service_aliases (other spellings -> code). Both are also registered folded: accents and symbols (®) dropped
+and dots removed. A name that isn't registered is folded and resolves to the service whose folded name it
+matches, or to its folded name when there is none; up to RESOLVED_NAMES_SIZE of those names are remembered,
+so later lookups of them are a single probe as well.
+
+The ShipStation service code sent with an order (service_code) is only given for the exact ShipStation
+names of service_codes, other spellings have none.
+'''
+
+from unicodedata import normalize
+from reference_data import get_reference_data
+
+# Unregistered names remembered by ServiceRegistry.resolve, names past the limit are folded on every lookup
+RESOLVED_NAMES_SIZE = 1024
+
+
+
+def fold_name(service_name):
+    """
+    Returns a service name without accents, symbols and dots: 'FedEx 2Day® A.M.' -> 'FedEx 2Day AM'.
+    """
+    return normalize('NFKD', service_name).encode('ascii', 'ignore').decode('utf-8').replace(".", "")
+
+
+
+class ServiceRegistry:
+    """
+    Resolves any spelling of a service name to its canonical id.
+    """
+
+    __slots__ = ('version', '_ids', '_codes', '_resolved')
+
+    def __init__(self, service_codes, service_aliases=None, version=None):
+        self.version = version
+        self._ids = {}                      # Registered name (as given or folded) -> canonical id
+        self._codes = dict(service_codes)   # ShipStation name -> ShipStation service code
+        self._resolved = {}                 # Unregistered name -> canonical id, see RESOLVED_NAMES_SIZE
+
+        for names in (service_codes, service_aliases or {}):
+            for name, service_code in names.items():
+                self._ids[name] = service_code
+                self._ids.setdefault(fold_name(name), service_code)
+
+    def resolve(self, service_name):
+        """
+        Returns the canonical id of a service name, its folded name if it isn't a known service.
+        """
+        service_id = self._ids.get(service_name)
+        if service_id is None:
+            service_id = self._resolved.get(service_name)
+            if service_id is None:
+                folded = fold_name(service_name)
+                service_id = self._ids.get(folded, folded)
+                if len(self._resolved) < RESOLVED_NAMES_SIZE:
+                    self._resolved[service_name] = service_id
+        return service_id
+
+    def service_code(self, service_name):
+        """
+        Returns the ShipStation service code of an exact ShipStation service name, None for other names.
+        """
+        return self._codes.get(service_name)
+
+
+
+_registry = None
+
+
+
+def get_service_registry():
+    """
+    Returns the registry of the current reference data, built again only when a new version is loaded.
+    """
+    global _registry
+    snapshot = get_reference_data()
+    registry = _registry
+    if registry is None or registry.version != snapshot.version:
+        registry = ServiceRegistry(snapshot.service_codes, snapshot.service_aliases, snapshot.version)
+        _registry = registry
+    return registry
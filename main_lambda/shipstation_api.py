@@ -1,5 +1,4 @@
 import datetime
-import time
 from decimal import Decimal
 import json
 import pprint
@@ -7,6 +6,7 @@ import requests
 import base64
 from models import *
 from constants import *
+from rate_limiter import RateLimiter
 
 
 class ShipStation(ShipStationBase):
@@ -41,13 +41,32 @@ class ShipStation(ShipStationBase):
         }
 
         self.session.headers.update(header)
-        self.session.hooks["response"] = self.api_calls
-    
-    def api_calls(self, r, *args, **kwargs):
-        calls_left = r.headers.get('X-Rate-Limit-Remaining')
-        time_left = r.headers.get('X-Rate-Limit-Reset')
-        if int(calls_left) <= 10:
-            time.sleep(int(time_left))
+        # Shared by every thread using this client, paces requests to the account's rate limit
+        self.rate_limiter = RateLimiter()
+        self.max_retries = 3
+
+    def send(self, method, endpoint="", **kwargs):
+        """
+        Sends a request once the rate limiter allows it.
+
+        Requests answered with 429 Too Many Requests are retried up to max_retries times after
+        waiting for the Retry-After (or X-Rate-Limit-Reset) seconds.
+        """
+        url = "{}{}".format(self.url, endpoint)
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            r = self.session.request(
+                method, url, auth=(self.key, self.secret), timeout=self.timeout, **kwargs
+            )
+            self.rate_limiter.update(r.headers)
+            if r.status_code != 429 or attempt == self.max_retries:
+                break
+
+            retry_after = r.headers.get('Retry-After') or r.headers.get('X-Rate-Limit-Reset')
+            print(f"[!] ShipStation rate limit hit, retrying in {retry_after or self.rate_limiter.window} seconds")
+            self.rate_limiter.pause(retry_after)
+
+        return r
 
     def add_order(self, order):
         self.require_type(order, ShipStationOrder)
@@ -61,40 +80,23 @@ class ShipStation(ShipStationBase):
             self.post(endpoint="/orders/createorder", data=json.dumps(order.as_dict()))
 
     def get(self, endpoint="", payload=None):
-        url = "{}{}".format(self.url, endpoint)
-        r = self.session.get(
-            url, auth=(self.key, self.secret), params=payload, timeout=self.timeout
-        )
+        r = self.send("GET", endpoint, params=payload)
         if self.debug:
             pprint.PrettyPrinter(indent=4).pprint(r.json())
 
         return r
 
     def post(self, endpoint="", data=None):
-        url = "{}{}".format(self.url, endpoint)
         headers = {"content-type": "application/json"}
-        r = self.session.post(
-            url,
-            auth=(self.key, self.secret),
-            data=data,
-            headers=headers,
-            timeout=self.timeout,
-        )
+        r = self.send("POST", endpoint, data=data, headers=headers)
         if self.debug:
             pprint.PrettyPrinter(indent=4).pprint(r.json())
 
         return r
 
     def put(self, endpoint="", data=None):
-        url = "{}{}".format(self.url, endpoint)
         headers = {"content-type": "application/json"}
-        r = self.session.put(
-            url,
-            auth=(self.key, self.secret),
-            data=data,
-            headers=headers,
-            timeout=self.timeout,
-        )
+        r = self.send("PUT", endpoint, data=data, headers=headers)
         if self.debug:
             pprint.PrettyPrinter(indent=4).pprint(r.json())
 
@@ -131,8 +133,13 @@ class ShipStation(ShipStationBase):
 
         return self.get(endpoint="/orders/list", payload=valid_parameters)
 
-    def fetch_webhook(self, batch_id):
+    def fetch_webhook(self, batch_id, page=None, page_size=None):
             '''
-            Fetches orders based off of a webhook payload. 
+            Fetches orders based off of a webhook payload (the importBatch of its resource_url).
             '''
-            return self.get(endpoint=f"/orders?importBatch={batch_id}")
+            payload = {"importBatch": batch_id}
+            if page is not None:
+                payload["page"] = page
+            if page_size is not None:
+                payload["pageSize"] = page_size
+            return self.get(endpoint="/orders", payload=payload)
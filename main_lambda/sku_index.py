@@ -0,0 +1,224 @@
+'''
+Longest-prefix index of the SKU catalog rules.
+
+Every SKU rule of the main Lambda is keyed on a SKU prefix: the warehouse that stocks the product, the box
+size and weight, single-stream products (no SurePost / Ground Saver) and assembly products (a digit as the
+first character, shipped a day later). The rules are compiled once, at cold start, into one character trie
+and a lookup walks it once per SKU, picking the longest matching prefix of every rule independently. The
+result doesn't depend on the order of the tables below.
+'''
+
+from collections import namedtuple
+from functools import lru_cache
+
+# 590152 = Indiana
+# 791225 = MD
+# 729388 = Walnut Springs
+# None   = no specific warehouse, ships from Indiana
+WAREHOUSE_ID_PREFIXES = {
+    "INFL-CCSNTA": 791225,
+    "1216FL3D": None,
+    "CARDL-LS": 590152,
+    "1216F3D": None,
+    "1216U3D": None,
+    "CRDP-CC": 791225,
+    "INFLCSF": 590152,
+    "INFLSMP": 791225,
+    "17523F": 791225,
+    "CCERSM": 590152,
+    "INFLCP": 590152,
+    "INFLJH": 590152,
+    "INFLSB": 590152,
+    "INFLSD": 590152,
+    "1212F": 791225,
+    "1218F": 791225,
+    "2335F": 791225,
+    "BBRIT": 791225,
+    "BCHPD": 590152,
+    "CARDL": 590152,
+    "CERPM": 791225,
+    "CERSM": 590152,
+    "CERSN": 791225,
+    "CRCCS": 791225,
+    "CRDDT": 590152,
+    "CRDPP": 791225,
+    "GDPWT": 791225,
+    "INFLH": 791225,
+    "INFLJ": 791225,
+    "INFTY": 791225,
+    "MAFBL": 590152,
+    "MGLMP": 590152,
+    "PCRSM": 590152,
+    "SCARL": 590152,
+    "SOLTR": 590152,
+    "SPOTL": 590152,
+    "STRBL": 590152,
+    "ZNCN9": 791225,
+    "624F": 791225,
+    "832F": 791225,
+    "912F": 791225,
+    "BPOT": 590152,
+    "SAND": 791225,
+    "SCRT": 791225,
+    "PLNF": 729388,
+    "PLNP": 729388,
+    "PLSA": 729388,
+    "28F": 791225,
+    "MTS": 791225
+}
+
+# Flag SKU prefixes -> product size of PRODUCT_SIZES
+FLAG_SIZE_PREFIXES = {
+    "1216FL3D": "12x18",
+    "1216F3D": "12x18",
+    "1216U3D": "12x18",
+    "17523F": "17.5x23",
+    "2335F": "23x35",
+    "1212F": "12x12",
+    "1218F": "12x18",
+    "832F": "8x32",
+    "912F": "9x12",
+    "624F": "6x24",
+    "28F": "2x8"
+}
+
+# Box dimensions (inches) and weight (ounces) by product size or SKU prefix. Boxes are set from the flag
+# sizes only (FLAG_SIZE_PREFIXES), the SKU prefix entries aren't used yet
+PRODUCT_SIZES = {
+    "12x18": {"length": 16, "width": 20, "height": 2, "weight": 80},
+    "11x14": {"length": 16, "width": 20, "height": 2, "weight": 80},
+    "17.5x23": {"length": 19, "width": 25, "height": 2, "weight": 96},
+    "16x20": {"length": 19, "width": 25, "height": 2, "weight": 96},
+    "16x24": {"length": 19, "width": 25, "height": 2, "weight": 96},
+    "22x34": {"length": 26, "width": 38, "height": 2, "weight": 128},
+    "23x35": {"length": 26, "width": 38, "height": 2, "weight": 128},
+    "23x36": {"length": 26, "width": 38, "height": 2, "weight": 128},
+    "22x28": {"length": 31, "width": 23, "height": 2, "weight": 96},
+    "6x24": {"length": 26, "width": 38, "height": 2, "weight": 32},
+    "8x32": {"length": 39, "width": 13, "height": 2, "weight": 80},
+    "8x10": {"length": 13, "width": 13, "height": 2, "weight": 16},
+    "9x12": {"length": 13, "width": 13, "height": 2, "weight": 16},
+    "12x12": {"length": 13, "width": 13, "height": 2, "weight": 16},
+    "15x40": {"length": 45, "width": 20, "height": 2, "weight": 128},
+    "9x27": {"length": 45, "width": 20, "height": 2, "weight": 128},
+    "2x8": {"length": 9, "width": 3, "height": 3, "weight": 16},
+    "12x36": {"length": 45, "width": 20, "height": 2, "weight": 128},
+    "CERSNCJ": {"length": 11, "width": 10.5, "height": 14, "weight": 71}, # 4 lbs 7 oz = 64 + 7 = 71 oz
+    "INFLSCF": {"length": 7, "width": 7, "height": 7, "weight": 38}, # 2 lbs 6 oz = 32 + 6 = 38 oz
+    "STRART": {"length": 12, "width": 12, "height": 3, "weight": 39}, # 2 lbs 7 oz = 32 + 7 = 39 oz
+    "INFLCP": {"length": 10, "width": 6, "height": 3, "weight": 10},
+    "INFLJH": {"length": 10, "width": 8, "height": 6, "weight": 46}, # 2 lbs 14 oz = 32 + 14 = 46 oz
+    "INFLSB": {"length": 10, "width": 8, "height": 6, "weight": 54}, # 3 lbs 6 oz = 48 + 6 = 54 oz
+    "INDLSD": {"length": 10, "width": 8, "height": 6, "weight": 51}, # 3 lbs 3 oz = 48 + 3 = 51 oz
+    "CERPM": {"length": 12, "width": 12.5, "height": 13.5, "weight": 82}, # 5 lbs 2 oz = 80 + 2 = 82 oz
+    "BBRIT": {"length": 7, "width": 7, "height": 5, "weight": 13},
+    "CARDL": {"length": 6, "width": 4, "height": 4, "weight": 6},
+    "CRDDT": {"length": 4, "width": 4, "height": 16, "weight": 12},
+    "GDPWT": {"length": 5, "width": 5, "height": 3, "weight": 25}, # 1 lb 9 oz = 16 + 9 = 25 oz
+    "MGLMP": {"length": 12, "width": 9, "height": 5, "weight": 67}, # 4 lbs 3 oz = 64 + 3 = 67 oz
+    "SCARL": {"length": 36, "width": 12, "height": 4, "weight": 44}, # 2 lbs 12 oz = 32 + 12 = 44 oz
+    "SOLTR": {"length": 14, "width": 6, "height": 6, "weight": 25}, # 1 lb 9 oz = 16 + 9 = 25 oz
+    "SPOTL": {"length": 6, "width": 4, "height": 4, "weight": 6},
+    "CRCCS": {"length": 9, "width": 7, "height": 1, "weight": 3.2},
+    "SAND": {"length": 8.5, "width": 12.5, "height": 1, "weight": 17}, # 1 lb 1 oz = 16 + 1 = 17 oz
+    "SCRT": {"length": 15, "width": 13, "height": 1, "weight": 7},
+    "BPOT": {"length": 8, "width": 8, "height": 8, "weight": 18}, # 1 lb 2 oz = 16 + 2 = 18 oz
+}
+
+# Products that can't ship with SurePost or Ground Saver
+SINGLE_STREAM_PREFIXES = ("MGLMP", "SCARL", "CER")
+
+# Assembly products start with a digit
+ASSEMBLY_PREFIXES = tuple("0123456789")
+
+# Result of a lookup. warehouse_id is None both for "no specific warehouse" and no match, has_warehouse
+# tells them apart. box is a PRODUCT_SIZES entry (shared, don't modify) or None.
+SkuMatch = namedtuple("SkuMatch", ["has_warehouse", "warehouse_id", "box", "is_single_stream", "is_assembly"])
+
+NO_MATCH = SkuMatch(False, None, None, False, False)
+
+
+
+class SkuIndex:
+    """
+    Character trie of SKU prefixes. Every node holds the rule values of the prefix ending there, a lookup
+    keeps the deepest value of each rule seen on its way down.
+    """
+
+    # Rule slots of a node's value list
+    WAREHOUSE, BOX, SINGLE_STREAM, ASSEMBLY = range(4)
+
+    _UNSET = object()
+
+    def __init__(self):
+        self.root = ({}, [self._UNSET] * 4)
+
+    def add(self, prefix, rule, value):
+        node = self.root
+        for char in prefix:
+            children = node[0]
+            if char not in children:
+                children[char] = ({}, [self._UNSET] * 4)
+            node = children[char]
+        node[1][rule] = value
+
+    def lookup(self, sku):
+        """
+        Returns the SkuMatch of a SKU, with the value of the longest matching prefix of every rule.
+        """
+        if not sku:
+            return NO_MATCH
+
+        unset = self._UNSET
+        found = [unset] * 4
+        node = self.root
+        for char in sku:
+            node = node[0].get(char)
+            if node is None:
+                break
+            values = node[1]
+            for rule in range(4):
+                if values[rule] is not unset:
+                    found[rule] = values[rule]
+
+        warehouse, box, single_stream, assembly = found
+        return SkuMatch(
+            has_warehouse=warehouse is not unset,
+            warehouse_id=None if warehouse is unset else warehouse,
+            box=None if box is unset else box,
+            is_single_stream=single_stream is not unset,
+            is_assembly=assembly is not unset,
+        )
+
+
+
+def build_sku_index():
+    """
+    Compiles the SKU tables of this module into a SkuIndex.
+    """
+    index = SkuIndex()
+    for prefix, warehouse_id in WAREHOUSE_ID_PREFIXES.items():
+        index.add(prefix, SkuIndex.WAREHOUSE, warehouse_id)
+    # Only flag prefixes get a box. The sizes named after other SKU prefixes (SCARL, MGLMP...) are not applied,
+    # those orders stay No-Dims
+    for prefix, size in FLAG_SIZE_PREFIXES.items():
+        index.add(prefix, SkuIndex.BOX, PRODUCT_SIZES[size])
+    for prefix in SINGLE_STREAM_PREFIXES:
+        index.add(prefix, SkuIndex.SINGLE_STREAM, True)
+    for prefix in ASSEMBLY_PREFIXES:
+        index.add(prefix, SkuIndex.ASSEMBLY, True)
+    return index
+
+
+
+# Built once per container
+sku_index = build_sku_index()
+
+
+
+@lru_cache(maxsize=4096)
+def lookup_sku(sku):
+    """
+    Returns the SkuMatch of a SKU (see SkuIndex.lookup), cached since orders repeat the same SKUs.
+    """
+    return sku_index.lookup(sku)
@@ -0,0 +1,97 @@
+import threading
+import time
+import requests
+
+
+
+class TokenManager:
+    """
+    Holds an OAuth access token and refreshes it shortly before it expires.
+
+    The token is fetched with the `fetch_token` callable, which returns a tuple of
+    (access_token, expires_in seconds) or (None, None) when the token request failed.
+    Concurrent refreshes are coalesced: threads that find an expiring or rejected token
+    wait for the refresh already in progress instead of requesting a token of their own.
+    """
+
+    def __init__(self, name, fetch_token, refresh_margin=120, default_expires_in=3600):
+        """
+        Args:
+            name (str): Label used in log messages, e.g. "UPS"
+            fetch_token (callable): Returns (access_token, expires_in)
+            refresh_margin (int): Seconds before expiry at which the token is refreshed
+            default_expires_in (int): Lifetime assumed when the token response has no expires_in
+        """
+        self.name = name
+        self.fetch_token = fetch_token
+        self.refresh_margin = refresh_margin
+        self.default_expires_in = default_expires_in
+        self.access_token = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_expiring(self):
+        return self.access_token is None or time.monotonic() >= self.expires_at - self.refresh_margin
+
+    def get_token(self):
+        """
+        Returns a token that is valid for at least refresh_margin seconds, refreshing it if needed.
+        """
+        token = self.access_token
+        if self.is_expiring():
+            return self.refresh(stale_token=token)
+        return token
+
+    def refresh(self, stale_token=None):
+        """
+        Requests a new token unless another thread already replaced `stale_token`.
+
+        Args:
+            stale_token (str): The token the caller found expiring or got a 401 for
+
+        Returns:
+            str or None: The current access token
+        """
+        with self._lock:
+            if self.access_token != stale_token and not self.is_expiring():
+                return self.access_token
+
+            access_token, expires_in = self.fetch_token()
+            if access_token:
+                self.access_token = access_token
+                self.expires_at = time.monotonic() + float(expires_in or self.default_expires_in)
+            else:
+                print(f"[X] Could not refresh the {self.name} access token")
+
+            return self.access_token
+
+
+
+class OAuthSession(requests.Session):
+    """
+    requests.Session that adds the TokenManager's bearer token to every request.
+
+    When a request is answered with 401 the token is refreshed once and the request is replayed.
+    """
+
+    def __init__(self, token_manager):
+        super().__init__()
+        self.token_manager = token_manager
+
+    def request(self, method, url, headers=None, **kwargs):
+        token = self.token_manager.get_token()
+        response = super().request(method, url, headers=self.add_token(headers, token), **kwargs)
+
+        if response.status_code == 401:
+            print(f"[!] {self.token_manager.name} token rejected, refreshing and retrying the request")
+            token = self.token_manager.refresh(stale_token=token)
+            response = super().request(method, url, headers=self.add_token(headers, token), **kwargs)
+
+        return response
+
+    @staticmethod
+    def add_token(headers, token):
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        return headers
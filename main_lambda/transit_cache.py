@@ -0,0 +1,134 @@
+'''
+Cache of carrier delivery estimates (transit times) shared by the UPS, FedEx and USPS modules.
+
+Transit times only depend on the lane: origin ZIP, destination ZIP5, ship date and residential flag,
+so every order on a lane that was already looked up today gets its delivery dates without a carrier call.
+The parsed service -> delivery date tables are cached, not the raw responses, and callers always get a
+copy they are free to modify.
+
+Entries expire after the carrier's TTL or at the next midnight US/Eastern, whichever comes first,
+because carriers roll their cut-off times and delivery commitments over at the day boundary.
+
+    UPS_TRANSIT_CACHE_TTL, FEDEX_TRANSIT_CACHE_TTL, USPS_TRANSIT_CACHE_TTL    Seconds, 0 disables the cache
+'''
+
+import copy
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import pytz
+
+TRANSIT_CACHE_TTLS = {
+    "ups": int(os.environ.get('UPS_TRANSIT_CACHE_TTL', '21600')),
+    "fedex": int(os.environ.get('FEDEX_TRANSIT_CACHE_TTL', '21600')),
+    "usps": int(os.environ.get('USPS_TRANSIT_CACHE_TTL', '21600')),
+}
+
+# Upper bound on cached lanes, the oldest entries are dropped first
+TRANSIT_CACHE_SIZE = int(os.environ.get('TRANSIT_CACHE_SIZE', '4096'))
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+
+def lane_key(origin_zip, dest_zip, ship_date, residential=None):
+    """
+    Builds the cache key of a shipping lane.
+
+    Args:
+        origin_zip (str): Postal code of the warehouse
+        dest_zip (str): Postal code of the customer, reduced to the 5 digit ZIP
+        ship_date (str): The ship date, YYYY-MM-DD
+        residential (bool): Residential flag of the ship to address, None when it doesn't matter to the carrier
+
+    Returns:
+        tuple: The cache key
+    """
+    return (str(origin_zip or '')[:5], str(dest_zip or '')[:5], ship_date, residential)
+
+
+
+def next_day_boundary():
+    """
+    Returns the epoch timestamp of the next midnight US/Eastern.
+    """
+    now = datetime.now(EASTERN)
+    midnight = EASTERN.localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+    return midnight.timestamp()
+
+
+
+class TransitCache:
+    """
+    Thread-safe cache of parsed delivery estimates with per-carrier TTLs and day-boundary invalidation.
+    """
+
+    def __init__(self, ttls=None, max_size=TRANSIT_CACHE_SIZE):
+        self.ttls = dict(TRANSIT_CACHE_TTLS if ttls is None else ttls)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # (carrier, lane_key) -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, carrier, key):
+        """
+        Returns a copy of the cached delivery estimates of the lane, None when missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get((carrier, key))
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+
+            self._entries.pop((carrier, key), None)
+            self.misses += 1
+            return None
+
+    def put(self, carrier, key, value):
+        ttl = self.ttls.get(carrier, 0)
+        if ttl <= 0 or value is None:
+            return
+
+        expires_at = min(time.time() + ttl, next_day_boundary())
+        with self._lock:
+            # Dicts keep insertion order, so the first entries are the oldest
+            while len(self._entries) >= self.max_size:
+                del self._entries[next(iter(self._entries))]
+            self._entries[(carrier, key)] = (expires_at, copy.deepcopy(value))
+
+    def get_or_fetch(self, carrier, key, fetch):
+        """
+        Returns the cached delivery estimates of the lane, calling `fetch` and caching its result on a miss.
+
+        Args:
+            carrier (str): "ups", "fedex" or "usps"
+            key (tuple): The lane_key() of the order
+            fetch (callable): Returns the parsed delivery estimates, None when the carrier call failed
+
+        Returns:
+            The delivery estimates, None when they could not be fetched
+        """
+        cached = self.get(carrier, key)
+        if cached is not None:
+            return cached
+
+        value = fetch()
+        self.put(carrier, key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+
+# Shared by every order handled by this container
+transit_cache = TransitCache()
@@ -4,57 +4,30 @@ import base64
 from datetime import datetime, timedelta
 import time
 import copy
-import boto3
-from botocore.exceptions import ClientError
 import json
+from secrets_provider import get_secret, invalidate_secret
+from token_manager import TokenManager, OAuthSession
+from transit_cache import transit_cache, lane_key
+from rate_candidates import Candidate, GROUND_SAVER, get_request_timeout
 
 
 
-def get_secret(secret_name):
-    """
-    Retrieve the API key and secret from AWS Secrets Manager.
-
-    Parameters:
-    secret_name (str): The name of the secret in AWS Secrets Manager.
-
-    Returns:
-    tuple: A tuple containing the api_key and api_secret as strings.
-    """
-    # Create a Secrets Manager client
-    client = boto3.client('secretsmanager')
-
-    try:
-        # Get the secret value from Secrets Manager
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-
-        # Parse the secret JSON string and extract the keys
-        secret_dict = json.loads(get_secret_value_response['SecretString'])
-        api_key = secret_dict['api_key']
-        api_secret = secret_dict['api_secret']
-
-        return api_key, api_secret
-
-    except ClientError as e:
-        # Handle the error accordingly
-        raise e
-    
-
-
 def initiate_oauth_flow(session):
     # Constants for UPS OAuth flow
-    CLIENT_ID_UPS, CLIENT_SECRET_UPS = get_secret('upsAPICredentials')
-    auth_value = f"{quote_plus(CLIENT_ID_UPS)}:{quote_plus(CLIENT_SECRET_UPS)}"
-    encoded_credentials = base64.b64encode(auth_value.encode('utf-8')).decode('utf-8')
-
-    headers = {
-        'Authorization': f'Basic {encoded_credentials}',
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'Accept': '*/*',
-        'Accept-Language': 'en-GB,en-US;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Origin': 'https://developer.ups.com',
-        'User-Agent': 'Python requests library'  # Changed from Safari for authenticity
-    }
+    def get_headers():
+        CLIENT_ID_UPS, CLIENT_SECRET_UPS = get_secret('upsAPICredentials')
+        auth_value = f"{quote_plus(CLIENT_ID_UPS)}:{quote_plus(CLIENT_SECRET_UPS)}"
+        encoded_credentials = base64.b64encode(auth_value.encode('utf-8')).decode('utf-8')
+
+        return {
+            'Authorization': f'Basic {encoded_credentials}',
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': '*/*',
+            'Accept-Language': 'en-GB,en-US;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Origin': 'https://developer.ups.com',
+            'User-Agent': 'Python requests library'  # Changed from Safari for authenticity
+        }
 
     data = {
         'grant_type': 'client_credentials'  # Common grant type for client authentication
@@ -64,37 +37,46 @@ def initiate_oauth_flow(session):
     retry_count = 0
 
     while retry_count < max_retries:
-        response = session.post('https://wwwcie.ups.com/security/v1/oauth/token', headers=headers, data=data)
+        response = session.post('https://wwwcie.ups.com/security/v1/oauth/token', headers=get_headers(), data=data)
 
         # Check if the request was successful
         if response.status_code == 200:
             print("[+] UPS OAuth token request successful!")
             # Extract and print the token information
             token_info = response.json()
-            return token_info.get('access_token')
+            return token_info.get('access_token'), token_info.get('expires_in')
         else:
             print(f"[X] Token request failed: {response.text}")
+            # Credentials may have been rotated, fetch them again on the next attempt
+            if response.status_code == 401:
+                invalidate_secret('upsAPICredentials')
             retry_count += 1
             print(f"Retrying... ({retry_count}/{max_retries})")
             time.sleep(1)  # Wait for 1 second before retrying
 
     print("[X] Failed to get UPS OAuth token after retries.")
-    return None
+    return None, None
 
 
 
 def create_ups_session():
-    
-    session = requests.Session()
+    '''
+    Creates the session used for UPS API calls.
+
+    The bearer token is managed by a TokenManager: it is refreshed shortly before it expires,
+    and once more if UPS rejects it, so long-lived warm containers never send an expired token.
+    '''
+    # Token requests use their own plain session, so they don't carry a bearer token themselves
+    token_session = requests.Session()
+    token_manager = TokenManager("UPS", lambda: initiate_oauth_flow(token_session))
 
-    access_token = initiate_oauth_flow(session)
+    session = OAuthSession(token_manager)
 
-    if access_token:
+    if token_manager.get_token():
         header = {
             'Accept': 'application/json',
             'Accept-Encoding': 'gzip, deflate, br',
             'Accept-Language': 'en-GB,en-US;q=0.9,en;q=0.8',
-            'Authorization': f'Bearer {access_token}',
             'Connection': 'keep-alive',
             'Content-Type': 'application/json',
             'Host': 'wwwcie.ups.com',
@@ -117,7 +99,7 @@ def create_ups_session():
     
 
 
-def get_delivery_times(order):
+def get_delivery_times(order, deadline=None):
     # API DOCS --> https://developer.ups.com/api/reference?loc=en_US#tag/TimeInTransit_other
     # The URL for the API request
     url = 'https://wwwcie.ups.com/api/shipments/v1/transittimes'
@@ -151,7 +133,7 @@ def get_delivery_times(order):
 
     try:
         # Making the POST request
-        response = order.ups_session.post(url, json=payload)
+        response = order.ups_session.post(url, json=payload, timeout=get_request_timeout(deadline))
 
         # Check if the request was successful
         if response.status_code == 200:
@@ -168,6 +150,36 @@ def get_delivery_times(order):
 
 
 
+def get_transit_services(order, deadline=None):
+    '''
+    Returns the UPS services and their delivery dates for the order's lane.
+
+    The services are served from the transit cache when the lane (origin, destination ZIP5, ship date
+    and residential flag) was already looked up, otherwise they are fetched with get_delivery_times(), within the
+    deadline (time.monotonic()) of the lookup if it has one.
+
+    Returns:
+        list or None: Service dicts with the keys 'serviceLevel', 'serviceLevelDescription', 'businessTransitDays',
+                      'deliveryDate' (YYYY-MM-DD) and 'deliveryDayOfWeek', None if UPS could not be reached.
+    '''
+    def fetch():
+        data = get_delivery_times(order, deadline)
+        if data is None:
+            return None
+
+        fields = ['serviceLevel', 'serviceLevelDescription', 'businessTransitDays', 'deliveryDate', 'deliveryDayOfWeek']
+        return [{field: service.get(field) for field in fields} for service in data["emsResponse"]["services"]]
+
+    key = lane_key(
+        order.Shipment.warehouse.postal_code,
+        order.Customer.ship_to.postal_code,
+        order.Shipment.ship_date,
+        order.Customer.ship_to.residential
+    )
+    return transit_cache.get_or_fetch("ups", key, fetch)
+
+
+
 
 def add_ground_saver_to_list(service_list): 
     """
@@ -182,6 +194,7 @@ def add_ground_saver_to_list(service_list):
     This function checks each service in the service list. If a service corresponds to 'UPS Ground' and is not scheduled for delivery on Friday or Saturday (weekend), 
     it adds a Ground Saver service to the list with modified attributes. The modified attributes include service level ('GNS' for Ground Saver), 
     service description ('UPS Saver'), incremented business transit days, and adjusted delivery date and day of the week based on adding one day to the original delivery date.
+    Ground Saver is held to the deliver-by date through UPS Ground's delivery date ('dueDate').
 
     Note: The input service_list is modified in-place, and the updated list is returned.
     """
@@ -210,6 +223,7 @@ def add_ground_saver_to_list(service_list):
             delivery_day = service['deliveryDayOfWeek']
             # Set Ground Saver equal to UPS Ground, and then make the changes we need
             ground_saver = copy.deepcopy(service)
+            ground_saver['dueDate'] = service['deliveryDate']
             ground_saver['serviceLevel'] = 'GNS'
             ground_saver['serviceLevelDescription'] = 'UPS Ground Saver'
             if delivery_day != "SAT": # For Ground Saver to be valid, it cannot arrive on sunday
@@ -230,156 +244,92 @@ def add_ground_saver_to_list(service_list):
     return service_list
 
 
-def get_valid_services(order, services):
+def set_delivery_dates(services):
     """
-    Filter and return a list of services that will arrive on or before the latest delivery date.
+    Converts the delivery dates of the services to datetime objects.
 
-    This function takes an order and a list of services, then checks each service's delivery date
-    to determine if it is on or before the order's deliver-by date. Only services that meet this 
-    criterion are included in the returned list.
+    The deliver-by date is checked when the champion rate is selected, see rate_candidates.py.
 
     Args:
-        order (object): An object representing the order, which has an attribute 
-                        `deliver_by_date` containing the latest delivery date as a string.
-                        The date format is "%m/%d/%Y %H:%M:%S".
-        services (dict): A dictionary containing the services under the key "emsResponse".
+        services (list): The services from get_transit_services().
                         Each service has a 'deliveryDate' key with the date as a string 
                         in the format "%Y-%m-%d".
 
     Returns:
-        list: A list of services that will arrive on or before the latest delivery date.
+        list: The same services, 'deliveryDate' as a datetime object.
     """
-    valid_services = []
-    for service in services["emsResponse"]["services"]:
-        # Convert the deliveryDate to a datetime object
-        delivery_date = datetime.strptime(service['deliveryDate'], '%Y-%m-%d')
-        # Redefine this value to datetime object for later use and comparison
-        service['deliveryDate'] = delivery_date
+    for service in services:
+        service['deliveryDate'] = datetime.strptime(service['deliveryDate'], '%Y-%m-%d')
+    return services
 
-        # Convert the string to a datetime object
-        date_format = "%m/%d/%Y %H:%M:%S"  # Old Format = "%Y-%m-%dT%H:%M:%SZ"
-        latest_time_datetime = datetime.strptime(order.deliver_by_date, date_format)
-        # Check if the delivery date is within the desired deadline.
-        if delivery_date <= latest_time_datetime:
-            valid_services.append(service)
-    return valid_services
 
 
-
-def get_valid_rates(order, valid_services):
+def get_valid_rates(order, services):
     """
-    Calculate and return a list of valid rates for given services based on ShipStation data.
+    Calculate and return the rate candidates of the given services based on ShipStation data.
 
-    This function takes an order and a list of valid services, then checks each service's rate 
-    from the order.rate data (Shipstation Data). It handles specific cases for UPS Ground to account for a naming 
-    anomaly and applies an upcharge for certain carrier accounts.
+    This function takes an order and a list of services, then looks up each service's rate 
+    in order.rates (Shipstation Data). Services are matched on their canonical id (see service_registry.py), so
+    'UPS Ground' from the UPS API finds ShipStation's 'UPS® Ground'; the ShipStation name is returned.
 
     Args:
         order (object): An object representing the order, which must have an attribute `rates` 
                         containing the price rate information for different carriers.
-        valid_services (list): A list of valid services, each service being a dictionary with keys 
-                            'serviceLevelDescription' and 'deliveryDate'.
+        services (list): A list of services, each service being a dictionary with keys 
+                            'serviceLevelDescription' and 'deliveryDate' (and 'dueDate' for Ground Saver).
 
     Returns:
-        list: A list of dictionaries containing the carrier, service code, price, and delivery date 
-            for services that have valid rates.
-            Ex: {'carrier: 'ups_walleted', 'service': 'UPS® Ground', 'rate': 6.72, 'deliveryDate': *datetime_object*}
+        list: A list of Candidates (see rate_candidates.py) for services that have rates.
+            Ex: Candidate('ups_walleted', 'UPS® Ground', 6.72, *datetime_object*)
     """
+    rates = order.rates
     valid_rates = []
-    for service in valid_services:
+    for service in services:
+        flags = GROUND_SAVER if service['serviceLevel'] == 'GNS' else 0
         for carrier in ["ups", "ups_walleted"]:
-            # If it's UPS Ground, handle spelling mismatch
-            if service['serviceLevelDescription'] == "UPS Ground":
-                rate = dict(order.rates[carrier]).get('UPS® Ground') # Handling spelling anamole with the name of this one service not having the little 'R' symbol
-                if rate != None:
-                    valid_rates.append({'carrierCode' : carrier, 'serviceCode': 'UPS® Ground', 'price': rate, 'deliveryDate':service['deliveryDate']})
-
-            # If it's any other service
-            else:
-                rate = dict(order.rates[carrier]).get(service['serviceLevelDescription'])
-                if rate != None:
-                    valid_rates.append({'carrierCode': carrier, 'serviceCode': service['serviceLevelDescription'], 'price': rate, 'deliveryDate':service['deliveryDate']})
+            row = rates.find(carrier, service['serviceLevelDescription'])
+            if row is not None:
+                valid_rates.append(Candidate(carrier, rates.services[row], rates.prices[row], service['deliveryDate'], service.get('dueDate'), flags))
                     
-    return valid_rates # EX: {'carrier: 'ups_walleted', 'service': 'UPS® Ground', 'rate': 6.72, 'deliveryDate': *datetime_object*}
-
+    return valid_rates
 
 
 
-def filter_for_single_stream(order, sorted_options):
-    """
-    Filter and return the best shipping option for single stream orders.
-
-    This function checks if the order is a single stream. If it is, and the first option in the 
-    sorted list of options is "UPS Ground Saver", it removes this option and returns the next best option.
-    Otherwise, it returns the first option in the sorted list.
-
-    Args:
-        order (object): An object representing the order, which must include:
-                        - `is_single_stream` (bool): Whether the order is a single stream.
-        sorted_options (list): A list of dictionaries representing sorted shipping options, 
-                            each containing at least a 'serviceCode' key.
-
-    Returns:
-        dict: The best shipping option for the order.
-    """
-    if order.is_single_stream:
-        if sorted_options[0]['serviceCode'] == "UPS Ground Saver":
-            return sorted_options[1]
-        else:
-            return sorted_options[0]
-    else:
-        return sorted_options[0]
-
-
 
-def get_ups_best_rate(order: object):
+def get_ups_candidates(order: object, deadline=None):
     """
-    Determine and return the best UPS shipping rate for a given order.
+    Return the UPS rate candidates of an order.
 
-    This function serves as the entry point for the main module, executing all necessary functions
-    within its module to return the desired result. It calculates the best shipping rate based on 
-    delivery times, customer type (residential or commercial), and pricing data from the ShipStation API.
+    Delivery times come from the UPS Time in Transit API and prices from the ShipStation API, Ground Saver is
+    added for residential orders. The deliver-by date, the single stream rules and the price comparison are
+    applied by rate_candidates.select_best_rows().
 
     Args:
         order (object): An object representing the order, which must include:
-                        - `Customer.is_residential` (bool): Whether the customer is residential.
-                        - `deliver_by_date` (str): The latest delivery date for the order.
-                        - `rates` (dict): The rate information for different carriers.
+                        - `Customer.ship_to.residential` (bool): Whether the customer is residential.
+                        - `rates` (RateTable): The rate information for different carriers.
+        deadline (float): time.monotonic() by which the UPS call has to be answered, None for no deadline.
 
     Returns:
-        dict: A dictionary containing the best UPS shipping rate with keys 'carrierCode', 
-            'serviceCode', and 'price'. Example: {'carrierCode': 'ups', 'serviceCode': 'UPS® Ground', 'price': 12.62}
-            If no valid rates are found, returns None.
+        list: The Candidates of both UPS accounts. None if the order has no UPS rates, False if UPS could not be reached.
     """
-
-    services = get_delivery_times(order)
-
-    # A list of all services that will arrive on or before the latest delivery date
-    valid_services = get_valid_services(order, services)
-
-    # Ground Saver delivery estimates not provided by UPS api, add for residential orders
-    if order.Customer.ship_to.residential and not order.is_single_stream:
-        valid_services = add_ground_saver_to_list(valid_services)
-
-    #print(f"valid_services = {valid_services}")
-
     # Ensure that rates exists for each of the UPS accounts
     list_of_carriers = [carrier for carrier in order.rates.keys() if carrier in ["ups", "ups_walleted"]]
     if not list_of_carriers:
         return None
 
-    # A list of dictionaries representing the services AND thier true price rates based on Shipstation API Data
-    valid_rates = get_valid_rates(order, valid_services)
+    services = get_transit_services(order, deadline)
+    if services is None:
+        return False
 
-    sorted_options = sorted(valid_rates, key=lambda x: x['price']) if valid_rates else None
-    # Apply desired business logic
-    best_option = filter_for_single_stream(order, sorted_options)
+    services = set_delivery_dates(services)
+
+    # Ground Saver delivery estimates not provided by UPS api, add for residential orders
+    if order.Customer.ship_to.residential and not order.is_single_stream:
+        services = add_ground_saver_to_list(services)
 
-    if best_option:
-        # No longer needed, remove to keep data clean
-        best_option.pop('deliveryDate')
-        ups_best_rate = best_option
-    return ups_best_rate
+    # The services AND thier true price rates based on Shipstation API Data
+    return get_valid_rates(order, services)
 
 
 
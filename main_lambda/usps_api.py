@@ -1,47 +1,58 @@
 import xml.etree.ElementTree as ET
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import xmltodict
 from datetime import datetime, timezone, timedelta
-import boto3
-from botocore.exceptions import ClientError
 import json
+from secrets_provider import get_secret, invalidate_secret
+from transit_cache import transit_cache, lane_key
+from reference_data import get_reference_data
+from rate_candidates import Candidate, select_best_rate, DELIVER_BY_FORMAT, get_request_timeout
 
 
-def get_secret(secret_name):
-    """
-    Retrieve the API key and secret from AWS Secrets Manager.
+USPS_API_URL = os.environ.get('USPS_API_URL', 'https://secure.shippingapis.com/shippingapi.dll')
 
-    Parameters:
-    secret_name (str): The name of the secret in AWS Secrets Manager.
+# Connection pool, timeout and retry settings of the USPS session
+USPS_POOL_SIZE = int(os.environ.get('USPS_POOL_SIZE', '10'))
+USPS_CONNECT_TIMEOUT = float(os.environ.get('USPS_CONNECT_TIMEOUT', '3.05'))
+USPS_READ_TIMEOUT = float(os.environ.get('USPS_READ_TIMEOUT', '10'))
+USPS_MAX_RETRIES = int(os.environ.get('USPS_MAX_RETRIES', '2'))
 
-    Returns:
-    tuple: A tuple containing the api_key and api_secret as strings.
-    """
-    # Create a Secrets Manager client
-    client = boto3.client('secretsmanager')
 
-    try:
-        # Get the secret value from Secrets Manager
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
 
-        # Parse the secret JSON string and extract the keys
-        secret_dict = json.loads(get_secret_value_response['SecretString'])
-        api_key = secret_dict['username']
-        api_secret = secret_dict['password']
+def create_usps_session():
+    '''
+    Creates the session used for USPS API calls.
 
-        return api_key, api_secret
+    Connections to secure.shippingapis.com are kept alive in a pool sized for the concurrent
+    rate lookups, so only the first call of a warm container pays the TCP + TLS handshake.
+    Connection errors and 5xx answers are retried with exponential backoff.
+    '''
+    retry = Retry(
+        total=USPS_MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET", "POST"],  # SDCGetLocations is a read-only lookup, safe to retry
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=USPS_POOL_SIZE, max_retries=retry)
 
-    except ClientError as e:
-        # Handle the error accordingly
-        raise e
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
 
+# Shared by every USPS call of the container
+usps_session = create_usps_session()
+
 
 def get_credentials():
     try:
         #load_dotenv()
-        username, password = get_secret('uspsAPICredentials')
+        username, password = get_secret('uspsAPICredentials', 'username', 'password')
 
     except Exception as e:
         print("[X] Error getting credentials form secretsmanager!")
@@ -224,12 +235,13 @@ def get_todays_date():
 
 
 
-def get_usps_response(ship_date, from_zip, dest_zip):
+def get_usps_response(ship_date, from_zip, dest_zip, deadline=None):
     """
     Fetches USPS API response for shipping locations based on the destination ZIP code.
 
     Parameters:
     - dest_zip (str): The destination ZIP code for which shipping locations are requested.
+    - deadline (float): time.monotonic() the timeouts are capped at, None for the USPS_*_TIMEOUT settings only.
 
     Returns:
     - dict or None: A dictionary containing the parsed XML response if successful, or None if an error occurs.
@@ -253,7 +265,7 @@ def get_usps_response(ship_date, from_zip, dest_zip):
     
     username, password = get_credentials()
     # Documentiation: https://www.usps.com/business/web-tools-apis/sdc-getlocations-api.pdf
-    uri = "https://secure.shippingapis.com/shippingapi.dll?API=SDCGetLocations&XML="
+    uri = f"{USPS_API_URL}?API=SDCGetLocations&XML="
 
     if ship_date is None:
         ship_date = datetime.now().strftime('%Y-%m-%d')
@@ -267,8 +279,12 @@ def get_usps_response(ship_date, from_zip, dest_zip):
     url = uri+xml_payload
 
     try:
-        response = requests.post(url)
-        
+        response = usps_session.post(url, timeout=get_request_timeout(deadline, (USPS_CONNECT_TIMEOUT, USPS_READ_TIMEOUT)))
+
+        # Credentials may have been rotated, make the next lookup fetch them again
+        if response.status_code == 401:
+            invalidate_secret('uspsAPICredentials')
+
         #if status is not in 200 range then raise error
         response.raise_for_status()
 
@@ -282,246 +298,161 @@ def get_usps_response(ship_date, from_zip, dest_zip):
             print(f"[!] Warning USPS response status is: {response.status_code}")
             print(f"Response text --> {response.text}")
 
-    except:
+    except Exception as e:
+        # No response to show when the connection failed or timed out
         print("[X] Error fetching XML Response from USPS")
-        print(response.status_code)
-        print(response.text)
+        print(e)
         return None
 
 
 
-def is_delivery_before_latest(delivery_date, latest_delivery_date):
+def get_due_date(delivery_date):
     """
-    Checks if a delivery date is before or on the latest delivery date, accounting for time zones.
+    Returns the time a USPS delivery date is compared with the deliver-by date, accounting for time zones.
 
     Parameters:
-    - delivery_date (str): The delivery date in the format 'YYYY-MM-DD'.
-    - latest_delivery_date (str): The latest delivery date in the format 'YYYY-MM-DDTHH:MM:SSZ',
-    where 'THH:MM:SSZ' represents the time in UTC.
+    - delivery_date (datetime): The delivery date, at midnight EST.
 
     Returns:
-    - bool: True if the delivery date is before or on the latest delivery date, False otherwise.
-
-    This function converts the date strings to datetime objects and compares them,
-    considering time zones to ensure accurate date comparisons.
+    - datetime: The delivery date in UTC (the deliver-by date is in UTC), without tzinfo like the deliver-by date
+    rate_candidates.py parses.
     """
-    # Convert delivery_date to datetime object with correct format
-    delivery_dt = datetime.strptime(delivery_date, '%Y-%m-%d')
-
-    # Convert latest_delivery_date to datetime object with correct format
-    latest_delivery_dt = datetime.strptime(latest_delivery_date, '%m/%d/%Y %H:%M:%S')
-
     # Convert delivery date to UTC timezone (assuming delivery_date is in EST)
-    delivery_dt_utc = delivery_dt.replace(tzinfo=timezone.utc) - timedelta(hours=5)
-
-    # Convert latest_delivery_date to UTC timezone (assuming UTC time zone)
-    latest_delivery_dt_utc = latest_delivery_dt.replace(tzinfo=timezone.utc)
+    return delivery_date - timedelta(hours=5)
 
-    # Compare the dates
-    return delivery_dt_utc <= latest_delivery_dt_utc
 
 
-
-def get_valid_options(usps_response, latest_delivery_date):
+def get_shipping_options(ship_date, from_zip, dest_zip, deadline=None):
     """
-    Filters and returns valid shipping options based on USPS response and a latest delivery date.
+    Returns the expedited and standard USPS shipping options of a lane.
 
     Parameters:
-    - usps_response (dict): A dictionary containing USPS shipping options data.
-    - latest_delivery_date (str): The latest acceptable delivery date in 'YYYY-MM-DD' format.
+    - ship_date (str): The ship date in 'YYYY-MM-DD' format.
+    - from_zip (str): The origin ZIP code.
+    - dest_zip (str): The destination ZIP code.
+    - deadline (float): time.monotonic() by which USPS has to answer, None for no deadline.
 
     Returns:
-    - list: A list of dictionaries representing valid shipping options.
-    Each dictionary contains shipping option details such as DeliveryDate, MailClass, etc.
-
-    This function first filters expedited and standard shipping options from the USPS response.
-    It then combines these options into one list and eliminates options that won't arrive on time
-    based on the latest delivery date provided.
+    - list or None: A list of dictionaries representing the shipping options, None if USPS could not be reached.
 
-    Note: The functions get_exp_options and get_standard_options are assumed to be defined elsewhere
-    and are used to filter expedited and standard options from the USPS response, respectively.
+    The options are served from the transit cache when the lane was already looked up, otherwise
+    they are fetched with get_usps_response() and parsed with get_exp_options and get_standard_options.
     """
+    def fetch():
+        usps_response = get_usps_response(ship_date, from_zip, dest_zip, deadline)
+        if usps_response is None:
+            return None
 
-    #get expedited and standard options
-    filtered_expidited_options = get_exp_options(usps_response)
+        #get expedited and standard options, combined into one list
+        return get_exp_options(usps_response) + get_standard_options(usps_response)
 
-    filtered_standard_options = get_standard_options(usps_response)
-    
+    return transit_cache.get_or_fetch("usps", lane_key(from_zip, dest_zip, ship_date), fetch)
 
-    #combine options into one list
-    shipping_options = filtered_expidited_options + filtered_standard_options
-    #print(f"Shipping Options = {shipping_options}")
 
-    valid_shipping_options = []
-    #eliminate shipping options that wont arrive on time
-    for option in shipping_options:
 
-        delivery_date = option["DeliveryDate"]
-
-        # If this shippment will arrive on time, append to list
-        if is_delivery_before_latest(delivery_date, latest_delivery_date):
-            # Convert to datetime for future comparisons
-            option["DeliveryDate"] = datetime.strptime(delivery_date, "%Y-%m-%d")
-            valid_shipping_options.append(option)
-
-    return valid_shipping_options
-
-
-
-def get_delivery_date(service_name: str, valid_shipping_options: list):
+def format_valid_options(order, shipping_options: list):
     """
-    Get the delivery date for a specified service name from a list of valid shipping options.
-
-    Parameters:
-    - service_name (str): The name of the shipping service to find the delivery date for.
-    - valid_shipping_options (list): A list of dictionaries representing valid shipping options.
-    Each dictionary should have keys 'MailClass' and 'DeliveryDate' indicating the mail class
-    and its corresponding delivery date.
-
-    Returns:
-    - str: The delivery date for the specified service name.
-
-    Raises:
-    - KeyError: If the service name is not found in the valid shipping options.
-    """
-    for option in valid_shipping_options:
-
-        # If this shipping option is the one we want
-        if option["MailClass"] == service_name:
-            return option["DeliveryDate"]
-        
-        else:
-            # Keep looking for the shipping option we want the Delivery Date for
-            continue
-
-    # If Shipstation shipping service not in USPS API options
-    return None
-
-
-
-
-def format_valid_options(order, valid_shipping_options: list):
-    """
-    Filters and formats valid shipping options based on USPS rates and delivery dates.
+    Combines the USPS rates with the USPS delivery dates.
 
     Parameters:
     - order: The order object containing shipping rates information.
-    - valid_shipping_options (list): A list of valid shipping options with delivery dates.
+    - shipping_options (list): The shipping options from get_shipping_options().
 
     Returns:
-    - list: A list of dictionaries representing filtered and formatted valid shipping options.
-    Each dictionary contains the following keys:
-        - 'service_name': The name of the shipping service.
-        - 'price': The price of the shipping service.
-        - 'delivery_date': The delivery date of the shipping service.
-
-    The function iterates through USPS rates and formats valid shipping options based on specific conditions.
-    If a shipping option matches certain criteria, its name, price, and delivery date are added to the result list.
+    - list: A list of Candidates (see rate_candidates.py), one per ShipStation USPS rate with a delivery date.
+
+    The function iterates through USPS rates and looks up the delivery date of each one's USPS API service,
+    taken from the first option of that service that arrives by the deliver-by date. Rates of services
+    without such an option are left out.
     """
 
-    # Define a mapping of ShipStation Service Names (keys) to their respective USPS API service names (values)
-    service_delivery_mapping = {
-        'USPS First Class Mail - Large Envelope or Flat': 'USPS Ground Advantage',
-        'USPS First Class Mail - Package': 'USPS Ground Advantage',
-        'USPS Priority Mail - Package': 'Priority Mail 2-Day',
-        'USPS Priority Mail Express - Package': 'Priority Mail Express 2-Day',
-        'USPS Ground Advantage - Package': 'USPS Ground Advantage',
-    }
+    # ShipStation service ids (see service_registry.py) and their respective USPS API service names
+    service_delivery_mapping = get_reference_data().usps_delivery_services
 
-    # Initialize container for the formatted options: dicts
+    # Initialize container for the candidates
     formatted_options_list = []
 
-    usps_rates_list = order.rates["stamps_com"]
-
-    for option in usps_rates_list:
-        service_name = option[0]
-        price = option[1]
-
-        if service_name in service_delivery_mapping:
-            delivery_date = get_delivery_date(service_delivery_mapping[service_name], valid_shipping_options)
-            formatted_options_list.append({
-                "service_name": service_name,
-                "price": price,
-                "delivery_date": delivery_date
-            })
-
-    return formatted_options_list
-
-
-
+    # Delivery date of every USPS API service: the first option of a MailClass that arrives on time
+    latest_delivery_date = datetime.strptime(order.deliver_by_date, DELIVER_BY_FORMAT)
+    delivery_dates = {}
+    for option in shipping_options:
+        if option["MailClass"] in delivery_dates:
+            continue
+        delivery_date = datetime.strptime(option["DeliveryDate"], "%Y-%m-%d")
+        if get_due_date(delivery_date) <= latest_delivery_date:
+            delivery_dates[option["MailClass"]] = delivery_date
 
-def compare_prices(formated_options: list):
-    # Filter options with non-None delivery dates
-    filtered_options = [option for option in formated_options if option['delivery_date'] is not None]
+    rates = order.rates
+    for row in rates.rows("stamps_com"):
+        service_id = rates.service_ids[row]
 
-    if filtered_options:
-        # Find the option with the minimum price
-        sorted_options = sorted(filtered_options, key=lambda x: x['price'])
-        #print(f"sorted options = {sorted_options}")
-        # Desired business logic. Willing to ship up to $0.35 more expensive if package arrives earlier than the cheapest shipping rate
-        better_options = [option for option in sorted_options if option['price'] - sorted_options[0]['price'] < 0.35 and option['delivery_date'] < sorted_options[0]['delivery_date']]
-        best_option = min(better_options, key=lambda x: x['deliveryDate']) if better_options else sorted_options[0]
+        if service_id in service_delivery_mapping:
+            delivery_date = delivery_dates.get(service_delivery_mapping[service_id])
+            if delivery_date is None:
+                continue
 
-        # Convert answer to dict
-        if best_option:
-            best_option = {"carrierCode": "stamps_com", "serviceCode": best_option["service_name"], "price": best_option["price"]}
+            formatted_options_list.append(Candidate(
+                "stamps_com", rates.services[row], rates.prices[row], delivery_date, get_due_date(delivery_date)
+            ))
 
-        return best_option
-    else:
-        print("No valid options with delivery dates for USPS.")
-        return None
+    return formatted_options_list
 
 
 
-def get_usps_best_rate(order):
+def get_usps_candidates(order, deadline=None):
     """
-    Calculates and returns the best USPS shipping rate for an order.
+    Returns the USPS rate candidates of an order.
 
     Parameters:
     - order (Order): An object of the Order class containing order details.
+    - deadline (float): time.monotonic() by which USPS has to answer, None for no deadline.
 
     Returns:
-    - tuple or None: A tuple containing the best shipping option and its price, or None if USPS rates are not applicable for the order.
-
-    This function handles the main workflow for calculating the best USPS shipping rate for an order. It checks if USPS rates are applicable for the order. If not, it returns None. 
-    If rates are expected but not retrieved, it returns False. 
-    Otherwise, it retrieves USPS delivery estimates, filters valid shipping options that will arrive on time, 
-    formats the options, compares prices, and returns the best shipping option and its price.
-
+    - list or None: The Candidates, None if USPS rates are not applicable for the order, False if USPS delivery
+    estimates could not be retrieved.
     """
 
     # Ensure that USPS is applicable for this order
-    rate_is_applicable = order.rates.get("stamps_com", False)
-    if not rate_is_applicable:
+    if "stamps_com" not in order.rates:
         return None
     
     destination_zip = order.Customer.ship_to.postal_code[:5]
     from_zip = order.Shipment.warehouse.postal_code
     ship_date = order.Shipment.ship_date
 
-    #get USPS delivery estimates response for the order
-    usps_response = get_usps_response(ship_date, from_zip, destination_zip)
+    #get USPS delivery estimates for the order
+    shipping_options = get_shipping_options(ship_date, from_zip, destination_zip, deadline)
     
     # If not able to get valid USPS response, break from this function
-    if usps_response == None:
+    if shipping_options == None:
         return False
 
+    # Get list of options that combined SS_rates with USPS_delivery times
+    return format_valid_options(order, shipping_options)
 
-    # Get list of options that will arrive on time
-    valid_shipping_options = get_valid_options(usps_response, order.deliver_by_date)
-    # print("---Valid USPS API Shipping Options---\n")
-    # print(valid_shipping_options)
 
-    # Get list of options that combined SS_rates with USPS_delivery times
-    formated_options = format_valid_options(order, valid_shipping_options)
-    # print("---Formatted USPS API Shipping Options---\n")
-    # print(formated_options)
 
+def get_usps_best_rate(order):
+    """
+    Calculates and returns the best USPS shipping rate for an order.
 
-    # Find the lowest price from the valid options
-    best_shipping_option = compare_prices(formated_options)
-    #print(f"Best Price --->  {best_shipping_option}\n")
-    #print(best_shipping_option)
+    Parameters:
+    - order (Order): An object of the Order class containing order details.
+
+    Returns:
+    - dict or None: The best shipping option, or None if USPS rates are not applicable for the order or none
+    arrives on time. False if USPS delivery estimates could not be retrieved.
+
+    The candidates of get_usps_candidates() are compared by rate_candidates.select_best_rows(), which also
+    applies the $0.35 rule for earlier arriving options.
+    """
+    candidates = get_usps_candidates(order)
+    if candidates is None or candidates is False:
+        return candidates
+
+    best_shipping_option = select_best_rate(order, candidates)
+    if best_shipping_option is None:
+        print("No valid options with delivery dates for USPS.")
 
     return best_shipping_option # Example: {'carrierCode': 'stamps_com', 'serviceCode': 'USPS First Class Mail - Package', 'price': 4.31}
 
@@ -0,0 +1,101 @@
+'''
+Decoder of the compact order messages produced by sp_batch_lambda/wire_encoder.py.
+
+    {"v": 1, "order": {...}}
+
+The message is turned into the Order, Shipment, Customer, Address and Item objects in a single pass
+over the parsed JSON, without the json.dumps / json.loads round trip and dict rebuilding of the legacy
+path (init_object.init_order). Fields the producer left out because they were None are passed as None
+when the dataclass requires them, and left to the dataclass default otherwise.
+'''
+
+from dataclasses import fields, MISSING
+from classes import Address, Item, Shipment, Customer, Order
+
+WIRE_FORMAT_VERSION = 1
+
+_init_fields = {}  # dataclass -> (required field names, optional field names)
+
+
+
+def get_init_fields(cls):
+    spec = _init_fields.get(cls)
+    if spec is None:
+        required, optional = [], []
+        for field in fields(cls):
+            if not field.init:
+                continue
+            if field.default is MISSING and field.default_factory is MISSING:
+                required.append(field.name)
+            else:
+                optional.append(field.name)
+        spec = _init_fields[cls] = (tuple(required), tuple(optional))
+    return spec
+
+
+
+def build(cls, values, **overrides):
+    """
+    Instantiates a dataclass from the encoded values, ignoring keys the class doesn't have.
+    """
+    required, optional = get_init_fields(cls)
+    kwargs = {name: values.get(name) for name in required}
+    for name in optional:
+        if name in values:
+            kwargs[name] = values[name]
+    kwargs.update(overrides)
+    return cls(**kwargs)
+
+
+
+def is_compact(message):
+    """
+    Tells a compact message apart from a legacy Order.as_dict() message.
+    """
+    return isinstance(message, dict) and "v" in message and "order" in message
+
+
+
+def decode_order(message, ss_client=None, fedex_session=None, ups_session=None):
+    """
+    Builds the Order of a compact message.
+
+    Args:
+        message (dict): The parsed message body.
+        ss_client, fedex_session, ups_session: The API sessions the order is processed with.
+
+    Returns:
+        Order: The order object.
+
+    Raises:
+        ValueError: If the message has a wire format version this decoder doesn't know.
+    """
+    if message.get("v") != WIRE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported order wire format version: {message.get('v')}")
+
+    data = message["order"]
+
+    shipment_data = data.get("Shipment", {})
+    shipment = build(Shipment, shipment_data, warehouse=build(Address, shipment_data.get("warehouse", {})))
+
+    customer_data = data.get("Customer", {})
+    customer = build(
+        Customer,
+        customer_data,
+        bill_to=build(Address, customer_data.get("bill_to", {})),
+        ship_to=build(Address, customer_data.get("ship_to", {}))
+    )
+
+    items = [build(Item, item) for item in data.get("items", [])]
+
+    return build(
+        Order,
+        data,
+        Shipment=shipment,
+        Customer=customer,
+        items=items,
+        ss_client=ss_client,
+        fedex_session=fedex_session,
+        ups_session=ups_session,
+        order_data_raw=data
+    )
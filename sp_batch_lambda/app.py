@@ -2,26 +2,48 @@ import json
 import traceback
 
 # Local Imports
-from main import process_batch
+from main import process_batch, process_webhook
+
+
+def handle_webhook(event):
+    '''
+    Handles a ShipStation webhook POSTed through API Gateway to /webhook/{uniqueid}.
+
+    Only ORDER_NOTIFY webhooks are acted on, other resource types are acknowledged and ignored so
+    ShipStation doesn't keep retrying them.
+    '''
+    # Extract the unique ID from pathParameters
+    unique_id = (event.get('pathParameters') or {}).get('uniqueid')
+
+    # Extract the body and parse it as JSON
+    body = json.loads(event.get('body') or '{}')
+    resource_url = body.get('resource_url')
+    resource_type = body.get('resource_type')
+
+    if resource_type != 'ORDER_NOTIFY' or not resource_url:
+        print(f"[!] Ignoring webhook of type {resource_type}")
+        return {'statusCode': 200, 'body': json.dumps({'message': f"Ignored {resource_type} webhook"})}
+
+    try:
+        result = process_webhook(unique_id, resource_url)
+    except ValueError as e:
+        print(f"[X] {e}")
+        return {'statusCode': 400, 'body': json.dumps({'message': str(e)})}
+
+    if 'statusCode' in result:
+        return result
+    return {'statusCode': 200, 'body': json.dumps(result)}
+
 
 def lambda_handler(event, context):
     try:
-        # # Extract the unique ID from pathParameters
-        # unique_id = event['pathParameters']['uniqueid']
-        
-        # # Extract the body and parse it as JSON
-        # body = json.loads(event['body'])
-        # resource_url = body['resource_url']
-
-        # # if unique_id == '12345' and resource_url == 'test':
-        # #     return {
-        # #         'statusCode': 200,
-        # #         'body': json.dumps({'message': 'Test successful'}),x
-        # #     }
-        
-        # # Pass the unique ID, resource URL, and resource type to the main processing function
-        #processed_orders = process_batch(unique_id, resource_url)
-        processed_orders = process_batch()
+        # API Gateway events are webhooks, scheduled / direct invocations run the polling sweep
+        if isinstance(event, dict) and 'httpMethod' in event:
+            return handle_webhook(event)
+
+        # {"sync_mode": "full"} forces a full reconciliation run, see main.plan_sync()
+        sync_mode = event.get('sync_mode') if isinstance(event, dict) else None
+        processed_orders = process_batch(sync_mode=sync_mode)
 
         # Return a successful response
         return {
@@ -0,0 +1,103 @@
+'''
+Persistence of the order sync checkpoint of the batch Lambda.
+
+The checkpoint is a small dict:
+    modify_date      Highest ShipStation modifyDate seen by a completed run (ShipStation's own format and
+                     time zone, e.g. "2024-05-01T12:34:56.1230000")
+    last_full_sync   Unix time the last full reconciliation run started
+    updated_at       Unix time the checkpoint was written
+
+It is kept in the CHECKPOINT_TABLE DynamoDB table, or in the CHECKPOINT_FILE JSON file for local runs.
+Without either, every run is a full run. Both stores refuse to move modify_date backwards, so an older
+run finishing late can't undo the progress of a newer one.
+'''
+
+import json
+import os
+
+import boto3
+
+CHECKPOINT_TABLE = os.environ.get('CHECKPOINT_TABLE')
+CHECKPOINT_FILE = os.environ.get('CHECKPOINT_FILE')
+CHECKPOINT_ID = os.environ.get('CHECKPOINT_ID', 'sporticulture-awaiting-shipment')
+
+
+
+class DynamoDBCheckpointStore:
+    """
+    Checkpoint stored as one item of a DynamoDB table with the string partition key checkpoint_id.
+    """
+
+    def __init__(self, table_name, checkpoint_id=CHECKPOINT_ID):
+        self.table = boto3.resource('dynamodb').Table(table_name)
+        self.checkpoint_id = checkpoint_id
+
+    def load(self):
+        item = self.table.get_item(Key={'checkpoint_id': self.checkpoint_id}, ConsistentRead=True).get('Item', {})
+        checkpoint = {key: value for key, value in item.items() if key != 'checkpoint_id'}
+        # Numbers come back as Decimal
+        for key in ('last_full_sync', 'updated_at'):
+            if key in checkpoint:
+                checkpoint[key] = float(checkpoint[key])
+        return checkpoint
+
+    def save(self, checkpoint):
+        item = {'checkpoint_id': self.checkpoint_id}
+        for key, value in checkpoint.items():
+            item[key] = int(value) if isinstance(value, float) else value
+
+        try:
+            self.table.put_item(
+                Item=item,
+                ConditionExpression='attribute_not_exists(modify_date) OR modify_date <= :modify_date',
+                ExpressionAttributeValues={':modify_date': checkpoint.get('modify_date') or ''},
+            )
+            return True
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            print(f"[!] Checkpoint {self.checkpoint_id} has moved past {checkpoint.get('modify_date')}, not saved")
+            return False
+
+
+
+class FileCheckpointStore:
+    """
+    Checkpoint stored in a local JSON file, replaced atomically on every save.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"[!] Could not load the checkpoint from {self.file_path}: {e}")
+            return {}
+
+    def save(self, checkpoint):
+        current = self.load().get('modify_date')
+        if current and current > (checkpoint.get('modify_date') or ''):
+            print(f"[!] Checkpoint in {self.file_path} has moved past {checkpoint.get('modify_date')}, not saved")
+            return False
+
+        # Write to a temporary file first so a concurrent reader never sees a partial file
+        temp_path = f"{self.file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(temp_path, self.file_path)
+        return True
+
+
+
+def get_checkpoint_store():
+    """
+    Returns the checkpoint store configured by CHECKPOINT_TABLE or CHECKPOINT_FILE, None if there is none.
+    """
+    if CHECKPOINT_TABLE:
+        return DynamoDBCheckpointStore(CHECKPOINT_TABLE)
+    if CHECKPOINT_FILE:
+        return FileCheckpointStore(CHECKPOINT_FILE)
+    return None
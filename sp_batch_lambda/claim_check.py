@@ -0,0 +1,178 @@
+'''
+Claim-check handling of large order message bodies, shared by the batch Lambda (producer) and the main
+Lambda (consumer).
+
+Bodies below MESSAGE_COMPRESS_THRESHOLD bytes are sent as they are. Larger bodies are gzipped and sent
+inline as base64:
+    {"claim_check": {"v": 1, "encoding": "gzip+base64", "data": "..."}}
+
+If the inline envelope is still over MESSAGE_OFFLOAD_THRESHOLD bytes, the gzipped body is written to the
+payload store and only a pointer is enqueued:
+    {"claim_check": {"v": 1, "encoding": "gzip", "location": "s3://bucket/key", "size": 1234, "sha256": "..."}}
+
+The payload store is the ORDER_PAYLOAD_BUCKET S3 bucket, or the LOCAL_PAYLOAD_DIR directory as a stand-in
+for offline runs. Stored payloads are named after their content hash, so sending the same order again
+rewrites the same object. They are removed by the bucket's lifecycle rule, not by the consumer, so a
+redelivered message can still be resolved.
+'''
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import boto3
+
+CLAIM_CHECK_VERSION = 1
+
+# Body sizes in bytes. SQS rejects messages over 256 KB, body and attributes included
+MESSAGE_COMPRESS_THRESHOLD = int(os.environ.get('MESSAGE_COMPRESS_THRESHOLD', str(64 * 1024)))
+MESSAGE_OFFLOAD_THRESHOLD = int(os.environ.get('MESSAGE_OFFLOAD_THRESHOLD', str(192 * 1024)))
+
+ORDER_PAYLOAD_BUCKET = os.environ.get('ORDER_PAYLOAD_BUCKET')
+ORDER_PAYLOAD_PREFIX = os.environ.get('ORDER_PAYLOAD_PREFIX', 'orders/')
+LOCAL_PAYLOAD_DIR = os.environ.get('LOCAL_PAYLOAD_DIR')
+
+_s3_client = None
+_lock = threading.Lock()
+
+
+
+def get_s3_client():
+    """
+    Returns the S3 client shared by the container, creating it on first use.
+    """
+    global _s3_client
+    with _lock:
+        if _s3_client is None:
+            _s3_client = boto3.client('s3')
+    return _s3_client
+
+
+
+def put_payload(name, data):
+    """
+    Writes a payload to the payload store.
+
+    Args:
+        name (str): Name of the payload within the store, e.g. "orders/123/ab12cd.json.gz".
+        data (bytes): The payload.
+
+    Returns:
+        str: The location of the payload, "s3://bucket/key" or "file:///path".
+
+    Raises:
+        RuntimeError: If neither ORDER_PAYLOAD_BUCKET nor LOCAL_PAYLOAD_DIR is configured.
+    """
+    if ORDER_PAYLOAD_BUCKET:
+        get_s3_client().put_object(Bucket=ORDER_PAYLOAD_BUCKET, Key=name, Body=data, ContentEncoding='gzip',
+                                   ContentType='application/json')
+        return f"s3://{ORDER_PAYLOAD_BUCKET}/{name}"
+
+    if LOCAL_PAYLOAD_DIR:
+        file_path = os.path.abspath(os.path.join(LOCAL_PAYLOAD_DIR, name))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, file_path)
+        return f"file://{file_path}"
+
+    raise RuntimeError("No payload store configured, set ORDER_PAYLOAD_BUCKET or LOCAL_PAYLOAD_DIR")
+
+
+
+def get_payload(location):
+    """
+    Reads a payload written by put_payload.
+
+    Args:
+        location (str): "s3://bucket/key" or "file:///path".
+
+    Returns:
+        bytes: The payload.
+    """
+    if location.startswith('s3://'):
+        bucket, _, key = location[len('s3://'):].partition('/')
+        return get_s3_client().get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    if location.startswith('file://'):
+        with open(location[len('file://'):], 'rb') as file:
+            return file.read()
+
+    raise ValueError(f"Unsupported payload location: {location}")
+
+
+
+def pack_message_body(body, name):
+    """
+    Returns the body to enqueue for a message: the body itself, an inline gzip envelope or a pointer to
+    the payload store, depending on its size.
+
+    Args:
+        body (str): The JSON message body.
+        name (str): Identifies the message in the payload store, e.g. the order id.
+
+    Returns:
+        str: The message body to send.
+    """
+    raw = body.encode('utf-8')
+    if len(raw) < MESSAGE_COMPRESS_THRESHOLD:
+        return body
+
+    compressed = gzip.compress(raw, compresslevel=6)
+    envelope = json.dumps({"claim_check": {
+        "v": CLAIM_CHECK_VERSION,
+        "encoding": "gzip+base64",
+        "data": base64.b64encode(compressed).decode('ascii'),
+    }})
+    if len(envelope) < MESSAGE_OFFLOAD_THRESHOLD:
+        return envelope
+
+    digest = hashlib.sha256(raw).hexdigest()
+    location = put_payload(f"{ORDER_PAYLOAD_PREFIX}{name}/{digest[:16]}.json.gz", compressed)
+    print(f"[+] Message {name} is {len(raw)} bytes, stored at {location}")
+    return json.dumps({"claim_check": {
+        "v": CLAIM_CHECK_VERSION,
+        "encoding": "gzip",
+        "location": location,
+        "size": len(raw),
+        "sha256": digest,
+    }})
+
+
+
+def unpack_message_body(body):
+    """
+    Returns the original message body of a message sent with pack_message_body. Bodies that aren't
+    claim-check envelopes are returned unchanged.
+
+    Args:
+        body (str): The body of the SQS message.
+
+    Returns:
+        str: The JSON message body.
+
+    Raises:
+        ValueError: If the envelope version or encoding is unknown, or the stored payload doesn't match its hash.
+    """
+    # Prefix check so plain order bodies aren't parsed an extra time
+    if not body.startswith('{"claim_check"'):
+        return body
+
+    envelope = json.loads(body)['claim_check']
+    if envelope.get('v') != CLAIM_CHECK_VERSION:
+        raise ValueError(f"Unsupported claim check version: {envelope.get('v')}")
+
+    if envelope['encoding'] == 'gzip+base64':
+        return gzip.decompress(base64.b64decode(envelope['data'])).decode('utf-8')
+
+    if envelope['encoding'] == 'gzip':
+        raw = gzip.decompress(get_payload(envelope['location']))
+        if envelope.get('sha256') and hashlib.sha256(raw).hexdigest() != envelope['sha256']:
+            raise ValueError(f"Payload at {envelope['location']} doesn't match its sha256")
+        return raw.decode('utf-8')
+
+    raise ValueError(f"Unsupported claim check encoding: {envelope['encoding']}")
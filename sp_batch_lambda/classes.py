@@ -1,6 +1,8 @@
 from dataclasses import dataclass, field, asdict
 from typing import Optional, List, Dict, Union, Any
 from datetime import datetime, timedelta
+from trading_partners import get_trading_partner
+from reference_data import get_reference_data, set_address
 
 
 @dataclass
@@ -100,6 +102,7 @@ class Order:
     webhook_batch_id:                   str
     shipstation_account:                str
     warehouse_name:                     Dict[str, str]
+    trading_partner:                    str = field(init=False)
     deliver_by_date:                    str = field(init=False)
     is_multi_order:                     bool = False
     is_double_order:                    bool = False
@@ -116,52 +119,15 @@ class Order:
 
         # Modify Shipment based on warehouse value
         self.update_shipment_based_on_warehouse()
+        # Same rules as main_lambda's Order.set_trading_partner
+        self.trading_partner = get_trading_partner(self.store_name, self.order_number)
 
     def update_shipment_based_on_warehouse(self):
         if self.warehouse_name['warehouse'] is not None:
             # Initialize warehouse attributes using warehouse name
-            if self.warehouse_name['warehouse'] == "SHIPPING DEPARTMENT":
-                self.Shipment.warehouse.postal_code = "46203"
-                self.Shipment.warehouse.city = "INDIANAPOLIS"
-                self.Shipment.warehouse.state = "IN"
-                self.Shipment.warehouse.country = "US"
-                self.Shipment.warehouse.street1 = "1435 E NAOMI ST"
-                self.Shipment.warehouse.phone = "3174064033"
-                self.Shipment.warehouse.residential = False
-                self.Shipment.warehouse.name = "SHIPPING DEPARTMENT"
-            
-            # Shipping values are same as 'stallion'
-            elif self.warehouse_name['warehouse'] == "Winning Streak":
-                self.Shipment.warehouse.postal_code = "46203"
-                self.Shipment.warehouse.city = "INDIANAPOLIS"
-                self.Shipment.warehouse.state = "IN"
-                self.Shipment.warehouse.country = "US"
-                self.Shipment.warehouse.street1 = "1435 E NAOMI ST"
-                self.Shipment.warehouse.phone = "3174064033"
-                self.Shipment.warehouse.residential = False
-                self.Shipment.warehouse.name = "SHIPPING DEPARTMENT"
-
-            # Shipping values are same as 'stallion'
-            elif self.warehouse_name['warehouse'] == "Stallion Wholesale":
-                self.Shipment.warehouse.postal_code = "46203"
-                self.Shipment.warehouse.city = "INDIANAPOLIS"
-                self.Shipment.warehouse.state = "IN"
-                self.Shipment.warehouse.country = "US"
-                self.Shipment.warehouse.street1 = "1435 E NAOMI ST"
-                self.Shipment.warehouse.phone = "4432667788"
-                self.Shipment.warehouse.residential = False
-                self.Shipment.warehouse.name = "SHIPPING DEPARTMENT"
-
-            
-            elif self.warehouse_name['warehouse'] == "Sporticulture":
-                self.Shipment.warehouse.postal_code = "21738"
-                self.Shipment.warehouse.city = "Glenwood"
-                self.Shipment.warehouse.state = "MD"
-                self.Shipment.warehouse.country = "US"
-                self.Shipment.warehouse.street1 = "14812 Burntwoods Road"
-                self.Shipment.warehouse.phone = "4432667788"
-                self.Shipment.warehouse.residential = False
-                self.Shipment.warehouse.name = "Warehouse Location 1"
+            address = get_reference_data().get_address_by_warehouse_name(self.warehouse_name['warehouse'])
+            if address is not None:
+                set_address(self.Shipment.warehouse, address)
 
     # Used to help convert to JSON later
     def as_dict(self):
@@ -1,9 +1,33 @@
-import boto3
-import json, time
-from botocore.exceptions import ClientError
+import json, os, random, time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # imported from shipstation_layer (lambda layer)
 from shipstation_api import ShipStation
+from secrets_provider import get_secret
+from wire_encoder import encode_order
+from claim_check import pack_message_body
+from message_groups import get_message_group_id
+from fingerprint import rating_fingerprint, get_deduplication_id
+from reference_data import get_reference_data
+
+# Queue the orders are sent to for rate shopping by the main Lambda
+QUEUE_NAME = 'SporticultureOrderQueue.fifo'
+
+# Format of the message bodies: 'compact' (wire_encoder.py) or 'legacy' (Order.as_dict())
+QUEUE_WIRE_FORMAT = os.environ.get('QUEUE_WIRE_FORMAT', 'compact')
+
+# ShipStation's maximum page size for /orders/list
+PAGE_SIZE = 250
+
+# Number of /orders/list pages downloaded at the same time, all of them share the client's rate limiter
+PAGE_FETCH_WORKERS = int(os.environ.get('PAGE_FETCH_WORKERS', '4'))
+
+# Incremental runs ask for orders modified since the checkpoint minus this many seconds, so orders modified
+# while the previous run was listing (or with equal timestamps) aren't missed
+SYNC_OVERLAP_SECONDS = int(os.environ.get('SYNC_OVERLAP_SECONDS', '300'))
 
 def get_account_name(unique_id):
     account_name_map = {
@@ -16,37 +40,6 @@ def get_account_name(unique_id):
     return account_name
 
 
-def get_secret(secret_name):
-    """
-    Retrieve the API key and secret from AWS Secrets Manager.
-
-    Parameters:
-    secret_name (str): The name of the secret in AWS Secrets Manager.
-
-    Returns:
-    tuple: A tuple containing the api_key and api_secret as strings.
-    """
-    # Create a Secrets Manager client
-    client = boto3.client('secretsmanager')
-
-    try:
-        # Get the secret value from Secrets Manager
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-
-        # Parse the secret JSON string and extract the keys
-        secret_dict = json.loads(get_secret_value_response['SecretString'])
-        api_key = secret_dict['api_key']
-        api_secret = secret_dict['api_secret']
-
-        return api_key, api_secret
-
-    except ClientError as e:
-        # Handle the error accordingly
-        raise e
-
-    
-
-
 def connect_to_api():
     """
         Connect to the ShipStation API using the API keys retrieved from Secrets Manager.
@@ -66,26 +59,26 @@ def connect_to_api():
 
 
 
-# Not Used
 def get_batch_id(resource_url):
     """
     Extract the importBatch number from the given ShipStation URL.
 
     Parameters:
-    resource_url (str): The URL containing the importBatch parameter.
+    resource_url (str): The URL containing the importBatch parameter,
+                        e.g. https://ssapi.shipstation.com/orders?importBatch=1a2b3c&page=1
 
     Returns:
-    str: The importBatch number extracted from the URL.
+    str: The importBatch number extracted from the URL, None if the URL has none.
     """
-    # Find the start of the importBatch value
-    import_batch_start = resource_url.find('=') + 1
-
-    # Extract and return everything after the "="
-    return resource_url[import_batch_start:]
+    # Parse the query instead of taking everything after the first "=", which breaks when other
+    # parameters come before or after importBatch
+    values = parse_qs(urlparse(resource_url).query).get('importBatch')
+    return values[0] if values else None
 
 
 
 
+# Not Used, the total comes with the first page of fetch_orders_with_retry()
 def fetch_order_count(ss_client, max_retries=10, delay=5):
     """
     Fetches the total number of orders from ShipStation.
@@ -115,44 +108,215 @@ def fetch_order_count(ss_client, max_retries=10, delay=5):
 
 
 
-def fetch_orders_with_retry(ss_client, total_orders, max_retries=10, delay=5):
+def get_backoff_delay(attempt, base_delay=1, max_delay=30):
+    """
+    Returns a jittered exponential backoff delay ("full jitter") for a retry attempt.
+
+    Args:
+        attempt (int): The attempt that failed, starting at 0.
+        base_delay (float): Delay ceiling of the first retry in seconds.
+        max_delay (float): Upper bound of the delay ceiling in seconds.
+
+    Returns:
+        float: Seconds to wait before the next attempt.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+
+
+def fetch_orders_page(ss_client, page, max_retries=10, delay=1, filters=None):
     """
-    Attempts to fetch all orders with a specified number of retries for each page.
+    Fetches one page of awaiting_shipment orders, retrying it with jittered exponential backoff.
+
+    Args:
+        ss_client (ShipStation): The ShipStation connection object.
+        page (int): The page number, starting at 1.
+        max_retries (int): Maximum number of attempts for the page.
+        delay (float): Base delay of the backoff in seconds.
+        filters (dict): Additional /orders/list parameters, e.g. from get_incremental_filters().
+
+    Returns:
+        dict or None: The response JSON of the page ('orders', 'total', 'page', 'pages'),
+            None if the page failed after max_retries attempts.
+    """
+    params = {
+        'order_status': 'awaiting_shipment', 
+        'page': page,
+        'page_size': PAGE_SIZE,
+        **(filters or {})
+    }
+
+    return fetch_json_with_retry(lambda: ss_client.fetch_orders(parameters=params), f"page {page}", max_retries, delay)
+
+
+
+
+def fetch_json_with_retry(request, description, max_retries=10, delay=1):
+    """
+    Sends a ShipStation request until it succeeds, with jittered exponential backoff between attempts.
+
+    Args:
+        request (callable): Sends the request and returns the response.
+        description (str): What is fetched, for the log lines (e.g. "page 3").
+        max_retries (int): Maximum number of attempts.
+        delay (float): Base delay of the backoff in seconds.
+
+    Returns:
+        dict or None: The response JSON, None if the request failed after max_retries attempts.
+    """
+    for attempt in range(max_retries):
+        try:
+            response = request()
+            response.raise_for_status()  # Raises an HTTPError for bad responses (4xx/5xx)
+            return response.json()
+        except Exception as e:
+            print(f"[X] Attempt {attempt+1} for {description} failed with error: {e}")
+            if attempt + 1 < max_retries:
+                time.sleep(get_backoff_delay(attempt, delay))  # Wait before retrying
+
+    print(f"[X] Failed to fetch {description} after {max_retries} attempts.")
+    return None
+
+
+
+
+def iter_order_pages(ss_client, max_retries=10, delay=1, lookahead=PAGE_FETCH_WORKERS, filters=None):
+    """
+    Yields the awaiting_shipment orders page by page, in page order, while later pages download.
+
+    The first page tells how many pages there are. After that, at most `lookahead` pages are in flight
+    (downloading or downloaded but not yet consumed), which bounds the memory held by the generator
+    no matter how large the backlog is. Every page is retried independently by fetch_orders_page().
 
     Args:
         ss_client (ShipStation): The ShipStation connection object.
-        total_orders (int): The total number of orders to fetch.
         max_retries (int): Maximum number of retries for each page.
-        delay (int): Delay between retries in seconds.
+        delay (float): Base delay of the backoff between retries in seconds.
+        lookahead (int): Maximum number of pages in flight, also the number of concurrent downloads.
+        filters (dict): Additional /orders/list parameters applied to every page.
+
+    Yields:
+        list or None: The orders of a page. None if a page failed after max retries, nothing follows it.
+    """
+    first_page = fetch_orders_page(ss_client, 1, max_retries, delay, filters)
+    if first_page is None:
+        yield None
+        return
+
+    num_of_pages = first_page.get('pages', 1) or 1
+    print(f"Total orders: {first_page.get('total', 0)} in {num_of_pages} page(s)")
+
+    with ThreadPoolExecutor(max_workers=max(1, lookahead), thread_name_prefix="orders-page") as executor:
+        in_flight = deque()
+        next_page = 2
+
+        def fill():
+            nonlocal next_page
+            while next_page <= num_of_pages and len(in_flight) < lookahead:
+                in_flight.append((next_page, executor.submit(fetch_orders_page, ss_client, next_page, max_retries, delay, filters)))
+                next_page += 1
+
+        # Start the next pages before handing out the first one
+        fill()
+        first_orders = first_page.get("orders", [])
+        first_page = None
+        yield first_orders
+
+        while in_flight:
+            page, future = in_flight.popleft()
+            page_json = future.result()
+            if page_json is None:
+                for _, pending in in_flight:
+                    pending.cancel()
+                yield None
+                return
+
+            fill()
+            yield page_json.get("orders", [])
+
+
+
+
+def iter_import_batch_pages(ss_client, batch_id, max_retries=10, delay=1):
+    """
+    Yields the orders of a ShipStation import batch (the resource_url of an ORDER_NOTIFY webhook) page by page.
+
+    An import batch is usually a single page, so the pages are fetched one after another.
+
+    Args:
+        ss_client (ShipStation): The ShipStation connection object.
+        batch_id (str): The importBatch from get_batch_id().
+        max_retries (int): Maximum number of retries for each page.
+        delay (float): Base delay of the backoff between retries in seconds.
+
+    Yields:
+        list or None: The orders of a page. None if a page failed after max retries, nothing follows it.
+    """
+    page, num_of_pages = 1, 1
+    while page <= num_of_pages:
+        page_json = fetch_json_with_retry(
+            lambda: ss_client.fetch_webhook(batch_id, page=page, page_size=PAGE_SIZE),
+            f"import batch {batch_id} page {page}", max_retries, delay
+        )
+        if page_json is None:
+            yield None
+            return
+
+        num_of_pages = page_json.get('pages', 1) or 1
+        yield page_json.get('orders', [])
+        page += 1
+
+
+
+
+def get_incremental_filters(modify_date, overlap=SYNC_OVERLAP_SECONDS):
+    """
+    Returns the /orders/list parameters of an incremental run: the orders modified since the checkpoint,
+    oldest change first so the pages don't shift while they are downloaded.
+
+    ShipStation dates are in its own time zone (Pacific) without an offset, the checkpoint is one of
+    those dates, so no time zone conversion is needed.
+
+    Args:
+        modify_date (str): The checkpoint modifyDate, e.g. "2024-05-01T12:34:56.1230000".
+        overlap (int): Seconds subtracted from the checkpoint.
 
     Returns:
-        list: A list of all orders (parsed from the response JSON).
+        dict: modify_date_start, sort_by and sort_dir parameters.
     """
-    num_of_pages = (total_orders // 250) + 1
-    all_orders = []
+    start = datetime.strptime(modify_date[:19], '%Y-%m-%dT%H:%M:%S') - timedelta(seconds=overlap)
+    return {
+        'modify_date_start': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'sort_by': 'ModifyDate',
+        'sort_dir': 'ASC'
+    }
 
-    for page in range(1, num_of_pages + 1):
-        for attempt in range(max_retries):
-            try:
-                params = {
-                    'order_status': 'awaiting_shipment', 
-                    'page': page,
-                    'page_size': 250
-                }
-                
-                response = ss_client.fetch_orders(parameters=params)
-                response.raise_for_status()  # Raises an HTTPError for bad responses (4xx/5xx)
-                
-                # Extract the list of orders from the JSON response
-                orders = response.json().get("orders", [])
-                all_orders.extend(orders)
-                break  # Exit the retry loop if the request is successful
-            except Exception as e:
-                print(f"[X] Attempt {attempt+1} for page {page} failed with error: {e}")
-                time.sleep(delay)  # Wait before retrying
-        else:
-            print(f"[X] Failed to fetch page {page} after {max_retries} attempts.")
+
+
+
+def fetch_orders_with_retry(ss_client, total_orders=None, max_retries=10, delay=1):
+    """
+    Fetches all awaiting_shipment orders, retrying each page independently.
+
+    The first page tells how many orders and pages there are, the remaining pages are then
+    downloaded concurrently (PAGE_FETCH_WORKERS at a time) under the client's shared rate limit.
+
+    Args:
+        ss_client (ShipStation): The ShipStation connection object.
+        total_orders (int): Not used anymore, the total is read from the first page.
+        max_retries (int): Maximum number of retries for each page.
+        delay (float): Base delay of the backoff between retries in seconds.
+
+    Returns:
+        list: A list of all orders (parsed from the response JSON), in page order.
+            None if any page fails after max retries.
+    """
+    all_orders = []
+    for page_orders in iter_order_pages(ss_client, max_retries, delay):
+        if page_orders is None:
             return None  # Return None if any page fails after max retries
+        all_orders.extend(page_orders)
 
     return all_orders
 
@@ -284,17 +448,12 @@ def get_warehouse(warehouse_id):
         warehouse_id (int): The ID of the warehouse.
 
     Returns:
-        str or None: The name of the warehouse if found, otherwise `None`.
+        dict or None: The warehouse ({'warehouse': name}) if found, otherwise `None`.
     """
-    warehouse_id_map = {
-        590152: {'ss_account': 'sporticulture', 'warehouse': "Sporticulture"},
-        791225: {'ss_account': 'sporticulture', 'warehouse': "Stallion Wholesale"}
+    warehouse_name = get_reference_data().shipstation_warehouses.get(warehouse_id, None)
 
-    }
-
-    warehouse_name = warehouse_id_map.get(warehouse_id, None)
-
-    return warehouse_name
+    # The snapshot's tables are read-only and shared, the order gets its own (JSON serializable) copy
+    return dict(warehouse_name) if warehouse_name is not None else None
 
 
 
@@ -313,57 +472,26 @@ def get_store_name(store_id):
     Returns:
         str or None: The name of the store if found, otherwise `None`.
     """
-    store_id_map = {
-        315885: 'Amazon',
-        341077: 'HSN',
-        332340: 'JoAnn Fabric & Crafts',
-        264327: 'Manual Orders',
-        333906: 'Replacement',
-        336544: 'Sharper Image',
-        307866: 'Sporticulture',
-        320975: 'Sporticulture Wholesale',
-        319722: 'Stadium Allstars',
-        337523: 'TC EDI',
-        334045: 'Walmart Wholesale'
-    }
-    
-    store_name = store_id_map.get(store_id, None)
+    store_name = get_reference_data().stores.get(store_id, None)
 
     return store_name
 
 
 
 
-def send_order_to_queue(order_object, sqs_client):
+def build_queue_message(order_object, queue_name=QUEUE_NAME):
     """
-    Sends the order to the appropriate SQS queue based on the shipstation_account.
-
-    This function determines the correct SQS queue to send the order message to, 
-    based on the shipstation_account of the order_object. The message is then sent 
-    to the identified queue, along with metadata that includes the current queue name 
-    and shipstation_account. The function returns a boolean indicating the success of 
-    the operation.
+    Builds the SQS message of an order: body, metadata attributes, group and deduplication ids.
 
     Args:
-        order_object: The order object that contains all order details, including the 
-                    shipstation_account attribute.
-        sqs_client: The Boto3 SQS client used to interact with Amazon SQS.
+        order_object: The order object that contains all order details.
+        queue_name (str): The name of the queue the message is sent to.
 
     Returns:
-        bool: True if the message was sent successfully, False otherwise.
-        None: If the shipstation_account is not found in the queue mapping.
-
-    Raises:
-        ValueError: If the shipstation_account is not found in the queue mapping.
+        dict: The send_message / SendMessageBatch entry arguments, without QueueUrl and Id.
     """
-
-    queue_name = 'SporticultureOrderQueue.fifo'
-
-    # Get the URL of the target queue
-    queue_url = sqs_client.get_queue_url(QueueName=queue_name)['QueueUrl']
-
-    # Prepare the message body
-    message_body = json.dumps(order_object.as_dict())
+    # Hash of the order inputs that change the rating, see fingerprint.py
+    fingerprint = rating_fingerprint(order_object)
 
     # Include metadata with the message
     message_attributes = {
@@ -374,20 +502,56 @@ def send_order_to_queue(order_object, sqs_client):
         'ShipStationAccount': {
             'DataType': 'String',
             'StringValue': "Sporticulture"
+        },
+        # Lets the main Lambda skip orders it doesn't rate without decoding them
+        'TradingPartner': {
+            'DataType': 'String',
+            'StringValue': order_object.trading_partner
+        },
+        'RatingFingerprint': {
+            'DataType': 'String',
+            'StringValue': fingerprint
         }
     }
 
-    # Generate a unique MessageDeduplicationId
-    message_deduplication_id = str(order_object.order_id)  # Assuming order_object has an order_id attribute
+    if QUEUE_WIRE_FORMAT == 'legacy':
+        message_body = json.dumps(order_object.as_dict())
+    else:
+        message_body = json.dumps(encode_order(order_object))
+
+    # Large bodies are gzipped, or stored in the payload bucket with only a pointer enqueued
+    message_body = pack_message_body(message_body, str(order_object.order_id))
+
+    return {
+        'MessageBody': message_body,
+        'MessageAttributes': message_attributes,
+        'MessageGroupId': get_message_group_id(order_object), # Groups are processed concurrently, see message_groups.py
+        'MessageDeduplicationId': get_deduplication_id(order_object, fingerprint)  # A modified order is a new message
+    }
+
+
+
+
+def send_order_to_queue(order_object, sqs_client):
+    """
+    Sends a single order to SporticultureOrderQueue.fifo.
+
+    process_batch sends orders in batches with order_queue.OrderQueueBatcher, this function is
+    kept for one-off sends.
+
+    Args:
+        order_object: The order object that contains all order details, including the 
+                    shipstation_account attribute.
+        sqs_client: The Boto3 SQS client used to interact with Amazon SQS.
+
+    Returns:
+        bool: True if the message was sent successfully, False otherwise.
+    """
+    # Get the URL of the target queue
+    queue_url = sqs_client.get_queue_url(QueueName=QUEUE_NAME)['QueueUrl']
 
     # Send the message to the SQS queue
-    response = sqs_client.send_message(
-        QueueUrl=queue_url,
-        MessageBody=message_body,
-        MessageAttributes=message_attributes,
-        MessageGroupId='987654321', # If all messages have the same group id, they will be processed in order
-        MessageDeduplicationId=message_deduplication_id
-    )
+    response = sqs_client.send_message(QueueUrl=queue_url, **build_queue_message(order_object))
 
     # Validate if the message was sent successfully
     if response['ResponseMetadata']['HTTPStatusCode'] == 200:
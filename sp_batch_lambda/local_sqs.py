@@ -0,0 +1,188 @@
+'''
+In-process stand-in for the subset of the boto3 SQS client the batch Lambda uses.
+
+Lets the producer run and be measured offline: set LOCAL_SQS=true and process_batch sends to a LocalSQS
+instead of AWS. It enforces the SQS limits that matter to the producer (10 entries and 256 KB per
+SendMessageBatch, unique entry ids, MessageGroupId on FIFO queues, 5 minute deduplication window) and can
+simulate the round trip latency of the real service and partial batch failures.
+
+On the receiving side it keeps the FIFO group semantics that bound consumer concurrency: a message group
+with received but not yet deleted messages is not handed out again until they are deleted.
+'''
+
+import hashlib
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+MAX_BATCH_ENTRIES = 10
+MAX_REQUEST_BYTES = 256 * 1024
+DEDUPLICATION_WINDOW = 300  # seconds
+
+
+
+def message_size(body, attributes=None):
+    """
+    Returns the size SQS counts for a message: the body plus every attribute name, type and value.
+    """
+    size = len(body.encode('utf-8'))
+    for name, attribute in (attributes or {}).items():
+        size += len(name.encode('utf-8')) + len(attribute.get('DataType', '').encode('utf-8'))
+        size += len(str(attribute.get('StringValue', attribute.get('BinaryValue', ''))).encode('utf-8'))
+    return size
+
+
+
+class LocalSQS:
+    """
+    Thread-safe in-memory SQS client.
+
+    Args:
+        latency (float): Seconds every API call takes, to model the network round trip.
+        failure_rate (float): Probability that an entry of a SendMessageBatch fails (SenderFault False).
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.queues = {}  # queue_url -> deque of messages
+        self.calls = {}  # API name -> number of calls
+        self._deduplication = {}  # (queue_url, deduplication_id) -> sent_at
+        self._in_flight = {}  # receipt_handle -> (queue_url, message_group_id)
+        self._locked_groups = {}  # (queue_url, message_group_id) -> number of messages in flight
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def get_queue_url(self, QueueName):
+        self._call('get_queue_url')
+        queue_url = f"https://sqs.local/000000000000/{QueueName}"
+        with self._lock:
+            self.queues.setdefault(queue_url, deque())
+        return {'QueueUrl': queue_url}
+
+    def _enqueue(self, queue_url, entry):
+        if queue_url not in self.queues:
+            raise ValueError(f"AWS.SimpleQueueService.NonExistentQueue: {queue_url}")
+
+        is_fifo = queue_url.endswith('.fifo')
+        if is_fifo and not entry.get('MessageGroupId'):
+            raise ValueError("MissingParameter: The request must contain the parameter MessageGroupId.")
+
+        message_id = str(uuid.uuid4())
+        deduplication_id = entry.get('MessageDeduplicationId')
+        if is_fifo and deduplication_id:
+            now = time.monotonic()
+            sent_at = self._deduplication.get((queue_url, deduplication_id))
+            # Duplicates are accepted but not delivered again, like SQS does
+            if sent_at is not None and now - sent_at < DEDUPLICATION_WINDOW:
+                return message_id
+            self._deduplication[(queue_url, deduplication_id)] = now
+
+        self.queues[queue_url].append({
+            'MessageId': message_id,
+            'Body': entry['MessageBody'],
+            'MessageAttributes': entry.get('MessageAttributes', {}),
+            'Attributes': {
+                'MessageGroupId': entry.get('MessageGroupId'),
+                'MessageDeduplicationId': deduplication_id,
+            },
+        })
+        return message_id
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self._call('send_message')
+        if message_size(MessageBody, kwargs.get('MessageAttributes')) > MAX_REQUEST_BYTES:
+            raise ValueError("InvalidParameterValue: Message must be shorter than 262144 bytes.")
+
+        with self._lock:
+            message_id = self._enqueue(QueueUrl, dict(kwargs, MessageBody=MessageBody))
+
+        return {
+            'MessageId': message_id,
+            'MD5OfMessageBody': hashlib.md5(MessageBody.encode('utf-8')).hexdigest(),
+            'ResponseMetadata': {'HTTPStatusCode': 200},
+        }
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self._call('send_message_batch')
+        if not Entries or len(Entries) > MAX_BATCH_ENTRIES:
+            raise ValueError("AWS.SimpleQueueService.TooManyEntriesInBatchRequest")
+        if len({entry['Id'] for entry in Entries}) != len(Entries):
+            raise ValueError("AWS.SimpleQueueService.BatchEntryIdsNotDistinct")
+        if sum(message_size(entry['MessageBody'], entry.get('MessageAttributes')) for entry in Entries) > MAX_REQUEST_BYTES:
+            raise ValueError("AWS.SimpleQueueService.BatchRequestTooLong")
+
+        successful, failed = [], []
+        with self._lock:
+            for entry in Entries:
+                if self.failure_rate and self._random.random() < self.failure_rate:
+                    failed.append({
+                        'Id': entry['Id'],
+                        'SenderFault': False,
+                        'Code': 'InternalError',
+                        'Message': 'Simulated failure',
+                    })
+                    continue
+
+                try:
+                    message_id = self._enqueue(QueueUrl, entry)
+                except ValueError as e:
+                    failed.append({'Id': entry['Id'], 'SenderFault': True, 'Code': 'InvalidParameterValue', 'Message': str(e)})
+                    continue
+                successful.append({'Id': entry['Id'], 'MessageId': message_id})
+
+        response = {'Successful': successful, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+        if failed:
+            response['Failed'] = failed
+        return response
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, **kwargs):
+        """
+        Takes up to MaxNumberOfMessages messages off the queue (no visibility timeout).
+
+        On FIFO queues only groups without messages in flight are served, in order within each group, and
+        the groups stay locked until their messages are deleted with delete_message.
+        """
+        self._call('receive_message')
+        is_fifo = QueueUrl.endswith('.fifo')
+        with self._lock:
+            queue = self.queues.get(QueueUrl, deque())
+            messages, remaining, serving = [], deque(), set()
+            while queue:
+                message = queue.popleft()
+                group_key = (QueueUrl, message['Attributes']['MessageGroupId'])
+                is_available = not is_fifo or group_key in serving or group_key not in self._locked_groups
+                if len(messages) < MaxNumberOfMessages and is_available:
+                    serving.add(group_key)
+                    messages.append(dict(message, ReceiptHandle=str(uuid.uuid4())))
+                else:
+                    remaining.append(message)
+            queue.extend(remaining)
+
+            for message in messages:
+                group_key = (QueueUrl, message['Attributes']['MessageGroupId'])
+                self._in_flight[message['ReceiptHandle']] = group_key
+                if is_fifo:
+                    self._locked_groups[group_key] = self._locked_groups.get(group_key, 0) + 1
+        return {'Messages': messages} if messages else {}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        """
+        Deletes a received message, unlocking its FIFO group once none of its messages is in flight.
+        """
+        self._call('delete_message')
+        with self._lock:
+            group_key = self._in_flight.pop(ReceiptHandle, None)
+            if group_key in self._locked_groups:
+                self._locked_groups[group_key] -= 1
+                if not self._locked_groups[group_key]:
+                    del self._locked_groups[group_key]
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
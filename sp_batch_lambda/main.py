@@ -2,95 +2,341 @@
 import sp_batch_lambda.functions as functions
 from .classes import Order, Customer, Address, Item, Shipment # Comes from shipstation_layer (lambda_layer)
 from .utils import convert_keys_to_snake_case
+from .order_queue import OrderQueueBatcher
+from .local_sqs import LocalSQS
+from .checkpoint_store import get_checkpoint_store
+from .trading_partners import get_trading_partner, is_actionable
+from .reference_data import get_reference_data
 import json
+import os
+import time
 
 import boto3
 
 
 
 # Initialize the SQS client to send order messages downstream the serverless architecture
-sqs_client = boto3.client('sqs')
+# LOCAL_SQS=true swaps in an in-process stand-in, for offline runs and benchmarks
+if os.environ.get('LOCAL_SQS', 'false').lower() == 'true':
+    sqs_client = LocalSQS()
+else:
+    sqs_client = boto3.client('sqs')
 
+# 'auto' runs incrementally from the checkpoint and does a full run every FULL_SYNC_INTERVAL seconds,
+# 'full' and 'incremental' force the mode (incremental falls back to full without a checkpoint)
+SYNC_MODE = os.environ.get('SYNC_MODE', 'auto')
+FULL_SYNC_INTERVAL = int(os.environ.get('FULL_SYNC_INTERVAL', '86400'))
 
-def process_batch():
+# Webhooks answer through API Gateway, which cuts requests off after 29 seconds: each import batch page
+# gets WEBHOOK_MAX_RETRIES attempts of at most WEBHOOK_TIMEOUT seconds and 429s aren't waited out.
+# A batch that doesn't make it is picked up by the next process_batch run.
+WEBHOOK_MAX_RETRIES = int(os.environ.get('WEBHOOK_MAX_RETRIES', '2'))
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', '10'))
 
+# Where the modifyDate watermark of the last completed run is kept, None when not configured
+checkpoint_store = get_checkpoint_store()
+
+
+def is_already_processed(order_data_raw):
+    # Tag id for "Ready to Ship"
+    return order_data_raw.get('tagIds') is not None and get_reference_data().tags['Ready'] in order_data_raw['tagIds']
+
+
+
+def classify_order(order_data_raw):
+    '''
+    Returns the trading partner of a raw ShipStation order, before the Order object is built.
+    '''
+    store_name = functions.get_store_name((order_data_raw.get('advancedOptions') or {}).get('storeId'))
+    return get_trading_partner(store_name, order_data_raw.get('orderNumber'))
+
+
+
+def build_order(order_data_raw, webhook_batch_id=None):
+    '''
+    Builds the Order object of a raw ShipStation order.
+
+    Args:
+        order_data_raw (dict): One order of the /orders/list response.
+        webhook_batch_id (str): The importBatch of the webhook the order came from, if any.
+
+    Returns:
+        Order: The order with its nested Customer, Shipment and Item objects.
+    '''
+    # Convert keys from camelCase to snake_case
+    order_data = convert_keys_to_snake_case(order_data_raw)
+
+    # Create Address objects for bill_to and ship_to
+    bill_to_address = Address(**order_data['bill_to'])
+    ship_to_address = Address(**order_data['ship_to'])
+    # Initialize an empty Address for warehouse
+    warehouse_address = Address()
+
+    # Initialize nested classes and extract customer data for Customer
+    customer_data = functions.parse_customer_data(order_data)
+    customer = Customer(
+        bill_to=bill_to_address,
+        ship_to=ship_to_address,
+        **customer_data
+    )
+
+    # Extrace shipment related data and initialize Shipment
+    shipment_data = functions.parse_shipment_data(order_data)
+    shipment = Shipment(
+                    warehouse=warehouse_address,
+                    **shipment_data
+                )
+
+    # Packs multiple Item objects whenever there are multiple item dictionaries in order_data['items']
+    items = [Item(**item_data) for item_data in order_data['items']]
+
+    # Initialize the Order class by unpacking the dictionary
+    order = functions.parse_order_data(order_data)
+    return Order(
+        Shipment=shipment,
+        Customer=customer,
+        items=items,
+        shipstation_account='Sporticulture',
+        webhook_batch_id = webhook_batch_id,
+        warehouse_name=functions.get_warehouse(order_data['advanced_options'].get('warehouse_id', None)),
+        store_name=functions.get_store_name(order_data['advanced_options'].get('store_id', None)),
+        order_data_raw= order_data,
+        **order
+    )
+
+
+
+def iter_orders(pages, webhook_batch_id=None):
+    '''
+    Streams Order objects out of pages of raw orders: page -> filter -> build.
+
+    Orders of trading partners the main Lambda doesn't rate (see trading_partners.py) are dropped here,
+    so they never cost a queue message or a consumer invocation.
+
+    Args:
+        pages (iterable): Lists of raw orders, e.g. functions.iter_order_pages(). A None page
+                          means the page could not be fetched.
+        webhook_batch_id (str): Set on the orders when the pages come from a webhook import batch.
+
+    Yields:
+        Order: The orders that still need processing, one at a time.
+
+    Raises:
+        RuntimeError: When a page could not be fetched from ShipStation.
+    '''
+    for page_orders in pages:
+        if page_orders is None:
+            raise RuntimeError("Failed to fetch data from ShipStation API after maximum retries.")
+
+        for order_data_raw in page_orders:
+            if is_already_processed(order_data_raw):
+                print(f"Order {order_data_raw['orderNumber']} is already processed")
+                continue
+
+            trading_partner = classify_order(order_data_raw)
+            if not is_actionable(trading_partner):
+                print(f"Order {order_data_raw['orderNumber']} is for {trading_partner}, not enqueued")
+                continue
+            yield build_order(order_data_raw, webhook_batch_id)
+
+
+
+def plan_sync(checkpoint, sync_mode=SYNC_MODE, now=None):
+    '''
+    Decides whether a run lists every awaiting_shipment order or only the ones modified since the checkpoint.
+
+    Incremental runs can miss an order, e.g. when a modification shifts the pages while they are being
+    downloaded. The periodic full run reconciles those, it also re-enqueues every order that is still
+    not tagged Ready.
+
+    Args:
+        checkpoint (dict): The stored checkpoint, empty if there is none.
+        sync_mode (str): 'auto', 'full' or 'incremental'.
+        now (float): Current Unix time.
+
+    Returns:
+        str: 'full' or 'incremental'.
+    '''
+    if sync_mode not in ('auto', 'full', 'incremental'):
+        raise ValueError(f"Invalid sync mode: {sync_mode}")
+
+    if sync_mode == 'full' or not checkpoint.get('modify_date'):
+        return 'full'
+    if sync_mode == 'incremental':
+        return 'incremental'
+
+    now = time.time() if now is None else now
+    if now - checkpoint.get('last_full_sync', 0) >= FULL_SYNC_INTERVAL:
+        return 'full'
+    return 'incremental'
+
+
+
+def track_modify_date(pages, watermark):
+    '''
+    Passes the pages through, keeping the highest modifyDate of their orders in watermark['modify_date'].
+
+    Every listed order counts, including the ones skipped because they are already processed.
+    ShipStation dates have a fixed format, so they compare correctly as strings.
+    '''
+    for page_orders in pages:
+        for order_data_raw in page_orders or ():
+            modify_date = order_data_raw.get('modifyDate')
+            if modify_date and (watermark['modify_date'] is None or modify_date > watermark['modify_date']):
+                watermark['modify_date'] = modify_date
+        yield page_orders
+
+
+
+def process_batch(enqueue=True, sync_mode=None):
+    '''
+    Streams the awaiting_shipment orders from ShipStation to SporticultureOrderQueue.fifo.
+
+    Orders go through a generator pipeline (page -> filter -> build Order -> enqueue), so the first
+    orders reach the queue while later pages are still downloading and only a few pages are held in
+    memory at any time (see functions.iter_order_pages).
+
+    Args:
+        enqueue (bool): Send the orders to the queue. With False the Order objects are returned
+                        instead, which is how manual.py runs the whole flow locally.
+        sync_mode (str): 'auto', 'full' or 'incremental', defaults to SYNC_MODE. See plan_sync().
+
+    Returns:
+        dict or list: A summary of the run, or the list of Order objects when enqueue is False.
+    '''
     # Create connnection with shipstation
     # Client has built in functionality. Module for client lives in shiptation_layer (lambda_layer)
     ss_client = functions.connect_to_api()
 
-    # Get total orders from the shipstation account 
-    total_orders = functions.fetch_order_count(ss_client)
-    print(f"Total orders: {total_orders}")
+    # Incremental runs only list the orders modified since the last completed run
+    started_at = time.time()
+    checkpoint = checkpoint_store.load() if checkpoint_store is not None else {}
+    mode = plan_sync(checkpoint, sync_mode or SYNC_MODE, started_at)
+    filters = functions.get_incremental_filters(checkpoint['modify_date']) if mode == 'incremental' else None
+    watermark = {'modify_date': checkpoint.get('modify_date')}
+    print(f"Sync mode: {mode}" + (f", orders modified since {filters['modify_date_start']}" if filters else ""))
 
-    # Fetch all orders from the shipstation account
-    orders = functions.fetch_orders_with_retry(ss_client, total_orders)
-    print(f"Orders: {len(orders)}")
-
-    if orders:
-        order_objects = []
-        for order_data_raw in orders:
-            # Tag id for "Ready to Ship"
-            if order_data_raw.get('tagIds') is not None and 55809 in order_data_raw['tagIds']:
-                print(f"Order {order_data_raw['orderNumber']} is already processed")
+    order_objects = []
+    # Orders are sent with SendMessageBatch, up to 10 per request
+    batcher = OrderQueueBatcher(sqs_client, functions.QUEUE_NAME) if enqueue else None
+    try:
+        pages = track_modify_date(functions.iter_order_pages(ss_client, filters=filters), watermark)
+        for order_object in iter_orders(pages):
+            if not enqueue:
+                order_objects.append(order_object)
                 continue
-            
-            # Convert keys from camelCase to snake_case
-            order_data = convert_keys_to_snake_case(order_data_raw)
-
-            # Create Address objects for bill_to and ship_to
-            bill_to_address = Address(**order_data['bill_to'])
-            ship_to_address = Address(**order_data['ship_to'])
-            # Initialize an empty Address for warehouse
-            warehouse_address = Address()
-
-            # Initialize nested classes and extract customer data for Customer
-            customer_data = functions.parse_customer_data(order_data)
-            customer = Customer(
-                bill_to=bill_to_address,
-                ship_to=ship_to_address,
-                **customer_data
-            )
-
-            # Extrace shipment related data and initialize Shipment
-            shipment_data = functions.parse_shipment_data(order_data)
-            shipment = Shipment(
-                            warehouse=warehouse_address,
-                            **shipment_data
-                        )
-
-            # Packs multiple Item objects whenever there are multiple item dictionaries in order_data['items']
-            items = [Item(**item_data) for item_data in order_data['items']]
-
-            # Initialize the Order class by unpacking the dictionary
-            order = functions.parse_order_data(order_data)
-            order_object = Order(
-                Shipment=shipment,
-                Customer=customer,
-                items=items,
-                shipstation_account='Sporticulture',
-                webhook_batch_id = None,
-                warehouse_name=functions.get_warehouse(order_data['advanced_options'].get('warehouse_id', None)),
-                store_name=functions.get_store_name(order_data['advanced_options'].get('store_id', None)),
-                order_data_raw= order_data,
-                **order
-            )
-            order_objects.append(order_object)
+
+            batcher.add(str(order_object.order_id), functions.build_queue_message(order_object))
+
+    except RuntimeError as e:
+        print(f"[X] {e}")
+        return {
+                'statusCode': 504,
+                'body': json.dumps('Failed to fetch data from ShipStation API after maximum retries.')
+                }
+
+    finally:
+        # Sends the last, partially filled batch
+        if batcher is not None:
+            batcher.close()
+
+    if not enqueue:
+        print(f"Orders: {len(order_objects)}")
+        return order_objects
+
+    sent, failed = batcher.sent, len(batcher.failed_ids)
+    print(f"Orders sent to queue: {sent}, failed: {failed}")
+    if failed:
+        # The checkpoint stays where it was, the next run lists the failed orders again
+        return {"message": f"[!] {failed} order(s) failed to send to queue", "sent": sent, "failed": failed, "sync": mode}
+
+    if checkpoint_store is not None:
+        checkpoint_store.save({
+            'modify_date': watermark['modify_date'],
+            'last_full_sync': started_at if mode == 'full' else checkpoint.get('last_full_sync', 0),
+            'updated_at': time.time(),
+        })
+        print(f"Checkpoint: {watermark['modify_date']}")
+    return {"message": "[+] All orders sent to queue Successfully", "sent": sent, "failed": failed, "sync": mode}
+
+
+
+def only_awaiting_shipment(pages):
+    '''
+    Drops the orders of an import batch that are not awaiting shipment (awaiting_payment, on_hold...),
+    /orders/list is already filtered by status, a webhook's import batch is not.
+    '''
+    for page_orders in pages:
+        if page_orders is None:
+            yield None
             continue
-            #successful = functions.send_order_to_queue(order_object, sqs_client)
-            # if successful:
-            #     print(f"Order {order_object.order_key} sent to queue successfully")
-            #     continue
-            # else:
-            #     print(f"Order {order_object.order_key} failed to send to queue")
-            #     continue
+        yield [order for order in page_orders if order.get('orderStatus') == 'awaiting_shipment']
+
+
+
+def process_webhook(unique_id, resource_url, enqueue=True):
+    '''
+    Sends the orders of a ShipStation ORDER_NOTIFY webhook to SporticultureOrderQueue.fifo right away.
+
+    Only the import batch named in the webhook's resource_url is fetched, so new orders are rated
+    within seconds of landing in ShipStation. The fetch has a small retry budget (WEBHOOK_MAX_RETRIES)
+    to answer within the API Gateway timeout, process_batch keeps running on its schedule as the
+    backstop for webhooks that never arrive or fail.
+
+    Args:
+        unique_id (str): The account id of the webhook URL (/webhook/{uniqueid}).
+        resource_url (str): The resource_url of the webhook payload.
+        enqueue (bool): Send the orders to the queue, with False the Order objects are returned instead.
+
+    Returns:
+        dict or list: A summary of the run, or the list of Order objects when enqueue is False.
 
+    Raises:
+        ValueError: If the account is not handled by this Lambda or resource_url has no importBatch.
+    '''
+    account_name = functions.get_account_name(unique_id)
+    if account_name != 'Sporticulture':
+        raise ValueError(f"Unknown account: {unique_id}")
 
+    batch_id = functions.get_batch_id(resource_url)
+    if not batch_id:
+        raise ValueError(f"No importBatch in resource_url: {resource_url}")
+    print(f"Webhook import batch: {batch_id}")
+
+    ss_client = functions.connect_to_api()
+    ss_client.timeout = WEBHOOK_TIMEOUT
+    ss_client.max_retries = 0
+    pages = only_awaiting_shipment(
+        functions.iter_import_batch_pages(ss_client, batch_id, max_retries=WEBHOOK_MAX_RETRIES)
+    )
+
+    order_objects = []
+    batcher = OrderQueueBatcher(sqs_client, functions.QUEUE_NAME) if enqueue else None
+    try:
+        for order_object in iter_orders(pages, webhook_batch_id=batch_id):
+            if not enqueue:
+                order_objects.append(order_object)
+                continue
+
+            batcher.add(str(order_object.order_id), functions.build_queue_message(order_object))
+
+    except RuntimeError as e:
+        print(f"[X] {e}")
+        return {
+                'statusCode': 504,
+                'body': json.dumps('Failed to fetch data from ShipStation API after maximum retries.')
+                }
+
+    finally:
+        if batcher is not None:
+            batcher.close()
+
+    if not enqueue:
         return order_objects
-        #return {"message": "[+] All orders sent to queue Successfully"}
-    return {
-            'statusCode': 504,
-            'body': json.dumps('Failed to fetch data from ShipStation API after maximum retries.')
-            }
+
+    sent, failed = batcher.sent, len(batcher.failed_ids)
+    print(f"Webhook orders sent to queue: {sent}, failed: {failed}")
+    return {"batch_id": batch_id, "sent": sent, "failed": failed}
 
 
 
@@ -0,0 +1,92 @@
+'''
+MessageGroupId strategies of the order messages sent to SporticultureOrderQueue.fifo.
+
+A FIFO queue delivers the messages of a group one batch at a time, in order, and only hands out the next
+batch of the group once the previous one has been deleted. The number of groups in the queue is therefore
+the upper bound on how many orders the main Lambda works on at the same time.
+
+    MESSAGE_GROUP_STRATEGY
+        single        Every order in one group, strictly one at a time (the original behavior)
+        order_hash    MESSAGE_GROUP_SHARDS groups, the order id decides the group
+        warehouse     One group per warehouse, MESSAGE_GROUP_SHARDS groups within each warehouse
+        partner       One group per trading partner, MESSAGE_GROUP_SHARDS groups within each trading
+                      partner, plus a priority lane for expedited orders
+    MESSAGE_GROUP_SHARDS      Groups per strategy bucket
+    PRIORITY_GROUP_SHARDS     Groups of the priority lane of the partner strategy
+
+The shard of an order is a stable hash (crc32) of its order id, so every message of an order lands in the
+same group and stays in order, across runs and containers. For the warehouse and partner strategies that
+holds as long as the warehouse / trading partner / requested service of the order doesn't change between
+two sends. Deduplication doesn't depend on the group either way, the deduplication id is the order id and
+its rating fingerprint (fingerprint.get_deduplication_id).
+'''
+
+import os
+import re
+import zlib
+
+SINGLE_MESSAGE_GROUP_ID = '987654321'
+
+MESSAGE_GROUP_STRATEGY = os.environ.get('MESSAGE_GROUP_STRATEGY', 'order_hash')
+MESSAGE_GROUP_SHARDS = int(os.environ.get('MESSAGE_GROUP_SHARDS', '8'))
+PRIORITY_GROUP_SHARDS = int(os.environ.get('PRIORITY_GROUP_SHARDS', '2'))
+
+
+
+def get_shard(order_id, shards):
+    """
+    Returns the shard (0 to shards - 1) of an order, the same in every process.
+    """
+    return zlib.crc32(str(order_id).encode('utf-8')) % max(1, shards)
+
+
+
+def slugify(value):
+    # MessageGroupId allows alphanumerics and punctuation, keep it readable in the console
+    return re.sub(r'[^A-Za-z0-9]+', '-', str(value or 'none')).strip('-').lower() or 'none'
+
+
+
+def is_priority(order):
+    """
+    Returns True for expedited orders (same rule as main_lambda's Shipment.is_expedited).
+    """
+    requested_service = order.Shipment.requested_shipping_service or ""
+    return requested_service.startswith("Express") or requested_service.startswith("Expedited")
+
+
+
+def get_message_group_id(order, strategy=None, shards=None):
+    """
+    Returns the MessageGroupId of an order message.
+
+    Args:
+        order (Order): The order being sent.
+        strategy (str): 'single', 'order_hash', 'warehouse' or 'partner', defaults to MESSAGE_GROUP_STRATEGY.
+        shards (int): Groups per bucket, defaults to MESSAGE_GROUP_SHARDS.
+
+    Returns:
+        str: The MessageGroupId.
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    strategy = strategy or MESSAGE_GROUP_STRATEGY
+    shards = shards or MESSAGE_GROUP_SHARDS
+
+    if strategy == 'single':
+        return SINGLE_MESSAGE_GROUP_ID
+
+    if strategy == 'order_hash':
+        return f"order-{get_shard(order.order_id, shards)}"
+
+    if strategy == 'warehouse':
+        warehouse = (order.warehouse_name or {}).get('warehouse')
+        return f"warehouse-{slugify(warehouse)}-{get_shard(order.order_id, shards)}"
+
+    if strategy == 'partner':
+        if is_priority(order):
+            return f"priority-{get_shard(order.order_id, PRIORITY_GROUP_SHARDS)}"
+        return f"partner-{slugify(order.trading_partner)}-{get_shard(order.order_id, shards)}"
+
+    raise ValueError(f"Invalid message group strategy: {strategy}")
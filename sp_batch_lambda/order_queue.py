@@ -0,0 +1,125 @@
+import random
+import time
+
+
+# SendMessageBatch limits
+MAX_BATCH_ENTRIES = 10
+MAX_REQUEST_BYTES = 256 * 1024
+
+
+
+def entry_size(entry):
+    """
+    Returns the size SQS counts for a batch entry: the body plus every attribute name, type and value.
+    """
+    size = len(entry['MessageBody'].encode('utf-8'))
+    for name, attribute in entry.get('MessageAttributes', {}).items():
+        size += len(name.encode('utf-8')) + len(attribute.get('DataType', '').encode('utf-8'))
+        size += len(str(attribute.get('StringValue', attribute.get('BinaryValue', ''))).encode('utf-8'))
+    return size
+
+
+
+class OrderQueueBatcher:
+    """
+    Sends order messages to an SQS queue with SendMessageBatch.
+
+    The queue URL is resolved once. Messages are packed into batches of up to 10 entries that stay
+    under the 256 KB request limit, a batch is sent as soon as the next message doesn't fit. Entries
+    the batch response reports as failed are retried on their own with jittered exponential backoff,
+    entries that failed because of the request itself (SenderFault) are not retried.
+
+    Usage:
+        with OrderQueueBatcher(sqs_client, 'SporticultureOrderQueue.fifo') as batcher:
+            batcher.add(str(order.order_id), message)
+    """
+
+    def __init__(self, sqs_client, queue_name, max_retries=3, delay=0.2):
+        """
+        Args:
+            sqs_client: The Boto3 SQS client (or a LocalSQS).
+            queue_name (str): Name of the target queue.
+            max_retries (int): Retries of the failed entries of a batch.
+            delay (float): Base delay of the backoff between retries in seconds.
+        """
+        self.sqs_client = sqs_client
+        self.queue_url = sqs_client.get_queue_url(QueueName=queue_name)['QueueUrl']
+        self.max_retries = max_retries
+        self.delay = delay
+        self.pending = []
+        self.pending_bytes = 0
+        self.sent = 0
+        self.failed_ids = []
+
+    def add(self, entry_id, message):
+        """
+        Adds a message to the current batch, sending the batch first if the message doesn't fit.
+
+        Args:
+            entry_id (str): Id of the entry, unique within a batch (e.g. the order id).
+            message (dict): The send_message arguments without QueueUrl (MessageBody, MessageAttributes, ...).
+
+        Returns:
+            bool: False if the message is too large to be sent at all.
+        """
+        entry = dict(message, Id=entry_id)
+        size = entry_size(entry)
+        if size > MAX_REQUEST_BYTES:
+            print(f"[X] Message {entry_id} is {size} bytes, over the SQS limit of {MAX_REQUEST_BYTES}")
+            self.failed_ids.append(entry_id)
+            return False
+
+        # Entry ids must be distinct within a batch
+        is_duplicate = any(pending['Id'] == entry_id for pending in self.pending)
+        if is_duplicate or len(self.pending) == MAX_BATCH_ENTRIES or self.pending_bytes + size > MAX_REQUEST_BYTES:
+            self.flush()
+
+        self.pending.append(entry)
+        self.pending_bytes += size
+        return True
+
+    def flush(self):
+        """
+        Sends the current batch, retrying only the entries that failed.
+        """
+        entries = self.pending
+        self.pending = []
+        self.pending_bytes = 0
+
+        for attempt in range(self.max_retries + 1):
+            if not entries:
+                return
+
+            try:
+                response = self.sqs_client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            except Exception as e:
+                print(f"[X] SendMessageBatch of {len(entries)} message(s) failed with error: {e}")
+            else:
+                self.sent += len(response.get('Successful', []))
+
+                retry_ids = set()
+                for failure in response.get('Failed', []):
+                    if failure.get('SenderFault'):
+                        print(f"[X] Message {failure['Id']} rejected by SQS: {failure.get('Code')} {failure.get('Message')}")
+                        self.failed_ids.append(failure['Id'])
+                    else:
+                        retry_ids.add(failure['Id'])
+                entries = [entry for entry in entries if entry['Id'] in retry_ids]
+
+            if entries and attempt < self.max_retries:
+                time.sleep(random.uniform(0, self.delay * 2 ** attempt))
+
+        if entries:
+            print(f"[X] {len(entries)} message(s) failed to send to queue after {self.max_retries} retries")
+            self.failed_ids.extend(entry['Id'] for entry in entries)
+
+    def close(self):
+        if self.pending:
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
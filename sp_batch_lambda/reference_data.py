@@ -0,0 +1,190 @@
+'''
+Reference data shared by both Lambdas: ShipStation tag, store, warehouse and shipping provider ids, warehouse
+addresses and the ShipStation service names and codes (resolved by the main Lambda's service_registry.py).
+
+The data is one versioned JSON snapshot, reference_data.json next to this module unless REFERENCE_DATA_URI
+points somewhere else ("s3://bucket/key" or a file path). It is parsed once per container into read-only
+tables (MappingProxyType) that every order shares. Every REFERENCE_DATA_RELOAD_SECONDS the source is checked
+for a change (S3 ETag / file mtime) and, if its "version" differs, the new snapshot replaces the current one,
+so new warehouses or tags don't need a deploy. A snapshot that fails to load or parse leaves the current
+one in place.
+
+    snapshot = get_reference_data()
+    snapshot.tags['Ready']  -> 55809
+'''
+
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import boto3
+
+REFERENCE_DATA_URI = os.environ.get(
+    'REFERENCE_DATA_URI', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reference_data.json')
+)
+REFERENCE_DATA_RELOAD_SECONDS = int(os.environ.get('REFERENCE_DATA_RELOAD_SECONDS', '300'))
+
+ADDRESS_FIELDS = ('name', 'street1', 'city', 'state', 'postal_code', 'country', 'phone', 'residential')
+
+
+
+def freeze(value):
+    """
+    Returns a read-only copy of parsed JSON: dicts become MappingProxyType, lists become tuples.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+
+def int_keys(table):
+    # JSON object keys are strings, ShipStation ids are ints
+    return {int(key): value for key, value in table.items()}
+
+
+
+class ReferenceData:
+    """
+    One immutable snapshot of the reference data.
+    """
+
+    __slots__ = (
+        'version', 'tags', 'stores', 'shipstation_warehouses', 'warehouse_addresses', 'warehouse_ids',
+        'default_warehouse', 'warehouse_names', 'shipping_provider_ids', 'service_codes', 'service_aliases',
+        'usps_delivery_services',
+    )
+
+    def __init__(self, data):
+        self.version = str(data['version'])
+        self.tags = freeze(data['tags'])
+        self.stores = freeze(int_keys(data['stores']))
+        self.shipstation_warehouses = freeze(int_keys(data['shipstation_warehouses']))
+        self.warehouse_addresses = freeze(data['warehouse_addresses'])
+        self.warehouse_ids = freeze(int_keys(data['warehouse_ids']))
+        self.default_warehouse = data['default_warehouse']
+        self.warehouse_names = freeze(data['warehouse_names'])
+        self.shipping_provider_ids = freeze(data['shipping_provider_ids'])
+        self.service_codes = freeze(data['service_codes'])
+        # Carrier API spellings of ShipStation services and the USPS API service of a ShipStation service code
+        self.service_aliases = freeze(data.get('service_aliases', {}))
+        self.usps_delivery_services = freeze(data.get('usps_delivery_services', {}))
+
+        # Every warehouse reference must resolve to an address
+        locations = list(self.warehouse_ids.values()) + list(self.warehouse_names.values()) + [self.default_warehouse]
+        missing = set(locations) - set(self.warehouse_addresses)
+        if missing:
+            raise ValueError(f"Reference data {self.version}: no address for warehouse(s) {sorted(missing)}")
+
+    def get_address_by_warehouse_id(self, warehouse_id):
+        """
+        Returns the address of a ShipStation warehouse id, the default warehouse for None, None if unknown.
+        """
+        if warehouse_id is None:
+            return self.warehouse_addresses[self.default_warehouse]
+        location = self.warehouse_ids.get(warehouse_id)
+        return self.warehouse_addresses[location] if location else None
+
+    def get_address_by_warehouse_name(self, warehouse_name):
+        """
+        Returns the address of a warehouse name (Order.warehouse_name['warehouse']), None if unknown.
+        """
+        location = self.warehouse_names.get(warehouse_name)
+        return self.warehouse_addresses[location] if location else None
+
+
+
+def set_address(address, record):
+    """
+    Copies a warehouse address record onto an Address object.
+    """
+    for name in ADDRESS_FIELDS:
+        setattr(address, name, record[name])
+
+
+
+def read_source(uri, last_marker=None):
+    """
+    Reads the snapshot source unless it hasn't changed since last_marker.
+
+    Returns:
+        tuple: (marker, text), text is None when the source is unchanged.
+    """
+    if uri.startswith('s3://'):
+        bucket, _, key = uri[len('s3://'):].partition('/')
+        s3_client = boto3.client('s3')
+        marker = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+        if marker == last_marker:
+            return marker, None
+        return marker, s3_client.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+
+    marker = os.path.getmtime(uri)
+    if marker == last_marker:
+        return marker, None
+    with open(uri, 'r', encoding='utf-8') as file:
+        return marker, file.read()
+
+
+
+class ReferenceDataLoader:
+    """
+    Holds the current snapshot of a source and swaps it when a newer version is published.
+    """
+
+    def __init__(self, uri=REFERENCE_DATA_URI, reload_seconds=REFERENCE_DATA_RELOAD_SECONDS):
+        self.uri = uri
+        self.reload_seconds = reload_seconds
+        self._snapshot = None
+        self._marker = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.reload_seconds:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= self.reload_seconds:
+                self.reload()
+            return self._snapshot
+
+    def reload(self):
+        """
+        Loads the source if it changed and switches to it if its version is new. The first load raises
+        on failure, later ones keep the current snapshot.
+        """
+        self._checked_at = time.monotonic()
+        try:
+            marker, text = read_source(self.uri, self._marker)
+            if text is None:
+                return
+            snapshot = ReferenceData(json.loads(text))
+        except Exception as e:
+            if self._snapshot is None:
+                raise
+            print(f"[!] Could not reload reference data from {self.uri}, keeping {self._snapshot.version}: {e}")
+            return
+
+        self._marker = marker
+        if self._snapshot is None or snapshot.version != self._snapshot.version:
+            if self._snapshot is not None:
+                print(f"[+] Reference data updated from {self._snapshot.version} to {snapshot.version}")
+            self._snapshot = snapshot
+
+
+
+# Shared by every order handled by this container
+reference_data = ReferenceDataLoader()
+
+
+
+def get_reference_data():
+    """
+    Returns the current reference data snapshot, loading or refreshing it when due.
+    """
+    return reference_data.get()
@@ -0,0 +1,121 @@
+'''
+Process-wide access to AWS Secrets Manager.
+
+One Secrets Manager client is shared by the whole container and secrets are cached in memory, so warm
+invocations don't pay a Secrets Manager round trip for every API call that needs credentials.
+
+Offline runs and tests can bypass Secrets Manager with a local stand-in:
+    SECRET_<NAME>       JSON of a single secret, e.g. SECRET_USPSAPICREDENTIALS='{"username": "...", "password": "..."}'
+    LOCAL_SECRETS_FILE  Path to a JSON file mapping secret names to their JSON value
+'''
+
+import json
+import os
+import re
+import threading
+import time
+
+import boto3
+
+# Seconds a secret stays cached before it is fetched again
+SECRETS_CACHE_TTL = int(os.environ.get('SECRETS_CACHE_TTL', '3600'))
+
+_client = None
+_cache = {}  # secret_name -> (expires_at, secret_dict)
+_lock = threading.RLock()
+
+
+
+def get_client():
+    """
+    Returns the Secrets Manager client shared by the container, creating it on first use.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = boto3.client('secretsmanager')
+    return _client
+
+
+
+def get_local_secret(secret_name):
+    """
+    Looks the secret up in the local stand-in (environment variable or LOCAL_SECRETS_FILE).
+
+    Parameters:
+    secret_name (str): The name of the secret.
+
+    Returns:
+    dict or None: The secret as a dict, None if no local value is configured.
+    """
+    env_name = "SECRET_" + re.sub(r'\W', '_', secret_name).upper()
+    if os.environ.get(env_name):
+        return json.loads(os.environ[env_name])
+
+    file_path = os.environ.get('LOCAL_SECRETS_FILE')
+    if file_path:
+        with open(file_path, 'r') as file:
+            local_secrets = json.load(file)
+        return local_secrets.get(secret_name)
+
+    return None
+
+
+
+def get_secret_dict(secret_name):
+    """
+    Retrieve a secret as a dict, from the in-memory cache when it has not expired.
+
+    Parameters:
+    secret_name (str): The name of the secret in AWS Secrets Manager.
+
+    Returns:
+    dict: The parsed SecretString.
+
+    Raises:
+    botocore.exceptions.ClientError: If Secrets Manager can't return the secret.
+    """
+    with _lock:
+        cached = _cache.get(secret_name)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        secret_dict = get_local_secret(secret_name)
+        if secret_dict is None:
+            get_secret_value_response = get_client().get_secret_value(SecretId=secret_name)
+            secret_dict = json.loads(get_secret_value_response['SecretString'])
+
+        _cache[secret_name] = (time.monotonic() + SECRETS_CACHE_TTL, secret_dict)
+        return secret_dict
+
+
+
+def get_secret(secret_name, key_field='api_key', secret_field='api_secret'):
+    """
+    Retrieve the API key and secret of a secret.
+
+    Parameters:
+    secret_name (str): The name of the secret in AWS Secrets Manager.
+    key_field (str): The field holding the key / username.
+    secret_field (str): The field holding the secret / password.
+
+    Returns:
+    tuple: A tuple containing the api_key and api_secret as strings.
+    """
+    secret_dict = get_secret_dict(secret_name)
+    return secret_dict[key_field], secret_dict[secret_field]
+
+
+
+def invalidate_secret(secret_name=None):
+    """
+    Drop a secret from the cache so the next lookup fetches it again, e.g. after a call returned 401.
+
+    Parameters:
+    secret_name (str or None): The secret to drop, None drops every cached secret.
+    """
+    with _lock:
+        if secret_name is None:
+            _cache.clear()
+        else:
+            _cache.pop(secret_name, None)
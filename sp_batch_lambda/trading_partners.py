@@ -0,0 +1,84 @@
+'''
+Trading partner classification of orders, shared by the batch Lambda (producer) and the main Lambda
+(consumer) so both sides agree on which orders get rated.
+
+The trading partner follows from the ShipStation store and, for the EDI and Sporticulture stores, the
+order number prefix. Only the ACTIONABLE_TRADING_PARTNERS are rated by the main Lambda, the batch
+Lambda doesn't enqueue the others.
+'''
+
+import os
+
+# Comma separated, e.g. "Fanatics,Amazon,CBS"
+ACTIONABLE_TRADING_PARTNERS = tuple(
+    partner.strip() for partner in os.environ.get('ACTIONABLE_TRADING_PARTNERS', 'Fanatics,Amazon').split(',')
+    if partner.strip()
+)
+
+# Carrier codes the main Lambda shops rates for, per trading partner (none when not listed)
+TRADING_PARTNER_CARRIERS = {
+    "Fanatics":                 ["External Account"],
+    "Target":                   ["External Account"],
+    "Rally House":              ["Automated on Shipstation UI"],
+    "Amazon":                   ["ups", "fedex", "stamps_com", "ups_walleted"],
+    "JoAnn":                    ["Automated on Shipstation UI"],
+    "CBS":                      ["ups", "ups_walleted", "fedex", "stamps_com"],
+    "Sporticulture":            ["ups", "ups_walleted", "fedex", "stamps_com"],
+    "Sharper Image":            ["Automated on Shipstation UI"],
+    "Stadium Allstars":         ["Automated on Shipstation UI"],
+}
+
+# Stores with a single trading partner
+STORE_TRADING_PARTNERS = {
+    "Amazon":                   "Amazon",
+    "JoAnn Fabric & Crafts":    "JoAnn",
+    "Sharper Image":            "Sharper Image",
+    "Stadium Allstars":         "Stadium Allstars",
+    "Sporticulture Wholesale":  "Sporticulture Wholesale",
+    "Walmart Wholesale":        "Walmart",
+}
+
+# TC EDI order number prefixes
+TC_EDI_PREFIXES = (
+    ("DS", "Fanatics"),
+    ("7", "Target"),
+    ("3", "Rally House"),
+)
+
+CBS_KEYWORDS = ("CBSD", "RSAD", "AMSD")
+
+
+
+def get_trading_partner(store_name, order_number):
+    """
+    Classifies an order by trading partner.
+
+    Args:
+        store_name (str): The ShipStation store name of the order.
+        order_number (str): The ShipStation order number.
+
+    Returns:
+        str: The trading partner, "Unknown" when no rule matches.
+    """
+    order_number = order_number or ""
+
+    if store_name == "TC EDI":
+        for prefix, trading_partner in TC_EDI_PREFIXES:
+            if order_number.startswith(prefix):
+                return trading_partner
+        return "Unknown"
+
+    if store_name == "Sporticulture":
+        if any(word in order_number for word in CBS_KEYWORDS):
+            return "CBS"
+        return "Sporticulture"
+
+    return STORE_TRADING_PARTNERS.get(store_name, "Unknown")
+
+
+
+def is_actionable(trading_partner):
+    """
+    Returns True if orders of the trading partner are rated by the main Lambda.
+    """
+    return trading_partner in ACTIONABLE_TRADING_PARTNERS
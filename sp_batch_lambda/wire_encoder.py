@@ -0,0 +1,80 @@
+'''
+Compact wire format of the order messages sent to SporticultureOrderQueue.fifo.
+
+    {"v": 1, "order": {...}}
+
+"order" holds the fields of the Order dataclass and its nested Shipment, Customer, Address and Item
+objects under their attribute names, exactly what main_lambda's decoder (main_lambda/wire_decoder.py)
+needs to rebuild them. Compared to json.dumps(order.as_dict()) it leaves out:
+    - order_data_raw, a second full copy of the ShipStation payload
+    - the client and session slots, and the rating state that is always empty on the producer side
+    - every field that is None, the decoder fills those in
+
+The encoder reads the attributes directly instead of going through dataclasses.asdict, so nothing is
+deep-copied. Bump WIRE_FORMAT_VERSION when the layout changes, the consumer rejects versions it doesn't know.
+'''
+
+from dataclasses import fields, is_dataclass
+
+WIRE_FORMAT_VERSION = 1
+
+# Order attributes that are never sent
+EXCLUDED_FIELDS = frozenset([
+    'order_data_raw',
+    'ss_client',
+    'fedex_session',
+    'ups_session',
+    'rates',
+    'winning_rate',
+    'mapping_services',
+    'deliver_by_date',
+])
+
+_field_names = {}  # dataclass -> tuple of field names
+
+
+
+def get_field_names(cls):
+    names = _field_names.get(cls)
+    if names is None:
+        names = _field_names[cls] = tuple(field.name for field in fields(cls))
+    return names
+
+
+
+def encode_value(value):
+    if is_dataclass(value):
+        return encode_dataclass(value)
+    if isinstance(value, list) and value and is_dataclass(value[0]):
+        return [encode_dataclass(element) for element in value]
+    # Plain dicts and lists (weight, dimensions, advanced_options...) are referenced, not copied
+    return value
+
+
+
+def encode_dataclass(obj, excluded=frozenset()):
+    """
+    Returns the fields of a dataclass instance as a dict, without the None values.
+    """
+    encoded = {}
+    for name in get_field_names(type(obj)):
+        if name in excluded:
+            continue
+        value = getattr(obj, name, None)
+        if value is not None:
+            encoded[name] = encode_value(value)
+    return encoded
+
+
+
+def encode_order(order_object):
+    """
+    Encodes an Order into the compact wire format.
+
+    Args:
+        order_object (Order): The order to send.
+
+    Returns:
+        dict: The message, ready for json.dumps.
+    """
+    return {"v": WIRE_FORMAT_VERSION, "order": encode_dataclass(order_object, EXCLUDED_FIELDS)}
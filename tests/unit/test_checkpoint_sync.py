@@ -0,0 +1,143 @@
+import os
+import sys
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+# The batch Lambda is imported as a package (sp_batch_lambda.main) and uses flat imports internally
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'sp_batch_lambda')))
+os.environ['LOCAL_SQS'] = 'true'
+
+import sp_batch_lambda.checkpoint_store as checkpoint_store
+import sp_batch_lambda.functions as functions
+import sp_batch_lambda.main as batch_main
+from sp_batch_lambda.checkpoint_store import DynamoDBCheckpointStore, FileCheckpointStore
+
+
+NOW = 1714560000.0
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class FakeTable:
+    """ Stands in for a DynamoDB Table, put_item applies the modify_date condition """
+
+    def __init__(self):
+        self.item = None
+        self.meta = SimpleNamespace(client=SimpleNamespace(
+            exceptions=SimpleNamespace(ConditionalCheckFailedException=ConditionalCheckFailedException)
+        ))
+
+    def get_item(self, Key, ConsistentRead):
+        return {'Item': self.item} if self.item else {}
+
+    def put_item(self, Item, ConditionExpression, ExpressionAttributeValues):
+        stored = (self.item or {}).get('modify_date')
+        if stored is not None and stored > ExpressionAttributeValues[':modify_date']:
+            raise ConditionalCheckFailedException()
+        self.item = Item
+
+
+@pytest.fixture()
+def dynamodb_store():
+    store = DynamoDBCheckpointStore.__new__(DynamoDBCheckpointStore)
+    store.table = FakeTable()
+    store.checkpoint_id = 'test'
+    return store
+
+
+def test_file_store_round_trip(tmp_path):
+    store = FileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    assert store.load() == {}
+
+    checkpoint = {'modify_date': '2024-05-01T12:34:56.1230000', 'last_full_sync': 1714560000.0}
+    assert store.save(checkpoint) is True
+    assert store.load() == checkpoint
+
+
+def test_file_store_does_not_move_modify_date_backwards(tmp_path):
+    store = FileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    store.save({'modify_date': '2024-05-02T00:00:00.0000000'})
+
+    assert store.save({'modify_date': '2024-05-01T00:00:00.0000000'}) is False
+    assert store.load()['modify_date'] == '2024-05-02T00:00:00.0000000'
+
+
+def test_unreadable_file_is_an_empty_checkpoint(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text("{not json")
+
+    assert FileCheckpointStore(str(path)).load() == {}
+
+
+def test_dynamodb_store_round_trip(dynamodb_store):
+    assert dynamodb_store.load() == {}
+
+    assert dynamodb_store.save({'modify_date': '2024-05-01T12:34:56.1230000', 'last_full_sync': 1714560000.5}) is True
+    # boto3 rejects floats, the timestamp is stored as a whole number and read back as a Decimal
+    assert dynamodb_store.table.item['last_full_sync'] == 1714560000
+    dynamodb_store.table.item['last_full_sync'] = Decimal(1714560000)
+
+    assert dynamodb_store.load() == {'modify_date': '2024-05-01T12:34:56.1230000', 'last_full_sync': 1714560000.0}
+
+
+def test_dynamodb_store_does_not_move_modify_date_backwards(dynamodb_store):
+    dynamodb_store.save({'modify_date': '2024-05-02T00:00:00.0000000'})
+
+    assert dynamodb_store.save({'modify_date': '2024-05-01T00:00:00.0000000'}) is False
+    assert dynamodb_store.load()['modify_date'] == '2024-05-02T00:00:00.0000000'
+
+
+def test_store_is_picked_from_the_settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(checkpoint_store, 'CHECKPOINT_TABLE', None)
+    monkeypatch.setattr(checkpoint_store, 'CHECKPOINT_FILE', None)
+    assert checkpoint_store.get_checkpoint_store() is None
+
+    monkeypatch.setattr(checkpoint_store, 'CHECKPOINT_FILE', str(tmp_path / "checkpoint.json"))
+    assert isinstance(checkpoint_store.get_checkpoint_store(), FileCheckpointStore)
+
+
+@pytest.mark.parametrize("checkpoint, sync_mode, expected", [
+    ({}, 'auto', 'full'),
+    ({}, 'incremental', 'full'),
+    ({'modify_date': '2024-05-01T00:00:00.0000000', 'last_full_sync': NOW - 60}, 'full', 'full'),
+    ({'modify_date': '2024-05-01T00:00:00.0000000', 'last_full_sync': NOW - 60}, 'incremental', 'incremental'),
+    ({'modify_date': '2024-05-01T00:00:00.0000000', 'last_full_sync': NOW - 60}, 'auto', 'incremental'),
+    ({'modify_date': '2024-05-01T00:00:00.0000000'}, 'auto', 'full'),
+])
+def test_plan_sync(checkpoint, sync_mode, expected):
+    assert batch_main.plan_sync(checkpoint, sync_mode, now=NOW) == expected
+
+
+def test_auto_sync_is_full_once_the_interval_has_passed():
+    checkpoint = {'modify_date': '2024-05-01T00:00:00.0000000', 'last_full_sync': NOW}
+
+    assert batch_main.plan_sync(checkpoint, 'auto', now=NOW + batch_main.FULL_SYNC_INTERVAL - 1) == 'incremental'
+    assert batch_main.plan_sync(checkpoint, 'auto', now=NOW + batch_main.FULL_SYNC_INTERVAL) == 'full'
+
+
+def test_invalid_sync_mode():
+    with pytest.raises(ValueError):
+        batch_main.plan_sync({}, 'sometimes')
+
+
+def test_track_modify_date_keeps_the_highest_date():
+    watermark = {'modify_date': None}
+    pages = [
+        [{'modifyDate': '2024-05-01T10:00:00.0000000'}, {'modifyDate': '2024-05-01T12:00:00.0000000'}],
+        None,
+        [{'modifyDate': '2024-05-01T11:00:00.0000000'}, {}],
+    ]
+
+    assert list(batch_main.track_modify_date(pages, watermark)) == pages
+    assert watermark['modify_date'] == '2024-05-01T12:00:00.0000000'
+
+
+def test_incremental_filters_start_before_the_checkpoint():
+    filters = functions.get_incremental_filters('2024-05-01T12:34:56.1230000', overlap=300)
+
+    assert filters == {'modify_date_start': '2024-05-01 12:29:56', 'sort_by': 'ModifyDate', 'sort_dir': 'ASC'}
@@ -0,0 +1,65 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import fedex_api
+from rate_table import RateTable
+from transit_cache import transit_cache
+
+
+RESPONSE = {"output": {"rateReplyDetails": [
+    {"serviceName": "FedEx Ground®", "commit": {"dateDetail": {"dayFormat": "2024-05-06T20:00:00"}}},
+    {"serviceName": "FedEx SmartPost®", "commit": {"dateDetail": {"dayFormat": "2024-05-08T20:00:00"}}},
+]}}
+
+
+@pytest.fixture()
+def order():
+    return SimpleNamespace(
+        rates=RateTable.from_dict({"fedex": [("FedEx Ground®", 9.5), ("FedEx SmartPost parcel select", 7.25)]}),
+        is_single_stream=False,
+        Customer=SimpleNamespace(ship_to=SimpleNamespace(postal_code="90210", residential=False)),
+        Shipment=SimpleNamespace(
+            warehouse=SimpleNamespace(postal_code="34243"), ship_date="2024-05-01", weight={"value": 20},
+            smart_post_date=None,
+        ),
+    )
+
+
+@pytest.fixture()
+def fedex_response(monkeypatch):
+    """ Answers the FedEx rate quote with RESPONSE, recording the deadline of every call """
+
+    deadlines = []
+
+    def get_fedex_response(order, deadline=None):
+        deadlines.append(deadline)
+        return RESPONSE
+
+    monkeypatch.setattr(fedex_api, "get_fedex_response", get_fedex_response)
+    transit_cache.clear()
+    yield deadlines
+    transit_cache.clear()
+
+
+def test_candidates_are_looked_up_without_changing_the_order(order, fedex_response):
+    candidates = fedex_api.get_fedex_candidates(order, deadline=123.0)
+
+    assert [(candidate.service_code, candidate.price) for candidate in candidates] == [
+        ("FedEx Ground®", 9.5), ("FedEx SmartPost parcel select", 7.25)
+    ]
+    assert order.Shipment.smart_post_date is None
+    assert fedex_response == [123.0]
+
+
+def test_smart_post_date_is_written_by_the_caller(order, fedex_response):
+    candidates = fedex_api.get_fedex_candidates(order)
+
+    fedex_api.set_smart_post_date(order, candidates)
+
+    assert order.Shipment.smart_post_date == "SmartPost D-Date: 2024-05-08"
@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import fedex_api
+
+
+@pytest.fixture()
+def order():
+    """ Order of 20 oz shipped from 12345 (NY) to 90210 (CA) """
+
+    return SimpleNamespace(
+        Shipment=SimpleNamespace(
+            warehouse=SimpleNamespace(postal_code="12345", state="NY", country="US"),
+            ship_date="2024-05-01",
+            weight={"value": 20},
+        ),
+        Customer=SimpleNamespace(ship_to=SimpleNamespace(postal_code="90210-1234", state="CA", country="US")),
+    )
+
+
+def test_set_payload_fills_the_order_fields(order):
+    payload = fedex_api.set_payload(order)
+    shipment = payload["requestedShipment"]
+
+    assert shipment["shipper"]["address"] == {"postalCode": "12345", "stateOrProvinceCode": "NY", "countryCode": "US"}
+    assert shipment["recipient"]["address"]["postalCode"] == "90210"
+    assert shipment["shipDateStamp"] == "2024-05-01"
+    assert shipment["requestedPackageLineItems"] == [{"weight": {"units": "LB", "value": 1.25}}]
+
+
+def test_set_payload_keeps_the_template_fields(order):
+    payload = fedex_api.set_payload(order)
+
+    assert payload["accountNumber"] == fedex_api.PAYLOAD_TEMPLATE["accountNumber"]
+    assert payload["carrierCodes"] == fedex_api.PAYLOAD_TEMPLATE["carrierCodes"]
+    assert payload["requestedShipment"]["pickupType"] == fedex_api.PAYLOAD_TEMPLATE["requestedShipment"]["pickupType"]
+
+
+def test_set_payload_multi_piece(order):
+    items = fedex_api.set_payload(order, package_weights=[16, 32])["requestedShipment"]["requestedPackageLineItems"]
+
+    assert [item["weight"]["value"] for item in items] == [1.0, 2.0]
+
+
+def test_set_payload_leaves_the_template_untouched(order):
+    template = json.dumps(fedex_api.PAYLOAD_TEMPLATE, sort_keys=True)
+
+    payload = fedex_api.set_payload(order)
+    payload["carrierCodes"].append("FDXC")
+
+    assert json.dumps(fedex_api.PAYLOAD_TEMPLATE, sort_keys=True) == template
@@ -0,0 +1,123 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import sp_batch_lambda.order_queue as order_queue
+from sp_batch_lambda.order_queue import OrderQueueBatcher, entry_size, MAX_BATCH_ENTRIES, MAX_REQUEST_BYTES
+
+
+class FakeSQS:
+    """ Records SendMessageBatch calls, entries listed in `failures` fail once with the given SenderFault """
+
+    def __init__(self, failures=None, errors=0):
+        self.batches = []
+        self.failures = dict(failures or {})
+        self.errors = errors
+
+    def get_queue_url(self, QueueName):
+        return {"QueueUrl": f"https://sqs.local/{QueueName}"}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.batches.append([entry["Id"] for entry in Entries])
+        if self.errors:
+            self.errors -= 1
+            raise ConnectionError("connection reset")
+
+        failed = [
+            {"Id": entry["Id"], "SenderFault": self.failures.pop(entry["Id"]), "Code": "InternalError"}
+            for entry in Entries if entry["Id"] in self.failures
+        ]
+        failed_ids = {failure["Id"] for failure in failed}
+        return {
+            "Successful": [{"Id": entry["Id"]} for entry in Entries if entry["Id"] not in failed_ids],
+            "Failed": failed,
+        }
+
+
+def message(body_bytes=10):
+    return {"MessageBody": "x" * body_bytes, "MessageGroupId": "group-1"}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(order_queue, "time", SimpleNamespace(sleep=lambda seconds: None))
+
+
+def test_batches_hold_at_most_10_entries():
+    sqs = FakeSQS()
+    with OrderQueueBatcher(sqs, "SporticultureOrderQueue.fifo") as batcher:
+        for number in range(25):
+            batcher.add(str(number), message())
+
+    assert [len(batch) for batch in sqs.batches] == [MAX_BATCH_ENTRIES, MAX_BATCH_ENTRIES, 5]
+    assert batcher.sent == 25 and batcher.failed_ids == []
+
+
+def test_batches_stay_under_256_kb():
+    sqs = FakeSQS()
+    with OrderQueueBatcher(sqs, "SporticultureOrderQueue.fifo") as batcher:
+        for number in range(4):
+            batcher.add(str(number), message(100 * 1024))
+
+    assert sqs.batches == [["0", "1"], ["2", "3"]]
+
+
+def test_message_over_the_limit_is_not_sent():
+    sqs = FakeSQS()
+    with OrderQueueBatcher(sqs, "SporticultureOrderQueue.fifo") as batcher:
+        assert batcher.add("big", message(MAX_REQUEST_BYTES + 1)) is False
+
+    assert sqs.batches == []
+    assert batcher.failed_ids == ["big"]
+
+
+def test_duplicate_id_starts_a_new_batch():
+    sqs = FakeSQS()
+    with OrderQueueBatcher(sqs, "SporticultureOrderQueue.fifo") as batcher:
+        batcher.add("1", message())
+        batcher.add("1", message())
+
+    assert sqs.batches == [["1"], ["1"]]
+
+
+def test_only_failed_entries_are_retried():
+    sqs = FakeSQS(failures={"2": False})
+    with OrderQueueBatcher(sqs, "SporticultureOrderQueue.fifo") as batcher:
+        for number in range(3):
+            batcher.add(str(number), message())
+
+    assert sqs.batches == [["0", "1", "2"], ["2"]]
+    assert batcher.sent == 3 and batcher.failed_ids == []
+
+
+def test_sender_fault_is_not_retried():
+    sqs = FakeSQS(failures={"1": True})
+    with OrderQueueBatcher(sqs, "SporticultureOrderQueue.fifo") as batcher:
+        batcher.add("0", message())
+        batcher.add("1", message())
+
+    assert sqs.batches == [["0", "1"]]
+    assert batcher.sent == 1 and batcher.failed_ids == ["1"]
+
+
+def test_failed_request_is_retried_up_to_max_retries():
+    sqs = FakeSQS(errors=10)
+    with OrderQueueBatcher(sqs, "SporticultureOrderQueue.fifo", max_retries=2) as batcher:
+        batcher.add("0", message())
+        batcher.add("1", message())
+
+    assert len(sqs.batches) == 3
+    assert batcher.sent == 0 and batcher.failed_ids == ["0", "1"]
+
+
+def test_entry_size_counts_the_attributes():
+    entry = {
+        "MessageBody": "abc",
+        "MessageAttributes": {"Fingerprint": {"DataType": "String", "StringValue": "1234"}},
+    }
+
+    assert entry_size(entry) == len("abc") + len("Fingerprint") + len("String") + len("1234")
@@ -0,0 +1,39 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The batch Lambda is imported as a package (sp_batch_lambda.main) and uses flat imports internally
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'sp_batch_lambda')))
+os.environ['LOCAL_SQS'] = 'true'
+
+import sp_batch_lambda.functions as functions
+import sp_batch_lambda.main as batch_main
+from sp_batch_lambda.fingerprint import get_rating_inputs
+
+
+@pytest.fixture()
+def order():
+    """ Builds the Order of the sample order, shipped from a known warehouse (590152) """
+
+    return batch_main.build_order(functions.temp_order()[0])
+
+
+@pytest.mark.parametrize("wire_format", ["compact", "legacy"])
+def test_build_queue_message(order, wire_format, monkeypatch):
+    monkeypatch.setattr(functions, "QUEUE_WIRE_FORMAT", wire_format)
+
+    message = functions.build_queue_message(order)
+
+    assert isinstance(message["MessageBody"], str)
+    assert message["MessageGroupId"]
+    assert message["MessageDeduplicationId"]
+    assert message["MessageAttributes"]["RatingFingerprint"]["StringValue"]
+    json.dumps(message["MessageAttributes"])
+
+
+def test_warehouse_is_part_of_the_fingerprint(order):
+    assert order.warehouse_name == {"ss_account": "sporticulture", "warehouse": "Sporticulture"}
+    assert "Sporticulture" in get_rating_inputs(order)
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import rate_cache as rate_cache_module
+from rate_cache import RateCache, make_key
+
+
+class Clock:
+    """ Stands in for time.time() in rate_cache """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_cache_module.time, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = RateCache(ttl=900, max_size=10, file_path=None)
+    cache.put("lane", [{"serviceName": "UPS® Ground"}])
+
+    clock.now += 899
+    assert cache.get("lane") == [{"serviceName": "UPS® Ground"}]
+    clock.now += 2
+    assert cache.get("lane") is None
+
+
+def test_entry_ttl_is_shorter_than_the_cache_ttl(clock):
+    cache = RateCache(ttl=900, max_size=10, file_path=None)
+    cache.put("lane", [], ttl=5)
+
+    assert cache.get("lane") == []
+    clock.now += 6
+    assert cache.get("lane") is None
+
+
+def test_nothing_is_cached_with_a_ttl_of_zero(clock):
+    cache = RateCache(ttl=900, max_size=10, file_path=None)
+    cache.put("lane", [], ttl=0)
+    assert cache.get("lane") is None
+
+    disabled = RateCache(ttl=0, max_size=10, file_path=None)
+    disabled.put("lane", [], ttl=5)
+    assert disabled.get("lane") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = RateCache(ttl=900, max_size=2, file_path=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_saved_entries_are_loaded_by_a_new_cache(clock, tmp_path):
+    path = str(tmp_path / "rate_cache.json")
+    cache = RateCache(ttl=900, max_size=10, file_path=path)
+    cache.put("lane", [{"serviceName": "UPS® Ground"}])
+    cache.save()
+
+    assert RateCache(ttl=900, max_size=10, file_path=path).get("lane") == [{"serviceName": "UPS® Ground"}]
+    clock.now += 901
+    assert RateCache(ttl=900, max_size=10, file_path=path).get("lane") is None
+
+
+def test_make_key_uses_the_zip5_of_the_lane():
+    payload = {"carrierCode": "ups", "fromPostalCode": "34243", "toPostalCode": "90210-1234", "weight": {"value": 20}}
+
+    assert make_key(payload, "2024-05-01") == make_key(dict(payload, toPostalCode="90210"), "2024-05-01")
+    assert make_key(payload, "2024-05-01") != make_key(payload, "2024-05-02")
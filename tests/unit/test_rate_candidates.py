@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+from rate_candidates import (
+    Candidate, CandidateTable, GROUND_SAVER, SMARTPOST, UPS, USPS, FEDEX,
+    select_best_rows, get_champion_row, select_winning_rates, get_request_timeout, MIN_REQUEST_TIMEOUT,
+)
+
+
+DELIVER_BY = "05/10/2024 23:59:59"
+
+
+def day(number):
+    return datetime(2024, 5, number)
+
+
+def make_order(deliver_by_date=DELIVER_BY, is_single_stream=False):
+    return SimpleNamespace(deliver_by_date=deliver_by_date, is_single_stream=is_single_stream)
+
+
+def winning_rate(candidates, order=None):
+    table = CandidateTable()
+    table.extend(table.add_order(order or make_order()), candidates)
+    return select_winning_rates(table)[0]
+
+
+def test_candidates_due_after_the_deliver_by_date_are_skipped():
+    rate = winning_rate([
+        Candidate("ups", "UPS® Ground", 8.0, day(11)),
+        Candidate("ups", "UPS 2nd Day Air®", 15.0, day(9)),
+    ])
+
+    assert rate == {"carrierCode": "ups", "serviceCode": "UPS 2nd Day Air®", "price": 15.0}
+
+
+def test_due_date_is_compared_instead_of_the_delivery_date():
+    # Delivered on the 11th, but due (e.g. in UTC) on the 10th
+    rate = winning_rate([Candidate("stamps_com", "USPS Ground Advantage - Package", 6.0, day(11), day(10))])
+
+    assert rate["serviceCode"] == "USPS Ground Advantage - Package"
+
+
+def test_candidate_without_a_delivery_date_is_skipped():
+    assert winning_rate([Candidate("fedex", "FedEx Ground®", 9.0, None)]) is None
+
+
+@pytest.mark.parametrize("flags, service", [(GROUND_SAVER, "UPS® Ground Saver"), (SMARTPOST, "FedEx SmartPost parcel select")])
+def test_single_stream_orders_skip_ground_saver_and_smartpost(flags, service):
+    carrier = "ups" if flags == GROUND_SAVER else "fedex"
+    candidates = [
+        Candidate(carrier, service, 5.0, day(8), flags=flags),
+        Candidate(carrier, "Ground", 9.0, day(8)),
+    ]
+
+    assert winning_rate(candidates, make_order(is_single_stream=True))["serviceCode"] == "Ground"
+    assert winning_rate(candidates, make_order(is_single_stream=False))["serviceCode"] == service
+
+
+def test_smartpost_is_skipped_for_single_stream_even_when_it_is_the_only_fedex_option():
+    table = CandidateTable()
+    table.extend(table.add_order(make_order(is_single_stream=True)), [
+        Candidate("fedex", "FedEx SmartPost parcel select", 5.0, day(8), flags=SMARTPOST),
+    ])
+
+    assert select_best_rows(table) == [[None, None, None]]
+
+
+def test_usps_pays_up_to_the_margin_for_an_earlier_delivery():
+    rate = winning_rate([
+        Candidate("stamps_com", "USPS Ground Advantage - Package", 7.00, day(8)),
+        Candidate("stamps_com", "USPS Priority Mail - Package", 7.30, day(6)),
+    ])
+
+    assert rate["serviceCode"] == "USPS Priority Mail - Package"
+
+
+def test_usps_does_not_pay_more_than_the_margin():
+    rate = winning_rate([
+        Candidate("stamps_com", "USPS Ground Advantage - Package", 7.00, day(8)),
+        Candidate("stamps_com", "USPS Priority Mail - Package", 7.40, day(6)),
+    ])
+
+    assert rate["serviceCode"] == "USPS Ground Advantage - Package"
+
+
+def test_usps_upgrade_is_the_earliest_delivery_within_the_margin():
+    rate = winning_rate([
+        Candidate("stamps_com", "USPS Ground Advantage - Package", 7.00, day(8)),
+        Candidate("stamps_com", "USPS Priority Mail - Package", 7.10, day(7)),
+        Candidate("stamps_com", "USPS Priority Mail Express - Package", 7.20, day(5)),
+    ])
+
+    assert rate["serviceCode"] == "USPS Priority Mail Express - Package"
+
+
+def test_other_carriers_get_no_upgrade():
+    rate = winning_rate([
+        Candidate("ups", "UPS® Ground", 7.00, day(8)),
+        Candidate("ups", "UPS 2nd Day Air®", 7.10, day(6)),
+    ])
+
+    assert rate["serviceCode"] == "UPS® Ground"
+
+
+def test_equal_prices_go_to_ups_then_usps_then_fedex():
+    fedex = Candidate("fedex", "FedEx Ground®", 8.0, day(8))
+    usps = Candidate("stamps_com", "USPS Ground Advantage - Package", 8.0, day(8))
+    ups = Candidate("ups", "UPS® Ground", 8.0, day(8))
+
+    assert winning_rate([fedex, usps, ups])["carrierCode"] == "ups"
+    assert winning_rate([fedex, usps])["carrierCode"] == "stamps_com"
+
+
+def test_equal_prices_within_a_carrier_go_to_the_first_candidate():
+    rate = winning_rate([
+        Candidate("ups", "UPS® Ground", 8.0, day(8)),
+        Candidate("ups_walleted", "UPS® Ground", 8.0, day(8)),
+    ])
+
+    assert rate["carrierCode"] == "ups"
+
+
+def test_champion_row_is_the_cheapest_best_row():
+    table = CandidateTable()
+    table.extend(table.add_order(make_order()), [
+        Candidate("ups", "UPS® Ground", 9.0, day(8)),
+        Candidate("stamps_com", "USPS Ground Advantage - Package", 8.5, day(8)),
+        Candidate("fedex", "FedEx Ground®", 8.0, day(8)),
+    ])
+    best_rows = select_best_rows(table)[0]
+
+    assert best_rows == [0, 1, 2]
+    assert get_champion_row(table, best_rows) == 2
+    assert get_champion_row(table, [None, None, None]) is None
+
+
+def test_orders_of_a_table_are_decided_separately():
+    table = CandidateTable()
+    early = table.add_order(make_order("05/07/2024 23:59:59"))
+    late = table.add_order(make_order())
+    table.extend(early, [Candidate("ups", "UPS® Ground", 8.0, day(9)), Candidate("ups", "UPS Next Day Air®", 30.0, day(6))])
+    table.extend(late, [Candidate("ups", "UPS® Ground", 8.0, day(9))])
+
+    rates = select_winning_rates(table)
+
+    assert [rate["serviceCode"] for rate in rates] == ["UPS Next Day Air®", "UPS® Ground"]
+    assert select_best_rows(table)[late][UPS] == 2
+    assert select_best_rows(table)[late][USPS] is None and select_best_rows(table)[late][FEDEX] is None
+
+
+def test_request_timeout_without_a_deadline_is_the_default():
+    assert get_request_timeout(None) is None
+    assert get_request_timeout(None, (3.05, 10)) == (3.05, 10)
+
+
+def test_request_timeout_is_capped_at_the_deadline():
+    deadline = time.monotonic() + 5
+
+    assert 4 < get_request_timeout(deadline) <= 5
+    assert get_request_timeout(deadline, 2) == 2
+    assert 4 < get_request_timeout(deadline, 10) <= 5
+    connect, read = get_request_timeout(deadline, (3.05, 10))
+    assert connect == 3.05 and 4 < read <= 5
+
+
+def test_request_timeout_after_the_deadline_fails_fast():
+    assert get_request_timeout(time.monotonic() - 1, 10) == MIN_REQUEST_TIMEOUT
@@ -0,0 +1,112 @@
+import os
+import sys
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+class FakeTime:
+    """ Stands in for the time module in rate_limiter, sleep() moves the clock forward """
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_burst_is_sent_without_waiting(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    for _ in range(10):
+        limiter.acquire()
+
+    assert clock.slept == 0
+
+
+def test_requests_after_the_burst_are_paced_at_the_limit(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    for _ in range(10):
+        limiter.acquire()
+
+    limiter.acquire()
+
+    assert clock.slept == pytest.approx(60 / 40)
+
+
+def test_budget_is_learned_from_the_headers(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    limiter.update({"X-Rate-Limit-Limit": "40", "X-Rate-Limit-Remaining": "4", "X-Rate-Limit-Reset": "30"})
+
+    assert limiter.tokens == 4
+    # Nothing left to spread once the 4 remaining tokens are in the bucket
+    assert limiter.rate == 0
+    for _ in range(4):
+        limiter.acquire()
+    assert clock.slept == 0
+
+    # The fifth request waits for the window to reset
+    limiter.acquire()
+    assert clock.slept == pytest.approx(30)
+
+
+def test_remaining_budget_is_spread_until_the_reset(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    limiter.update({"X-Rate-Limit-Remaining": "25", "X-Rate-Limit-Reset": "30"})
+
+    assert limiter.tokens == 10
+    assert limiter.rate == pytest.approx((25 - 10) / 30)
+
+
+def test_window_reset_restores_the_full_limit(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    limiter.update({"X-Rate-Limit-Remaining": "0", "X-Rate-Limit-Reset": "20"})
+
+    clock.now += 20
+    limiter.acquire()
+
+    assert clock.slept == 0
+    assert limiter.rate == pytest.approx(40 / 60)
+    assert limiter.tokens == 9
+
+
+def test_responses_without_the_headers_leave_the_bucket_unchanged(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    limiter.update({})
+
+    assert limiter.tokens == 10
+    assert limiter.rate == pytest.approx(40 / 60)
+
+
+def test_pause_stops_requests_for_the_retry_after(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    limiter.pause("5")
+
+    limiter.acquire()
+
+    assert clock.slept == pytest.approx(5)
+
+
+def test_pause_without_retry_after_waits_a_window(clock):
+    limiter = RateLimiter(limit=40, window=60.0, burst=10)
+    limiter.pause(None)
+
+    limiter.acquire()
+
+    assert clock.slept == pytest.approx(60)
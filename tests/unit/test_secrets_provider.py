@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import secrets_provider
+
+
+class FakeSecretsManager:
+    """ Stands in for the boto3 secretsmanager client, counting the calls """
+
+    def __init__(self):
+        self.calls = 0
+        self.secrets = {"shipstation": {"api_key": "key-1", "api_secret": "secret-1"}}
+
+    def get_secret_value(self, SecretId):
+        self.calls += 1
+        return {"SecretString": json.dumps(self.secrets[SecretId])}
+
+
+class Clock:
+    """ Stands in for time.monotonic() in secrets_provider """
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    client = FakeSecretsManager()
+    monkeypatch.setattr(secrets_provider, "_client", client)
+    monkeypatch.delenv("SECRET_SHIPSTATION", raising=False)
+    monkeypatch.delenv("LOCAL_SECRETS_FILE", raising=False)
+    secrets_provider.invalidate_secret()
+    yield client
+    secrets_provider.invalidate_secret()
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(secrets_provider.time, "monotonic", clock)
+    return clock
+
+
+def test_secret_is_fetched_once_within_the_ttl(client, clock):
+    assert secrets_provider.get_secret("shipstation") == ("key-1", "secret-1")
+    clock.now += secrets_provider.SECRETS_CACHE_TTL - 1
+    assert secrets_provider.get_secret("shipstation") == ("key-1", "secret-1")
+
+    assert client.calls == 1
+
+
+def test_secret_is_fetched_again_after_the_ttl(client, clock):
+    secrets_provider.get_secret("shipstation")
+    client.secrets["shipstation"]["api_secret"] = "secret-2"
+    clock.now += secrets_provider.SECRETS_CACHE_TTL + 1
+
+    assert secrets_provider.get_secret("shipstation") == ("key-1", "secret-2")
+    assert client.calls == 2
+
+
+@pytest.mark.parametrize("secret_name", ["shipstation", None])
+def test_invalidated_secret_is_fetched_again(client, clock, secret_name):
+    secrets_provider.get_secret("shipstation")
+    client.secrets["shipstation"]["api_secret"] = "rotated"
+
+    secrets_provider.invalidate_secret(secret_name)
+
+    assert secrets_provider.get_secret("shipstation") == ("key-1", "rotated")
+    assert client.calls == 2
+
+
+def test_custom_fields(client, clock):
+    client.secrets["usps"] = {"username": "user", "password": "pass"}
+
+    assert secrets_provider.get_secret("usps", key_field="username", secret_field="password") == ("user", "pass")
+
+
+def test_local_secret_from_the_environment(client, clock, monkeypatch):
+    monkeypatch.setenv("SECRET_SHIPSTATION", json.dumps({"api_key": "local", "api_secret": "local-secret"}))
+
+    assert secrets_provider.get_secret("shipstation") == ("local", "local-secret")
+    assert client.calls == 0
+
+
+def test_local_secret_from_a_file(client, clock, monkeypatch, tmp_path):
+    path = tmp_path / "secrets.json"
+    path.write_text(json.dumps({"fedexAPICredentials": {"api_key": "file", "api_secret": "file-secret"}}))
+    monkeypatch.setenv("LOCAL_SECRETS_FILE", str(path))
+
+    assert secrets_provider.get_secret("fedexAPICredentials") == ("file", "file-secret")
+    assert client.calls == 0
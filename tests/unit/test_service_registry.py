@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import service_registry
+from service_registry import ServiceRegistry, fold_name
+
+
+SERVICE_CODES = {
+    "UPS® Ground": "ups_ground",
+    "FedEx 2Day® A.M.": "fedex_2day_am",
+    "USPS Priority Mail - Package": "usps_priority_mail",
+}
+SERVICE_ALIASES = {
+    "UPS Ground": "ups_ground",
+    "USPS First Class Mail - Package": "usps_first_class_mail",
+}
+
+
+@pytest.fixture()
+def registry():
+    return ServiceRegistry(SERVICE_CODES, SERVICE_ALIASES)
+
+
+def test_fold_name():
+    assert fold_name("FedEx 2Day® A.M.") == "FedEx 2Day AM"
+
+
+@pytest.mark.parametrize("service_name", ["UPS® Ground", "UPS Ground", "UPS Ground®"])
+def test_every_spelling_resolves_to_the_service_code(registry, service_name):
+    assert registry.resolve(service_name) == "ups_ground"
+
+
+def test_unknown_name_resolves_to_its_folded_name(registry):
+    assert registry.resolve("Acme Express®") == "Acme Express"
+
+
+@pytest.mark.parametrize("service_name, service_code", [
+    ("UPS® Ground", "ups_ground"),
+    ("FedEx 2Day® A.M.", "fedex_2day_am"),
+    ("UPS Ground", None),
+    ("FedEx 2Day AM", None),
+    ("USPS First Class Mail - Package", None),
+    ("Acme Express", None),
+])
+def test_service_code_only_for_exact_shipstation_names(registry, service_name, service_code):
+    assert registry.service_code(service_name) == service_code
+
+
+def test_remembered_names_are_bounded(registry, monkeypatch):
+    monkeypatch.setattr(service_registry, "RESOLVED_NAMES_SIZE", 2)
+
+    names = [f"Service {number}" for number in range(5)]
+    for name in names:
+        registry.resolve(name)
+
+    assert len(registry._resolved) == 2
+    assert registry.resolve(names[-1]) == "Service 4"
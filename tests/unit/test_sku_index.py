@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+from sku_index import (
+    SkuIndex, NO_MATCH, WAREHOUSE_ID_PREFIXES, FLAG_SIZE_PREFIXES, PRODUCT_SIZES, SINGLE_STREAM_PREFIXES,
+    lookup_sku,
+)
+
+
+def longest_prefix(sku, prefixes):
+    matches = [prefix for prefix in prefixes if sku.startswith(prefix)]
+    return max(matches, key=len) if matches else None
+
+
+@pytest.mark.parametrize("first, second", [(("AB", 1), ("ABC", 2)), (("ABC", 2), ("AB", 1))])
+def test_longest_prefix_wins_whatever_the_insertion_order(first, second):
+    index = SkuIndex()
+    index.add(first[0], SkuIndex.WAREHOUSE, first[1])
+    index.add(second[0], SkuIndex.WAREHOUSE, second[1])
+
+    assert index.lookup("ABCD").warehouse_id == 2
+    assert index.lookup("ABD").warehouse_id == 1
+    assert index.lookup("AXC").has_warehouse is False
+
+
+def test_rules_match_their_own_longest_prefix():
+    index = SkuIndex()
+    index.add("A", SkuIndex.SINGLE_STREAM, True)
+    index.add("ABC", SkuIndex.WAREHOUSE, 7)
+
+    match = index.lookup("ABCD")
+
+    assert match.is_single_stream and match.warehouse_id == 7
+    assert index.lookup("AB") == NO_MATCH._replace(is_single_stream=True)
+
+
+def test_flag_sku_gets_the_box_of_the_longest_flag_prefix():
+    match = lookup_sku("1216FL3D-USA")
+
+    assert match.box == PRODUCT_SIZES["12x18"]
+    # Listed without a specific warehouse, ships from Indiana
+    assert match.has_warehouse and match.warehouse_id is None
+    assert match.is_assembly
+
+
+def test_warehouse_none_is_told_apart_from_no_match():
+    assert lookup_sku("1216F3D-X").has_warehouse is True
+    assert lookup_sku("ZZZ-1").has_warehouse is False
+    assert lookup_sku("ZZZ-1") == NO_MATCH
+    assert lookup_sku("") == NO_MATCH
+
+
+def test_prefix_cut_short_is_no_match():
+    # CARD is on the way to CARDL but isn't a prefix itself
+    assert lookup_sku("CARD-1").has_warehouse is False
+    assert lookup_sku("CARDL-1").warehouse_id == 590152
+
+
+def test_single_stream_and_warehouse_of_the_same_sku():
+    match = lookup_sku("CERSN-12")
+
+    assert match.is_single_stream
+    assert match.warehouse_id == 791225
+    assert not match.is_assembly
+
+
+@pytest.mark.parametrize("sku", [
+    "INFL-CCSNTA-1", "INFLCSF-2", "INFLSMP-3", "INFLH-4", "INFLJH-5", "INFLJ-6", "1216FL3D-7", "1216F3D-8",
+    "1212F-9", "17523F-10", "CARDL-LS-11", "CARDL-12", "CRDP-CC-13", "CRDPP-14", "28F-15", "MTS-16", "PLNP-17",
+])
+def test_lookup_matches_a_scan_of_the_tables(sku):
+    match = lookup_sku(sku)
+
+    warehouse_prefix = longest_prefix(sku, WAREHOUSE_ID_PREFIXES)
+    flag_prefix = longest_prefix(sku, FLAG_SIZE_PREFIXES)
+    assert match.has_warehouse == (warehouse_prefix is not None)
+    assert match.warehouse_id == (WAREHOUSE_ID_PREFIXES[warehouse_prefix] if warehouse_prefix else None)
+    assert match.box == (PRODUCT_SIZES[FLAG_SIZE_PREFIXES[flag_prefix]] if flag_prefix else None)
+    assert match.is_single_stream == sku.startswith(SINGLE_STREAM_PREFIXES)
+    assert match.is_assembly == sku[0].isdigit()
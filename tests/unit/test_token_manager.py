@@ -0,0 +1,106 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import token_manager
+from token_manager import TokenManager, OAuthSession
+
+
+class Clock:
+    """ Stands in for time.monotonic() in token_manager """
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenEndpoint:
+    """ fetch_token of a TokenManager, hands out token-1, token-2, ... """
+
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f"token-{self.calls}", self.expires_in
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_manager.time, "monotonic", clock)
+    return clock
+
+
+def test_token_is_reused_until_the_refresh_margin(clock):
+    endpoint = TokenEndpoint(expires_in=3600)
+    manager = TokenManager("UPS", endpoint, refresh_margin=120)
+
+    assert manager.get_token() == "token-1"
+    clock.now += 3600 - 121
+    assert manager.get_token() == "token-1"
+    assert endpoint.calls == 1
+
+
+def test_token_is_refreshed_before_it_expires(clock):
+    endpoint = TokenEndpoint(expires_in=3600)
+    manager = TokenManager("UPS", endpoint, refresh_margin=120)
+    manager.get_token()
+
+    clock.now += 3600 - 120
+
+    assert manager.get_token() == "token-2"
+    assert endpoint.calls == 2
+
+
+def test_default_lifetime_without_expires_in(clock):
+    endpoint = TokenEndpoint(expires_in=None)
+    manager = TokenManager("FedEx", endpoint, refresh_margin=0, default_expires_in=60)
+    manager.get_token()
+
+    clock.now += 59
+    assert manager.get_token() == "token-1"
+    clock.now += 1
+    assert manager.get_token() == "token-2"
+
+
+def test_refresh_of_an_already_replaced_token_is_skipped(clock):
+    endpoint = TokenEndpoint()
+    manager = TokenManager("UPS", endpoint)
+    manager.get_token()
+    manager.refresh(stale_token="token-1")
+
+    # A second thread that got a 401 for token-1 finds it already replaced
+    assert manager.refresh(stale_token="token-1") == "token-2"
+    assert endpoint.calls == 2
+
+
+def test_failed_refresh_keeps_the_current_token(clock):
+    manager = TokenManager("UPS", TokenEndpoint())
+    manager.get_token()
+    manager.fetch_token = lambda: (None, None)
+
+    assert manager.refresh(stale_token="token-1") == "token-1"
+
+
+def test_session_retries_once_with_a_new_token_after_a_401(clock, monkeypatch):
+    sent = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        sent.append(headers["Authorization"])
+        return SimpleNamespace(status_code=401 if len(sent) == 1 else 200)
+
+    monkeypatch.setattr(requests.Session, "request", request)
+    session = OAuthSession(TokenManager("FedEx", TokenEndpoint()))
+
+    assert session.post("https://example.com/rates").status_code == 200
+    assert sent == ["Bearer token-1", "Bearer token-2"]
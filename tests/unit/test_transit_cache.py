@@ -0,0 +1,110 @@
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import pytz
+
+# main_lambda uses flat imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'main_lambda')))
+
+import transit_cache as transit_cache_module
+from transit_cache import TransitCache, lane_key, next_day_boundary
+
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+class Clock:
+    """ Stands in for time.time() and datetime.now() in transit_cache """
+
+    def __init__(self, now):
+        self.now = now.timestamp()
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    # 11 pm in New York, one hour before the day boundary
+    clock = Clock(EASTERN.localize(datetime(2024, 5, 1, 23, 0)))
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(clock.now, tz)
+
+    monkeypatch.setattr(transit_cache_module, "time", SimpleNamespace(time=clock.time))
+    monkeypatch.setattr(transit_cache_module, "datetime", FrozenDatetime)
+    return clock
+
+
+def test_next_day_boundary_is_midnight_eastern(clock):
+    assert next_day_boundary() == EASTERN.localize(datetime(2024, 5, 2)).timestamp()
+
+
+def test_entries_expire_at_midnight_eastern_before_their_ttl(clock):
+    cache = TransitCache(ttls={"ups": 21600})
+    cache.put("ups", "lane", [{"deliveryDate": "2024-05-03"}])
+
+    clock.now += 3599
+    assert cache.get("ups", "lane") == [{"deliveryDate": "2024-05-03"}]
+    clock.now += 2
+    assert cache.get("ups", "lane") is None
+
+
+def test_entries_expire_after_their_ttl_before_midnight(clock):
+    cache = TransitCache(ttls={"fedex": 600})
+    cache.put("fedex", "lane", [])
+
+    clock.now += 601
+    assert cache.get("fedex", "lane") is None
+
+
+def test_carrier_without_a_ttl_and_failed_lookups_are_not_cached(clock):
+    cache = TransitCache(ttls={"ups": 21600, "usps": 0})
+    cache.put("usps", "lane", [])
+    cache.put("ups", "lane", None)
+
+    assert cache.get("usps", "lane") is None
+    assert cache.get("ups", "lane") is None
+
+
+def test_callers_get_a_copy(clock):
+    cache = TransitCache(ttls={"ups": 21600})
+    services = [{"deliveryDate": "2024-05-03"}]
+    cache.put("ups", "lane", services)
+    services[0]["deliveryDate"] = "changed"
+
+    cached = cache.get("ups", "lane")
+    cached[0]["deliveryDate"] = "changed again"
+
+    assert cache.get("ups", "lane") == [{"deliveryDate": "2024-05-03"}]
+
+
+def test_oldest_entries_are_dropped_first(clock):
+    cache = TransitCache(ttls={"ups": 21600}, max_size=2)
+    for lane in ("a", "b", "c"):
+        cache.put("ups", lane, [lane])
+
+    assert cache.get("ups", "a") is None
+    assert cache.get("ups", "b") == ["b"] and cache.get("ups", "c") == ["c"]
+
+
+def test_get_or_fetch_calls_the_carrier_once_per_lane(clock):
+    cache = TransitCache(ttls={"ups": 21600})
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"deliveryDate": "2024-05-03"}]
+
+    assert cache.get_or_fetch("ups", "lane", fetch) == cache.get_or_fetch("ups", "lane", fetch)
+    assert len(calls) == 1
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_lane_key_uses_the_zip5():
+    assert lane_key("34243", "90210-1234", "2024-05-01", True) == ("34243", "90210", "2024-05-01", True)